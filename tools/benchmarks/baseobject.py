@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure how many capability objects are built per second, and how much
+memory they use.
+
+Usage: tools/benchmarks/baseobject.py [-n OBJECTS]
+"""
+
+from __future__ import print_function, unicode_literals
+
+import gc
+import os
+import sys
+import time
+import types
+from argparse import ArgumentParser
+from datetime import date
+from decimal import Decimal
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir)))
+
+from weboob.capabilities.base import NotAvailable, NotLoaded  # noqa
+from weboob.capabilities.bank import Account, Transaction  # noqa
+
+
+def build_account(i):
+    account = Account()
+    account.id = '%08d' % i
+    account.label = 'Compte courant'
+    account.balance = Decimal('1234.56')
+    account.coming = Decimal('-12.34')
+    account.currency = 'EUR'
+    account.type = Account.TYPE_CHECKING
+    account.iban = 'FR7630006000011234567890189'
+    account._private = i
+    return account
+
+
+def build_transaction(i):
+    tr = Transaction()
+    tr.id = '%08d' % i
+    tr.date = date(2017, 1, 1)
+    tr.rdate = date(2017, 1, 2)
+    tr.vdate = date(2017, 1, 3)
+    tr.type = Transaction.TYPE_CARD
+    tr.raw = 'CB SUPERMARCHE 01/01'
+    tr.category = 'Courses'
+    tr.label = 'SUPERMARCHE'
+    tr.amount = Decimal('-42.10')
+    tr.card = '1234XXXXXXXX5678'
+    return tr
+
+
+def bench(func, count):
+    start = time.time()
+    objects = [func(i) for i in range(count)]
+    duration = time.time() - start
+    # Read fields back too.
+    start = time.time()
+    for obj in objects:
+        list(obj.iter_fields())
+    return count / duration, count / (time.time() - start)
+
+
+def memory_per_object(objects):
+    """
+    Sum sizes of everything reachable from objects, except classes, modules,
+    functions and values shared by all objects, and divide by their number.
+    """
+    seen = set(id(value) for value in (None, NotLoaded, NotAvailable, True, False))
+    size = 0
+    stack = list(objects)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (type, types.ModuleType, types.FunctionType)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return size / float(len(objects))
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark of capability objects creation')
+    parser.add_argument('-n', '--objects', type=int, default=20000)
+    args = parser.parse_args()
+
+    for func in (build_account, build_transaction):
+        built, iterated = bench(func, args.objects)
+        memory = memory_per_object([func(i) for i in range(1000)])
+        print('%-18s %9.0f built/s  %9.0f iter_fields()/s  %6.0f bytes/object' % (
+              func.__name__, built, iterated, memory))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure the latency of WebNip.do() on backends which wait for --delay
+milliseconds before returning their results.
+
+Besides the time to get the first result and the end of the stream, the
+delivery latency is measured: the time between the moment a backend
+returns a result and the moment the consumer gets it. Results are consumed
+by the main thread, like in applications, or with --thread by another
+thread, as the main thread waits differently on Python 2.
+
+Usage: tools/benchmarks/bcall.py [-n BACKENDS] [-i ITERATIONS] [-r RESULTS] [-d DELAY] [--thread]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from threading import Thread
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir)))
+
+from weboob.core.ouiboube import WebNip  # noqa
+from weboob.tools.backend import Module  # noqa
+
+
+class SlowModule(Module):
+    NAME = 'slow'
+
+    def results(self, count, delay):
+        time.sleep(delay)
+        # Time when each result is produced.
+        return [time.time() for _ in range(count)]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def measure(weboob, args, first, total, delivery):
+    for _ in range(args.iterations):
+        start = time.time()
+        first_result = None
+        for produced in weboob.do('results', args.results, args.delay / 1000.):
+            now = time.time()
+            delivery.append(now - produced)
+            if first_result is None:
+                first_result = now
+        end = time.time()
+        first.append((first_result or end) - start)
+        total.append(end - start)
+
+
+def main():
+    parser = ArgumentParser(description='Latency of WebNip.do()')
+    parser.add_argument('-n', '--backends', type=int, default=50)
+    parser.add_argument('-i', '--iterations', type=int, default=30)
+    parser.add_argument('-r', '--results', type=int, default=1, help='results returned by each backend')
+    parser.add_argument('-d', '--delay', type=float, default=100, help='time taken by each backend, in ms')
+    parser.add_argument('--thread', action='store_true', help='consume results in another thread')
+    args = parser.parse_args()
+
+    weboob = WebNip(modules_path=False)
+    for i in range(args.backends):
+        name = 'slow%d' % i
+        weboob.backend_instances[name] = SlowModule(weboob, name)
+
+    first, total, delivery = [], [], []
+    if args.thread:
+        thread = Thread(target=measure, args=(weboob, args, first, total, delivery))
+        thread.start()
+        thread.join()
+    else:
+        measure(weboob, args, first, total, delivery)
+
+    weboob.deinit()
+
+    print('%d backends, %d iterations, %d results per backend, %gms per call, consumed by %s' % (
+        args.backends, args.iterations, args.results, args.delay, 'a thread' if args.thread else 'the main thread'))
+    for label, values in (('first result', first), ('end of stream', total), ('delivery', delivery)):
+        print('%-14s p50=%.2fms p99=%.2fms max=%.2fms' % (label,
+                                                          percentile(values, 50) * 1000,
+                                                          percentile(values, 99) * 1000,
+                                                          max(values) * 1000))
+
+
+if __name__ == '__main__':
+    main()
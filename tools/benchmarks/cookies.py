@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure how many requests per second Browser.open() sends with a large
+cookie jar.
+
+Responses are built by a local adapter, without any network access, so only
+the request path (building, preparing and cookies handling) is measured.
+The jar contains COOKIES cookies for the requested bank domain, plus
+COOKIES cookies for each of DOMAINS other domains.
+
+Usage: tools/benchmarks/cookies.py [-n REQUESTS] [-c COOKIES] [-d DOMAINS]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir)))
+
+from requests.adapters import BaseAdapter  # noqa
+from requests.cookies import create_cookie  # noqa
+from requests.models import Response  # noqa
+
+from weboob.browser import Browser  # noqa
+
+
+URL = 'https://www.bank.example/accounts/list'
+
+
+class LocalAdapter(BaseAdapter):
+    def send(self, request, **kwargs):
+        response = Response()
+        response.status_code = 200
+        response.url = request.url
+        response.request = request
+        response._content = b''
+        return response
+
+    def close(self):
+        pass
+
+
+def build_browser(cookies, domains):
+    browser = Browser()
+    browser.session.mount('https://', LocalAdapter())
+    jar = browser.session.cookies
+    for i in range(cookies):
+        jar.set_cookie(create_cookie('bank%d' % i, 'x' * 32, domain='.bank.example', path='/'))
+        for d in range(domains):
+            jar.set_cookie(create_cookie('other%d' % i, 'x' * 32, domain='.other%d.example' % d, path='/'))
+    return browser
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark of requests with a large cookie jar')
+    parser.add_argument('-n', '--requests', type=int, default=2000)
+    parser.add_argument('-c', '--cookies', type=int, default=40)
+    parser.add_argument('-d', '--domains', type=int, default=10)
+    args = parser.parse_args()
+
+    browser = build_browser(args.cookies, args.domains)
+    start = time.time()
+    for _ in range(args.requests):
+        browser.open(URL)
+    duration = time.time() - start
+
+    print('%d cookies in jar: %.0f requests/s' % (len(browser.session.cookies), args.requests / duration))
+
+
+if __name__ == '__main__':
+    main()
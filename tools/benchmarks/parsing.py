@@ -0,0 +1,405 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure where parsing time goes in the browser stack, on synthetic bank
+statements of configurable size, as HTML, JSON and CSV pages.
+
+Each suite is split in stages, timed separately:
+
+- build_doc: building the page from the response (encoding detection and
+  parsing of the document);
+- elements: running the ListElement/TableElement/DictElement definition of
+  the page, which builds objects;
+- filters alone (CleanText, CleanDecimal, Regexp, Date...), on the values
+  of the page;
+- BaseObject.__setattr__, setting the fields of objects.
+
+The best time of --repeat runs is kept. When tracemalloc is available
+(Python 3), the peak of memory allocated by each stage is reported too.
+On Python 2, there is no reliable way to measure it, so it is displayed as
+"-" and saved as null.
+
+--json writes the results in a file, and --compare displays the ratio of
+times with results previously saved, to track regressions across releases.
+
+Usage: tools/benchmarks/parsing.py [-n ROWS] [-r REPEAT] [-s SUITE]... [--json FILE] [--compare FILE]
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import platform
+import random
+import re
+import sys
+import timeit
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from decimal import Decimal
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+sys.path.insert(0, ROOT)
+
+import lxml.html  # noqa
+from requests.models import Response  # noqa
+
+from weboob.browser.elements import ItemElement, ListElement, DictElement, method  # noqa
+from weboob.browser.filters.html import Attr  # noqa
+from weboob.browser.filters.json import Dict  # noqa
+from weboob.browser.filters.standard import CleanText, CleanDecimal, Regexp, Date  # noqa
+from weboob.browser.pages import HTMLPage, JsonPage, CsvPage  # noqa
+from weboob.capabilities.bank import Transaction  # noqa
+from weboob.core.ouiboube import WebNip  # noqa
+from weboob.tools.capabilities.bank.transactions import FrenchTransaction  # noqa
+from weboob.tools.date import parse_french_date  # noqa
+
+
+LABELS = [u'CB CARREFOUR MARKET %(dd)02d/%(mm)02d',
+          u'CB SNCF INTERNET %(dd)02d/%(mm)02d',
+          u'VIR SEPA LOYER %(ref)d',
+          u'PRLV SEPA EDF CLIENTS %(ref)d',
+          u'RETRAIT DAB %(dd)02d/%(mm)02d PARIS',
+          u'CHEQUE %(ref)d']
+MONTHS = [u'janvier', u'février', u'mars', u'avril', u'mai', u'juin', u'juillet',
+          u'août', u'septembre', u'octobre', u'novembre', u'décembre']
+
+
+class MyTransaction(FrenchTransaction):
+    PATTERNS = [(re.compile(r'^CB (?P<text>.*?) (?P<dd>\d{2})/(?P<mm>\d{2})$'), FrenchTransaction.TYPE_CARD),
+                (re.compile(r'^VIR SEPA (?P<text>.*)'), FrenchTransaction.TYPE_TRANSFER),
+                (re.compile(r'^PRLV SEPA (?P<text>.*)'), FrenchTransaction.TYPE_ORDER),
+                (re.compile(r'^RETRAIT DAB (?P<dd>\d{2})/(?P<mm>\d{2}) (?P<text>.*)'), FrenchTransaction.TYPE_WITHDRAWAL),
+                (re.compile(r'^CHEQUE (?P<text>.*)'), FrenchTransaction.TYPE_CHECK)]
+
+
+def french_amount(amount):
+    text = u'%.2f' % abs(amount)
+    units, cents = text.split(u'.')
+    groups = []
+    while units:
+        groups.insert(0, units[-3:])
+        units = units[:-3]
+    return u'%s,%s' % (u' '.join(groups), cents)
+
+
+def generate_rows(count, seed=0):
+    """
+    Generate transactions of a statement, from the most recent.
+    """
+    rand = random.Random(seed)
+    day = date(2017, 12, 31)
+    rows = []
+    for n in range(count):
+        day -= timedelta(days=rand.choice((0, 0, 1, 2)))
+        label = rand.choice(LABELS) % {'dd': day.day, 'mm': day.month, 'ref': rand.randrange(10 ** 6, 10 ** 7)}
+        amount = rand.randrange(-500000, 300000) / 100.
+        rows.append({'id': 1000000 + n, 'date': day, 'label': label, 'amount': amount})
+    return rows
+
+
+def build_html_table(rows):
+    lines = [u'<html><head><meta charset="utf-8"><title>Relevé</title></head><body>',
+             u'<table id="history"><thead><tr><th>Date</th><th>Valeur</th><th>Libellé</th>'
+             u'<th>Débit</th><th>Crédit</th></tr></thead><tbody>']
+    for row in rows:
+        day = row['date'].strftime('%d/%m/%Y')
+        amount = french_amount(row['amount'])
+        lines.append(u'<tr><td>%s</td><td>%s</td><td>  %s  </td><td>%s</td><td>%s</td></tr>' % (
+            day, day, row['label'], amount if row['amount'] < 0 else u'', amount if row['amount'] >= 0 else u''))
+    lines.append(u'</tbody></table></body></html>')
+    return u'\n'.join(lines).encode('utf-8')
+
+
+def build_html_list(rows):
+    lines = [u'<html><head><meta charset="utf-8"><title>Opérations</title></head><body><div id="operations">']
+    for row in rows:
+        day = row['date']
+        lines.append(u'<div class="operation" data-ref="OP-%d"><span class="date">%d %s %d</span>'
+                     u'<span class="label">%s</span><span class="amount">%s%s €</span></div>' % (
+                         row['id'], day.day, MONTHS[day.month - 1], day.year, row['label'],
+                         u'-' if row['amount'] < 0 else u'', french_amount(row['amount'])))
+    lines.append(u'</div></body></html>')
+    return u'\n'.join(lines).encode('utf-8')
+
+
+def build_json(rows):
+    return json.dumps({'operations': [{'id': row['id'],
+                                       'date': row['date'].isoformat(),
+                                       'label': row['label'],
+                                       'amount': '%.2f' % row['amount']}
+                                      for row in rows]}).encode('utf-8')
+
+
+def build_csv(rows):
+    lines = [u'Date;Libellé;Montant']
+    for row in rows:
+        lines.append(u'%s;"%s";%s' % (row['date'].strftime('%d/%m/%Y'), row['label'], french_amount(row['amount'])
+                                       if row['amount'] >= 0 else u'-' + french_amount(row['amount'])))
+    return u'\r\n'.join(lines).encode('utf-8')
+
+
+class HistoryPage(HTMLPage):
+    @method
+    class iter_history(MyTransaction.TransactionsElement):
+        head_xpath = '//table[@id="history"]/thead/tr/th'
+        item_xpath = '//table[@id="history"]/tbody/tr'
+
+
+class OperationsPage(HTMLPage):
+    @method
+    class iter_history(ListElement):
+        item_xpath = '//div[@class="operation"]'
+
+        class item(ItemElement):
+            klass = Transaction
+
+            obj_id = Regexp(Attr('.', 'data-ref'), r'OP-(\d+)')
+            obj_date = Date(CleanText('./span[@class="date"]'), parse_func=parse_french_date)
+            obj_label = CleanText('./span[@class="label"]')
+            obj_amount = CleanDecimal('./span[@class="amount"]', replace_dots=True)
+
+
+class JsonHistoryPage(JsonPage):
+    @method
+    class iter_history(DictElement):
+        item_xpath = 'operations'
+
+        class item(ItemElement):
+            klass = Transaction
+
+            obj_id = Dict('id')
+            obj_date = Date(Dict('date'))
+            obj_label = CleanText(Dict('label'))
+            obj_amount = CleanDecimal(Dict('amount'))
+
+
+class CsvHistoryPage(CsvPage):
+    HEADER = 1
+    FMTPARAMS = {'delimiter': ';'}
+
+    @method
+    class iter_history(DictElement):
+        class item(ItemElement):
+            klass = Transaction
+
+            obj_date = Date(Dict(u'Date'), dayfirst=True)
+            obj_label = CleanText(Dict(u'Libellé'))
+            obj_amount = CleanDecimal(Dict(u'Montant'), replace_dots=True)
+
+
+class FakeBrowser(object):
+    logger = None
+
+
+def make_response(content, url, content_type):
+    response = Response()
+    response._content = content
+    response.url = url
+    response.status_code = 200
+    response.headers['Content-Type'] = content_type
+    return response
+
+
+def check_objects(objects, count):
+    objects = list(objects)
+    assert len(objects) == count, (len(objects), count)
+    return objects
+
+
+class Suite(object):
+    """
+    Stages measured on a page.
+    """
+    name = None
+    page_class = None
+    content_type = None
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.content = self.build(rows)
+
+    def build(self, rows):
+        raise NotImplementedError()
+
+    def build_page(self):
+        response = make_response(self.content, 'https://bank.example.com/%s' % self.name, self.content_type)
+        page = self.page_class(FakeBrowser(), response)
+        page.doc
+        return page
+
+    def stages(self):
+        """
+        Yield (name, function, number of items) of stages.
+        """
+        page = self.build_page()
+        yield 'build_doc', self.build_page, 1
+        yield 'elements', lambda: check_objects(page.iter_history(), len(self.rows)), len(self.rows)
+
+
+class HTMLTableSuite(Suite):
+    name = 'html-table'
+    page_class = HistoryPage
+    content_type = 'text/html'
+
+    def build(self, rows):
+        return build_html_table(rows)
+
+    def stages(self):
+        for stage in super(HTMLTableSuite, self).stages():
+            yield stage
+
+        page = self.build_page()
+        cells = page.doc.xpath('//table[@id="history"]/tbody/tr/td')
+        labels = [CleanText().filter(cell) for cell in cells[2::5]]
+        dates = [CleanText().filter(cell) for cell in cells[0::5]]
+        amounts = [CleanText().filter(cell) for cell in cells[3::5] + cells[4::5] if len(cell.text or '')]
+
+        raw = MyTransaction.Raw('.')
+        date_filter = MyTransaction.Date('.')
+        yield 'CleanText', lambda: [CleanText().filter(cell) for cell in cells], len(cells)
+        yield 'FrenchTransaction.Date', lambda: [date_filter.filter(text) for text in dates], len(dates)
+        yield 'FrenchTransaction.Raw', lambda: [raw.filter(text) for text in labels], len(labels)
+        yield 'CleanDecimal', lambda: [CleanDecimal(replace_dots=True).filter(text) for text in amounts], len(amounts)
+
+
+class HTMLListSuite(Suite):
+    name = 'html-list'
+    page_class = OperationsPage
+    content_type = 'text/html'
+
+    def build(self, rows):
+        return build_html_list(rows)
+
+    def stages(self):
+        for stage in super(HTMLListSuite, self).stages():
+            yield stage
+
+        page = self.build_page()
+        items = page.doc.xpath('//div[@class="operation"]')
+        refs = [item.attrib['data-ref'] for item in items]
+        dates = [CleanText('./span[@class="date"]')(item) for item in items]
+
+        regexp = Regexp(pattern=r'OP-(\d+)')
+        date_filter = Date(parse_func=parse_french_date)
+        yield 'Regexp', lambda: [regexp.filter(ref) for ref in refs], len(refs)
+        yield 'Date(parse_french_date)', lambda: [date_filter.filter(text) for text in dates], len(dates)
+
+        def set_fields():
+            for row in self.rows:
+                obj = Transaction()
+                obj.id = row['id']
+                obj.date = row['date']
+                obj.rdate = row['date']
+                obj.label = row['label']
+                obj.raw = row['label']
+                obj.amount = Decimal(row['amount'])
+        yield 'BaseObject.__setattr__', set_fields, len(self.rows)
+
+
+class JsonSuite(Suite):
+    name = 'json'
+    page_class = JsonHistoryPage
+    content_type = 'application/json'
+
+    def build(self, rows):
+        return build_json(rows)
+
+
+class CsvSuite(Suite):
+    name = 'csv'
+    page_class = CsvHistoryPage
+    content_type = 'text/csv'
+
+    def build(self, rows):
+        return build_csv(rows)
+
+    def stages(self):
+        for stage in super(CsvSuite, self).stages():
+            yield stage
+
+        dates = [row['date'].strftime('%d/%m/%Y') for row in self.rows]
+        date_filter = Date(dayfirst=True)
+        yield 'Date(dayfirst)', lambda: [date_filter.filter(text) for text in dates], len(dates)
+
+
+SUITES = [HTMLTableSuite, HTMLListSuite, JsonSuite, CsvSuite]
+
+
+def measure(func, repeat):
+    """
+    Get the best time of *repeat* runs, and the peak of allocated memory.
+    """
+    times = timeit.repeat(func, number=1, repeat=repeat)
+
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return min(times), peak
+
+
+def compare(results, filename):
+    with open(filename) as f:
+        previous = dict(((r['suite'], r['stage']), r) for r in json.load(f)['results'])
+
+    print()
+    print('Compared to %s:' % filename)
+    for result in results:
+        old = previous.get((result['suite'], result['stage']))
+        if old is None:
+            continue
+        ratio = result['seconds'] / old['seconds']
+        print('%-12s %-26s %6.2fx%s' % (result['suite'], result['stage'], ratio,
+                                         '  SLOWER' if ratio > 1.1 else ''))
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark of parsing of pages')
+    parser.add_argument('-n', '--rows', type=int, default=2000, help='number of transactions per page')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('-s', '--suite', action='append', choices=[suite.name for suite in SUITES],
+                        help='suites to run (default: all)')
+    parser.add_argument('--json', help='save results in this file')
+    parser.add_argument('--compare', help='compare with results saved in this file')
+    args = parser.parse_args()
+
+    rows = generate_rows(args.rows)
+    results = []
+    print('%-12s %-26s %9s %9s %12s %10s' % ('suite', 'stage', 'items', 'seconds', 'items/s', 'peak KB'))
+    for suite_class in SUITES:
+        if args.suite and suite_class.name not in args.suite:
+            continue
+        suite = suite_class(rows)
+        for stage, func, items in suite.stages():
+            seconds, peak = measure(func, args.repeat)
+            results.append({'suite': suite.name, 'stage': stage, 'items': items,
+                            'bytes': len(suite.content) if stage == 'build_doc' else None,
+                            'seconds': seconds, 'items_per_second': items / seconds,
+                            'peak_bytes': peak})
+            print('%-12s %-26s %9d %9.4f %12.1f %10s' % (suite.name, stage, items, seconds, items / seconds,
+                                                         '%.1f' % (peak / 1024.) if peak is not None else '-'))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'weboob': WebNip.VERSION,
+                       'python': platform.python_version(),
+                       'rows': args.rows,
+                       'repeat': args.repeat,
+                       'results': results}, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
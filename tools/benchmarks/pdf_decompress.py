@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure how fast weboob.tools.pdf.decompress_pdf() processes a batch of
+compressed statements, in-process and with mutool if it is installed.
+
+Statements are generated like in pdf_tables.py, with FlateDecode content
+streams; with --objstm, other objects are stored in an object stream and
+the cross-reference table is a stream too, like in PDF 1.5 documents.
+
+Usage: tools/benchmarks/pdf_decompress.py [-n STATEMENTS] [-p PAGES] [--objstm]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import zlib
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from weboob.tools.misc import find_exe  # noqa
+from weboob.tools.pdf import inflate_pdf, _mutool_clean  # noqa
+from pdf_tables import PAGE_WIDTH, PAGE_HEIGHT, pdf_page_content  # noqa
+
+
+def stream(data, extra=b''):
+    data = zlib.compress(data)
+    return b'<< /Length %d /Filter /FlateDecode%s >>\nstream\n%s\nendstream' % (len(data), extra, data)
+
+
+def build_statement(pages, rows, columns, objstm=False):
+    """
+    Build a PDF document with one compressed content stream per page.
+    """
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>',
+               None,
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for n in range(pages):
+        content = pdf_page_content(rows, columns) + (b'\nBT /F1 6 Tf 20 20 Td (page %d) Tj ET' % n)
+        objects.append(stream(content))
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R '
+                       b'/Resources << /Font << /F1 3 0 R >> >> >>' % (PAGE_WIDTH, PAGE_HEIGHT, len(objects)))
+        kids.append(b'%d 0 R' % len(objects))
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(kids), pages)
+
+    if objstm:
+        # Move objects which aren't streams in an object stream.
+        packed = [n for n, obj in enumerate(objects) if b'stream' not in obj]
+        header = []
+        body = []
+        size = 0
+        for n in packed:
+            header.append(b'%d %d' % (n + 1, size))
+            body.append(objects[n])
+            size += len(objects[n]) + 1
+            objects[n] = None
+        header = b' '.join(header) + b'\n'
+        objects.append(stream(header + b'\n'.join(body), b' /Type /ObjStm /N %d /First %d' % (len(packed), len(header))))
+
+    data = [b'%PDF-1.5\n']
+    offsets = {}
+    size = len(data[0])
+    for n, obj in enumerate(objects):
+        if obj is None:
+            continue
+        chunk = b'%d 0 obj\n%s\nendobj\n' % (n + 1, obj)
+        offsets[n + 1] = size
+        data.append(chunk)
+        size += len(chunk)
+
+    if objstm:
+        # Offsets of objects in the object stream don't matter to inflate_pdf().
+        xref = b''.join(b'\x01%s\x00' % offsets.get(n, 0).to_bytes(4, 'big') if sys.version_info >= (3,)
+                        else b'\x01%s\x00' % ('%08x' % offsets.get(n, 0)).decode('hex')
+                        for n in range(len(objects) + 2))
+        data.append(b'%d 0 obj\n%s\nendobj\n' % (len(objects) + 1, stream(xref, b' /Type /XRef /Size %d /W [1 4 1] /Root 1 0 R' % (len(objects) + 2))))
+        data.append(b'startxref\n%d\n%%%%EOF\n' % size)
+    else:
+        data.append(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+        data.extend(b'%010d 00000 n \n' % offsets[n + 1] for n in range(len(objects)))
+        data.append(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, size))
+    return b''.join(data)
+
+
+def run(name, func, statements):
+    total = sum(len(data) for data in statements)
+    start = time.time()
+    output = sum(len(func(data)) for data in statements)
+    duration = time.time() - start
+    print('%s: %d statements, %.1f MB in, %.1f MB out: %.2fs (%.1f statements/s, %.1f MB/s)' % (
+        name, len(statements), total / 1e6, output / 1e6, duration, len(statements) / duration, total / 1e6 / duration))
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark of PDF decompression')
+    parser.add_argument('-n', '--statements', type=int, default=200)
+    parser.add_argument('-p', '--pages', type=int, default=5)
+    parser.add_argument('-r', '--rows', type=int, default=40)
+    parser.add_argument('-c', '--columns', type=int, default=6)
+    parser.add_argument('--objstm', action='store_true', help='use object and cross-reference streams')
+    args = parser.parse_args()
+
+    statements = [build_statement(args.pages, args.rows, args.columns, args.objstm)] * args.statements
+    run('in-process', lambda data: inflate_pdf(data)[0], statements)
+    if find_exe('mutool'):
+        run('mutool', _mutool_clean, statements)
+    else:
+        print('mutool: not installed')
+
+
+if __name__ == '__main__':
+    main()
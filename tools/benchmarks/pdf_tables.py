@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure how fast weboob.tools.pdf rebuilds tables of large synthetic
+documents, like multi-hundred-page bank statements.
+
+By default, only the table reconstruction is measured (uniq_lines(),
+build_rows() and arrange_texts_in_rows()), on lines and texts generated
+for each page. With --pdf, a PDF document is generated and parsed with
+get_pdf_rows(), which requires PDFMiner; -j sets the number of processes.
+
+Usage: tools/benchmarks/pdf_tables.py [-p PAGES] [-r ROWS] [-c COLUMNS] [--pdf [-j WORKERS]]
+"""
+
+from __future__ import print_function
+
+import os
+import random
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir)))
+
+from weboob.tools.pdf import Rect, TextRect, uniq_lines, build_rows, arrange_texts_in_rows, get_pdf_rows  # noqa
+
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN = 20
+
+
+def iter_cells(rows, columns):
+    """
+    Yield (x0, y0, x1, y1) of table cells, in page coordinates (top to bottom).
+    """
+    width = (PAGE_WIDTH - 2 * MARGIN) // columns
+    height = (PAGE_HEIGHT - 2 * MARGIN) // rows
+    for j in range(rows):
+        for i in range(columns):
+            x0 = MARGIN + i * width
+            y0 = MARGIN + j * height
+            yield x0, y0, x0 + width, y0 + height
+
+
+def build_page(rows, columns, rand):
+    """
+    Build lines and texts of a page, like lt_to_coords() and
+    lttext_to_multilines() would: borders of each cell are drawn, with
+    coordinates off by one here and there.
+    """
+    lines = []
+    texts = []
+    for x0, y0, x1, y1 in iter_cells(rows, columns):
+        fuzz = lambda: rand.choice((0, 0, 0, 1))
+        lines.append(Rect(float(x0), float(y0), float(x1 + fuzz()), float(y0)))
+        lines.append(Rect(float(x0), float(y1), float(x1 + fuzz()), float(y1)))
+        lines.append(Rect(float(x0), float(y0), float(x0), float(y1)))
+        lines.append(Rect(float(x1), float(y0), float(x1), float(y1)))
+        texts.append(TextRect(x0 + 2.0, y0 + 2.0, x1 - 2.0, y1 - 2.0, u'%d-%d' % (x0, y0)))
+    return lines, texts
+
+
+def pdf_page_content(rows, columns):
+    ops = []
+    for n, (x0, y0, x1, y1) in enumerate(iter_cells(rows, columns)):
+        # PDF coordinates are bottom to top
+        for a, b, c, d in ((x0, y0, x1, y0), (x0, y1, x1, y1), (x0, y0, x0, y1), (x1, y0, x1, y1)):
+            ops.append('%d %d m %d %d l S' % (a, PAGE_HEIGHT - b, c, PAGE_HEIGHT - d))
+        ops.append('BT /F1 6 Tf %d %d Td (%d) Tj ET' % (x0 + 2, PAGE_HEIGHT - y1 + 2, n))
+    return '\n'.join(ops).encode('ascii')
+
+
+def build_pdf(pages, rows, columns):
+    content = pdf_page_content(rows, columns)
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>',
+               None,
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+               b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content)]
+    kids = []
+    for _ in range(pages):
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents 4 0 R '
+                       b'/Resources << /Font << /F1 3 0 R >> >> >>' % (PAGE_WIDTH, PAGE_HEIGHT))
+        kids.append(b'%d 0 R' % len(objects))
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(kids), pages)
+
+    data = [b'%PDF-1.4\n']
+    offsets = []
+    size = len(data[0])
+    for n, obj in enumerate(objects):
+        chunk = b'%d 0 obj\n%s\nendobj\n' % (n + 1, obj)
+        offsets.append(size)
+        data.append(chunk)
+        size += len(chunk)
+    data.append(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    data.extend(b'%010d 00000 n \n' % offset for offset in offsets)
+    data.append(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, size))
+    return b''.join(data)
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark of tables reconstruction in PDF documents')
+    parser.add_argument('-p', '--pages', type=int, default=300)
+    parser.add_argument('-r', '--rows', type=int, default=40)
+    parser.add_argument('-c', '--columns', type=int, default=6)
+    parser.add_argument('--pdf', action='store_true', help='parse a generated PDF document')
+    parser.add_argument('-j', '--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.pdf:
+        data = build_pdf(args.pages, args.rows, args.columns)
+        start = time.time()
+        npages = sum(1 for _ in get_pdf_rows(data, max_workers=args.workers))
+        duration = time.time() - start
+        print('%d pages parsed with %d workers: %.2fs (%.1f pages/s)' % (npages, args.workers, duration, npages / duration))
+        return
+
+    rand = random.Random(0)
+    pages = [build_page(args.rows, args.columns, rand) for _ in range(args.pages)]
+    start = time.time()
+    for lines, texts in pages:
+        rows = build_rows(uniq_lines(lines))
+        table = arrange_texts_in_rows(rows, texts)
+        assert len(table) == args.rows, len(table)
+    duration = time.time() - start
+    print('%d pages of %dx%d cells: %.2fs (%.1f pages/s)' % (args.pages, args.rows, args.columns, duration, args.pages / duration))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Run calls of modules again on responses saved by the -a option of
+applications, without network access, and measure how fast pages are
+handled (URL dispatch, parsing, elements and filters) and objects built.
+
+For example, record a session with:
+
+    $ boobank -a history 1234@cragr
+    Debug data will be saved in this directory: /tmp/weboob_session_XXX
+
+and run it again with:
+
+    $ tools/benchmarks/replay.py -p login=x -p password=x cragr /tmp/weboob_session_XXX/cragr \\
+          iter_history 'get_account(1234)'
+
+Arguments like "get_account(1234)" are replaced by the result of the call
+of this method of the backend. Calls returning iterators are consumed, and
+each item counts as an object.
+
+Several modules can be run from a file (-f), with a line per call and the
+same arguments as the command line (# starts comments), for example in CI.
+
+--filters displays the time spent in each filter of each element, and
+writes stacks of filters to a file, for flame graphs.
+
+Usage: tools/benchmarks/replay.py [-n RUNS] [--profile] [--filters STACKS] [-p KEY=VALUE]... MODULE DIRNAME METHOD [ARG...]
+       tools/benchmarks/replay.py [-n RUNS] [--profile] [--filters STACKS] -f FILE
+"""
+
+from __future__ import print_function
+
+import cProfile
+import os
+import pstats
+import re
+import shlex
+import sys
+import time
+from argparse import ArgumentParser
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+sys.path.insert(0, ROOT)
+
+from weboob.browser.profiler import FilterProfiler  # noqa
+from weboob.browser.replay import ReplayTransport  # noqa
+from weboob.core.ouiboube import WebNip  # noqa
+
+
+CALL_RE = re.compile(r'^(\w+)\((.*)\)$')
+
+
+def build_parser():
+    parser = ArgumentParser(description='Benchmark of modules on recorded responses')
+    parser.add_argument('-p', '--param', action='append', default=[], metavar='KEY=VALUE',
+                        help='backend parameter')
+    parser.add_argument('module')
+    parser.add_argument('dirname', help='directory of responses saved by the backend')
+    parser.add_argument('method')
+    parser.add_argument('args', nargs='*')
+    return parser
+
+
+def resolve(backend, arg):
+    m = CALL_RE.match(arg)
+    if m:
+        return getattr(backend, m.group(1))(*[a for a in m.group(2).split(',') if a])
+    return arg
+
+
+def run_call(weboob, call):
+    """
+    Build a backend and run a call.
+
+    :returns: number of objects
+    """
+    params = dict(param.split('=', 1) for param in call.param)
+    backend = weboob.build_backend(call.module, params=params, nofail=True)
+    try:
+        args = [resolve(backend, arg) for arg in call.args]
+        result = getattr(backend, call.method)(*args)
+        if result is None:
+            return 0
+        if hasattr(result, '__iter__') and not isinstance(result, (dict, str)):
+            return sum(1 for _ in result)
+        return 1
+    finally:
+        backend.deinit()
+
+
+def bench(call, runs, profiler=None):
+    transport = ReplayTransport(call.dirname)
+    weboob = WebNip(modules_path=os.path.join(ROOT, 'modules'), transport=transport)
+    try:
+        # Import the module before measuring.
+        weboob.modules_loader.get_or_load_module(call.module)
+
+        pages = objects = misses = 0
+        duration = 0
+        for _ in range(runs):
+            transport.rewind()
+            start = time.time()
+            if profiler is not None:
+                profiler.enable()
+            try:
+                objects += run_call(weboob, call)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+            duration += time.time() - start
+            stats = transport.stats()
+            pages += stats['hits']
+            misses += stats['misses']
+    finally:
+        weboob.deinit()
+
+    print('%-15s %6d pages %6d objects %3d misses %8.3fs %8.1f pages/s %8.1f objects/s' % (
+        call.module, pages, objects, misses, duration, pages / duration, objects / duration))
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark of modules on recorded responses', add_help=False)
+    parser.add_argument('-n', '--runs', type=int, default=10)
+    parser.add_argument('--profile', action='store_true', help='display the profile of calls')
+    parser.add_argument('-f', '--file', help='file of calls to run')
+    parser.add_argument('--filters', metavar='STACKS', help='profile filters, and write their stacks in this file')
+    args, rest = parser.parse_known_args()
+
+    if args.file:
+        with open(args.file) as f:
+            lines = [line.split('#', 1)[0].strip() for line in f]
+        calls = [build_parser().parse_args(shlex.split(line)) for line in lines if line]
+    elif rest and rest[0] not in ('-h', '--help'):
+        calls = [build_parser().parse_args(rest)]
+    else:
+        print(__doc__.strip())
+        return
+
+    profiler = cProfile.Profile() if args.profile else None
+    filter_profiler = FilterProfiler() if args.filters else None
+    if filter_profiler is not None:
+        filter_profiler.start()
+    try:
+        for call in calls:
+            bench(call, args.runs, profiler)
+    finally:
+        if filter_profiler is not None:
+            filter_profiler.stop()
+
+    if profiler is not None:
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(30)
+    if filter_profiler is not None:
+        print()
+        print(filter_profiler.report(limit=30))
+        filter_profiler.dump_stacks(args.filters)
+
+
+if __name__ == '__main__':
+    main()
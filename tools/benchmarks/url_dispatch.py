@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measure how fast PagesBrowser finds the URL object matching a response url,
+on URL tables of real modules.
+
+For each URL declared by the browsers of the given modules, a sample url is
+built from its regexps, and dispatched with the linear scan of uncompiled
+regexps (as PagesBrowser used to do) and with PagesBrowser.iter_matching_urls().
+
+Usage: tools/benchmarks/url_dispatch.py [-n ROUNDS] [MODULE ...]
+"""
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import time
+from argparse import ArgumentParser
+from copy import deepcopy
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
+sys.path.insert(0, ROOT)
+
+from weboob.browser.browsers import PagesBrowser  # noqa
+from weboob.core.modules import ModulesLoader  # noqa
+from weboob.tools.regex_helper import normalize  # noqa
+
+
+DEFAULT_MODULES = ['cragr', 'creditmutuel', 'bnporc']
+DEFAULT_BASEURL = 'https://www.example.com/'
+
+
+def iter_browser_classes(module_name):
+    for name, mod in list(sys.modules.items()):
+        if mod is None or not (name == module_name or name.startswith(module_name + '.')):
+            continue
+        for obj in vars(mod).values():
+            if isinstance(obj, type) and issubclass(obj, PagesBrowser) and obj.__module__ == name and obj._urls:
+                yield obj
+
+
+def make_browser(klass):
+    # Do not call the constructor, which may require credentials.
+    browser = klass.__new__(klass)
+    browser._urls = deepcopy(klass._urls)
+    if not browser.BASEURL:
+        browser.BASEURL = DEFAULT_BASEURL
+    for url in browser._urls.values():
+        url.browser = browser
+    return browser
+
+
+def sample_urls(browser):
+    for url in browser._urls.values():
+        if url.klass is None:
+            continue
+        for regex in url.get_regexps(browser.BASEURL):
+            try:
+                patterns = normalize(regex.pattern)
+            except ValueError:
+                # Non-reversible regexp.
+                continue
+            for pattern, params in patterns:
+                try:
+                    sample = pattern % dict((param, '1') for param in params)
+                except (TypeError, ValueError, KeyError):
+                    continue
+                if url.match(sample):
+                    yield sample
+                    break
+
+
+def linear_dispatch(browser, sample):
+    for url in browser._urls.values():
+        if url.klass is None:
+            continue
+        for regex in url.urls:
+            if not re.match(r'^[\w\?]+://.*', regex):
+                regex = re.escape(browser.BASEURL).rstrip('/') + '/' + regex.lstrip('/')
+            if re.match(regex, sample):
+                return url
+
+
+def indexed_dispatch(browser, sample):
+    for url in browser.iter_matching_urls(sample):
+        return url
+
+
+def bench(func, cases, rounds):
+    start = time.time()
+    for _ in range(rounds):
+        for browser, sample in cases:
+            func(browser, sample)
+    return (time.time() - start) / (rounds * len(cases))
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark of URL dispatch in PagesBrowser')
+    parser.add_argument('-n', '--rounds', type=int, default=20)
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    args = parser.parse_args()
+
+    loader = ModulesLoader(os.path.join(ROOT, 'modules'), '1.3')
+    for module_name in args.modules:
+        loader.load_module(module_name)
+        for klass in iter_browser_classes(module_name):
+            browser = make_browser(klass)
+            cases = [(browser, sample) for sample in sample_urls(browser)]
+            if not cases:
+                continue
+
+            for b, sample in cases:
+                assert linear_dispatch(b, sample) is indexed_dispatch(b, sample), sample
+
+            linear = bench(linear_dispatch, cases, args.rounds)
+            indexed = bench(indexed_dispatch, cases, args.rounds)
+            print('%-50s %3d URLs  linear: %7.1fus  indexed: %7.1fus  (x%.1f)' % (
+                  '%s.%s' % (klass.__module__, klass.__name__), len(browser._urls),
+                  linear * 1e6, indexed * 1e6, linear / indexed))
+
+
+if __name__ == '__main__':
+    main()
@@ -19,7 +19,7 @@
 
 from __future__ import absolute_import, print_function
 
-from collections import OrderedDict
+from collections import OrderedDict, deque
 from functools import wraps
 import re
 import pickle
@@ -57,7 +57,7 @@ from .exceptions import HTTPNotFound, ClientError, ServerError
 from .sessions import FuturesSession
 from .profiles import Firefox
 from .pages import NextPage
-from .url import URL
+from .url import URL, uncapture
 
 
 class Browser(object):
@@ -96,6 +96,16 @@ class Browser(object):
     Maximum of threads for asynchronous requests.
     """
 
+    TRANSPORT = None
+    """
+    :class:`weboob.browser.transport.SharedTransport` providing the executor
+    and connection pools, shared with other browsers. If None, the browser has
+    its own ones.
+
+    :class:`weboob.browser.replay.ReplayTransport` serves responses saved
+    with ``responses_dirname`` instead.
+    """
+
     ALLOW_REFERRER = True
     """
     Controls the behavior of get_referrer.
@@ -110,11 +120,14 @@ class Browser(object):
             return localfile
         return os.path.join(os.path.dirname(inspect.getfile(cls)), localfile)
 
-    def __init__(self, logger=None, proxy=None, responses_dirname=None):
+    def __init__(self, logger=None, proxy=None, responses_dirname=None, transport=None):
         self.logger = getLogger('browser', logger)
         self.responses_dirname = responses_dirname
         self.responses_count = 1
 
+        if transport is not None:
+            self.TRANSPORT = transport
+
         self.PROXIES = proxy
         self._setup_session(self.PROFILE)
         self.url = None
@@ -181,6 +194,8 @@ class Browser(object):
             self.logger.info(msg)
 
     def _create_session(self):
+        if self.TRANSPORT is not None:
+            return FuturesSession(executor=self.TRANSPORT.executor, max_retries=self.MAX_RETRIES)
         return FuturesSession(max_workers=self.MAX_WORKERS, max_retries=self.MAX_RETRIES)
 
     def _setup_session(self, profile):
@@ -199,15 +214,18 @@ class Browser(object):
                 # urllib3 is too old, warnings won't be disable
                 pass
 
-        # defines a max_retries. It's mandatory in case a server is not
-        # handling keep alive correctly, like the proxy burp
-        adapter_kwargs = dict(max_retries=self.MAX_RETRIES)
-        # set connection pool size equal to MAX_WORKERS if needed
-        if self.MAX_WORKERS > requests.adapters.DEFAULT_POOLSIZE:
-            adapter_kwargs.update(pool_connections=self.MAX_WORKERS,
-                                  pool_maxsize=self.MAX_WORKERS)
-        session.mount('https://', requests.adapters.HTTPAdapter(**adapter_kwargs))
-        session.mount('http://', requests.adapters.HTTPAdapter(**adapter_kwargs))
+        if self.TRANSPORT is not None:
+            self.TRANSPORT.mount(session)
+        else:
+            # defines a max_retries. It's mandatory in case a server is not
+            # handling keep alive correctly, like the proxy burp
+            adapter_kwargs = dict(max_retries=self.MAX_RETRIES)
+            # set connection pool size equal to MAX_WORKERS if needed
+            if self.MAX_WORKERS > requests.adapters.DEFAULT_POOLSIZE:
+                adapter_kwargs.update(pool_connections=self.MAX_WORKERS,
+                                      pool_maxsize=self.MAX_WORKERS)
+            session.mount('https://', requests.adapters.HTTPAdapter(**adapter_kwargs))
+            session.mount('http://', requests.adapters.HTTPAdapter(**adapter_kwargs))
 
         if self.TIMEOUT:
             session.timeout = self.TIMEOUT
@@ -304,7 +322,7 @@ class Browser(object):
         req = self.build_request(url, referrer, data_encoding=data_encoding, **kwargs)
         preq = self.prepare_request(req)
 
-        if hasattr(preq, '_cookies'):
+        if hasattr(preq, '_cookies') and not isinstance(preq._cookies, WeboobCookieJar):
             # The _cookies attribute is not present in requests < 2.2. As in
             # previous version it doesn't calls extract_cookies_to_jar(), it is
             # not a problem as we keep our own cookiejar instance.
@@ -660,7 +678,7 @@ class PagesBrowser(DomainBrowser):
         def internal_callback(response):
             # Try to handle the response page with an URL instance.
             response.page = None
-            for url in self._urls.itervalues():
+            for url in self.iter_matching_urls(response.url):
                 page = url.handle(response)
                 if page is not None:
                     self.logger.debug('Handle %s with %s' % (response.url, page.__class__.__name__))
@@ -684,6 +702,81 @@ class PagesBrowser(DomainBrowser):
 
         return super(PagesBrowser, self).open(callback=internal_callback, *args, **kwargs)
 
+    _url_index = None
+
+    # Python 2 does not support more than 100 groups in a regexp.
+    URL_INDEX_CHUNK = 90
+
+    def _get_url_index(self):
+        urls = [url for url in self._urls.values() if url.klass is not None]
+        index = self._url_index
+        if index is not None and index[0] == self.BASEURL and index[1] == [url.urls for url in urls]:
+            return index[2:]
+
+        chunks = []
+        alone = []
+        branches = []
+        for position, url in enumerate(urls):
+            if not url.urls:
+                continue
+            if self.BASEURL is None and any(not re.match(r'^[\w\?]+://.*', regex) for regex in url.urls):
+                # Relative regexps can't be resolved, let URL.match() complain.
+                alone.append(position)
+                continue
+
+            regexps = [uncapture(regex.pattern) for regex in url.get_regexps(self.BASEURL)]
+            if None in regexps:
+                alone.append(position)
+                continue
+
+            branches.append('(?P<_%d>%s)' % (position, '|'.join('(?:%s)' % regex for regex in regexps)))
+            if len(branches) == self.URL_INDEX_CHUNK:
+                chunks.append(re.compile('|'.join(branches)))
+                branches = []
+        if branches:
+            chunks.append(re.compile('|'.join(branches)))
+
+        self._url_index = (self.BASEURL, [list(url.urls) for url in urls], urls, chunks, alone)
+        return self._url_index[2:]
+
+    def iter_matching_urls(self, url):
+        """
+        Iterate on :class:`URL` objects with a page class which match an
+        url, in the order they are declared.
+
+        Regexps of all URL objects are compiled once in an alternation, so
+        the first matching object is found with only one regexp match.
+        The index is built again only if :attr:`BASEURL` or regexps of URL
+        objects change.
+
+        :param url: absolute url
+        :type url: str
+        :rtype: iter[:class:`URL`]
+        """
+        urls, chunks, alone = self._get_url_index()
+
+        first = None
+        for regex in chunks:
+            m = regex.match(url)
+            if m:
+                first = int(m.lastgroup[1:])
+                break
+
+        # Regexps which can't be combined are tried separately.
+        for position in alone:
+            if first is not None and position > first:
+                break
+            if urls[position].match(url):
+                yield urls[position]
+
+        if first is None:
+            return
+
+        yield urls[first]
+        for u in urls[first + 1:]:
+            if u.match(url):
+                yield u
+
     def location(self, *args, **kwargs):
         """
         Same method than
@@ -696,7 +789,13 @@ class PagesBrowser(DomainBrowser):
             self.page.on_leave()
 
         response = self.open(*args, **kwargs)
+        return self._load_response(response)
 
+    def _load_response(self, response):
+        """
+        Set the current response and page, as :meth:`location` does once the
+        response is received.
+        """
         self.response = response
         self.page = response.page
         self.url = response.url
@@ -744,6 +843,145 @@ class PagesBrowser(DomainBrowser):
             else:
                 return
 
+    def prefetch_pagination(self, func, predict, prefetch=2, *args, **kwargs):
+        r"""
+        Same as :meth:`pagination`, but the next pages are requested while
+        the current one is parsed.
+
+        *predict* is called with the url of the current page, or with the
+        value it has returned for the previous page, and returns what the
+        :class:`NextPage` exception raised for this page will contain (an url
+        or a Request object), or None if it is unknown. Up to *prefetch*
+        predicted pages are requested asynchronously.
+
+        When the :class:`NextPage` request is the predicted one, the already
+        requested response is used; otherwise, pending requests are
+        cancelled and the page is requested as with :meth:`pagination`, so
+        results are the same. Use it only on sites where the response of a
+        page does not depend on having loaded the previous one (for example,
+        no cookie set by each page).
+
+        >>> list(b.prefetch_pagination(lambda: b.page.iter_values(), # doctest: +SKIP
+        ...                            lambda url: re.sub(r'\d+', lambda m: str(int(m.group(0)) + 1), url)))
+        ['One', 'Two', 'Three', 'Four']
+        """
+        prefetcher = PaginationPrefetcher(self, predict, prefetch)
+        try:
+            prefetcher.fill(self.url, self.url)
+            while True:
+                try:
+                    for r in func(*args, **kwargs):
+                        yield r
+                except NextPage as e:
+                    prefetcher.location(e.request)
+                else:
+                    return
+        finally:
+            prefetcher.cancel()
+
+
+class PaginationPrefetcher(object):
+    """
+    Request predicted next pages of a pagination before they are needed.
+
+    See :meth:`PagesBrowser.prefetch_pagination`.
+
+    :param browser: browser used to request pages
+    :type browser: :class:`PagesBrowser`
+    :param predict: callable returning the next page request from the
+                    previous one
+    :type predict: :class:`callable`
+    :param size: maximum number of pages requested in advance
+    :type size: :class:`int`
+    """
+
+    def __init__(self, browser, predict, size=2):
+        self.browser = browser
+        self.predict = predict
+        self.size = size
+        # (key, request, absolute url, future) of requested pages, in order.
+        self.pending = deque()
+
+    def _key(self, request, base):
+        if not isinstance(request, requests.Request):
+            request = requests.Request(url=request)
+        method = request.method or ('POST' if request.data else 'GET')
+        headers = sorted((k.lower(), v) for k, v in request.headers.items() if k.lower() != 'referer')
+        return (method.upper(), self.browser.absurl(request.url, base),
+                repr(request.data), repr(request.params), repr(request.json), repr(headers))
+
+    def fill(self, previous, base):
+        """
+        Request predicted pages following a page, until :attr:`size` pages are
+        pending.
+
+        :param previous: request of the page (url or Request object)
+        :param base: absolute url of the page
+        :type base: :class:`str`
+        """
+        if self.pending:
+            _, previous, base, _ = self.pending[-1]
+
+        while len(self.pending) < self.size:
+            request = self.predict(previous)
+            if request is None:
+                break
+
+            key = self._key(request, base)
+            url = key[1]
+            referrer = self.browser.get_referrer(base, url) or False
+            try:
+                if isinstance(request, requests.Request):
+                    request.url = url
+                    future = self.browser.async_open(request, referrer=referrer)
+                else:
+                    future = self.browser.async_open(url, referrer=referrer)
+            except Exception as e:
+                # The page will be requested again if it is really needed.
+                self.browser.logger.debug('Unable to prefetch %s: %s', url, e)
+                break
+
+            self.pending.append((key, request, url, future))
+            previous, base = request, url
+
+    def location(self, request):
+        """
+        Go on the next page, like :meth:`PagesBrowser.location`.
+
+        :param request: request given by the :class:`NextPage` exception
+        :rtype: :class:`requests.Response`
+        """
+        browser = self.browser
+        if self.pending and self.pending[0][0] == self._key(request, browser.url):
+            _, _, _, future = self.pending.popleft()
+            if browser.page is not None:
+                browser.page.on_leave()
+            response = browser._load_response(future.result())
+        else:
+            self.cancel()
+            response = browser.location(request)
+
+        self.fill(request, browser.url)
+        return response
+
+    def cancel(self):
+        """
+        Cancel requests of pages which are not used.
+
+        Requests which are not sent yet are cancelled. Requests which are
+        already running can't be interrupted, so their responses are closed
+        once received, to release their connections.
+        """
+        while self.pending:
+            _, _, _, future = self.pending.popleft()
+            if not future.cancel():
+                future.add_done_callback(self._close_response)
+
+    @staticmethod
+    def _close_response(future):
+        if not future.cancelled() and future.exception() is None:
+            future.result().close()
+
 
 def need_login(func):
     """
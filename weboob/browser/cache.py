@@ -17,39 +17,386 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with weboob. If not, see <http://www.gnu.org/licenses/>.
 
-__all__ = ['CacheMixin']
+import errno
+import hashlib
+import json
+import os
+import tempfile
+import time
+from threading import Lock
+
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+from weboob.tools.log import getLogger
+
+
+__all__ = ['CacheMixin', 'CacheEntry', 'CacheBackend', 'DiskCache']
 
 
 class CacheEntry(object):
-    def __init__(self, response):
+    """
+    Response stored in cache.
+
+    :param response: the response
+    :type response: :class:`requests.Response`
+    :param ttl: number of seconds during which the response can be used
+                without asking the server (None to always revalidate it)
+    :type ttl: :class:`int`
+    """
+
+    def __init__(self, response, ttl=None):
         self.response = response
         self.etag = response.headers.get('ETag')
         self.last_modified = response.headers.get('Last-Modified')
+        self.stored = time.time()
+        self.expires = self.stored + ttl if ttl is not None else None
 
     def has_cache_key(self):
         return (self.etag or self.last_modified)
 
+    def is_fresh(self):
+        return self.expires is not None and time.time() < self.expires
+
     def update_request(self, request):
         if self.last_modified:
             request.headers['If-Modified-Since'] = self.last_modified
         if self.etag:
             request.headers['If-None-Match'] = self.etag
 
+    def dump(self):
+        """
+        Get the metadata of the entry, without the response body.
+
+        :rtype: :class:`dict`
+        """
+        response = self.response
+        return {'url': response.url,
+                'status': response.status_code,
+                'reason': response.reason,
+                'encoding': response.encoding,
+                'headers': list(response.headers.items()),
+                'stored': self.stored,
+                'expires': self.expires,
+               }
+
+    @classmethod
+    def load(cls, data, content):
+        """
+        Build an entry from :meth:`dump` data and the response body.
+
+        The response is not bound to any request or page.
+        """
+        response = Response()
+        response.url = data['url']
+        response.status_code = data['status']
+        response.reason = data['reason']
+        response.encoding = data['encoding']
+        response.headers = CaseInsensitiveDict(data['headers'])
+        response._content = content
+        response._content_consumed = True
+
+        entry = cls(response)
+        entry.stored = data['stored']
+        entry.expires = data['expires']
+        return entry
+
+
+class CacheBackend(object):
+    """
+    Interface of cache stores used by :class:`CacheMixin`.
+
+    Stores behave like a dict of :class:`CacheEntry` objects, so a plain
+    dict or a :class:`weboob.tools.lrudict.LimitedLRUDict` can be used too.
+    Keys are tuples starting with the namespace of the browser.
+    """
+
+    def get(self, key, default=None):
+        raise NotImplementedError()
+
+    def __setitem__(self, key, entry):
+        raise NotImplementedError()
+
+    def __delitem__(self, key):
+        raise NotImplementedError()
+
+    def clear(self, namespace=None):
+        """
+        Remove all entries, or only entries of a namespace.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        Write pending changes, if any.
+        """
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        entry = self.get(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry
+
+
+class DiskCache(CacheBackend):
+    """
+    Cache stored in a directory, kept across runs.
+
+    Bodies are stored once per content in ``objects/``, named by their SHA-1
+    hash, and ``index.json`` maps keys to response metadata. When the cache
+    grows larger than *max_size*, the least recently used entries are
+    removed. Entries older than *max_age* are removed too.
+
+    Changes of the index are written at most every :attr:`SAVE_INTERVAL`
+    seconds, and by :meth:`close`. Several processes can use the same
+    directory, but entries stored at the same time by another process may be
+    lost.
+
+    :param path: directory of the cache
+    :type path: :class:`str`
+    :param max_size: maximum size of stored bodies, in bytes
+    :type max_size: :class:`int`
+    :param max_age: maximum age of entries, in seconds (None for no limit)
+    :type max_age: :class:`int`
+    """
+
+    VERSION = 1
+
+    SAVE_INTERVAL = 5
+    """
+    Minimum number of seconds between two writes of the index by
+    :meth:`__setitem__`.
+    """
+
+    def __init__(self, path, max_size=100 * 1024 * 1024, max_age=None):
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self.logger = getLogger('cache')
+        self.lock = Lock()
+        self.entries = None
+        # Number of entries using each body, and total size of bodies.
+        self.refs = {}
+        self.size = 0
+        self.dirty = False
+        self.saved = 0
+
+    @property
+    def index_path(self):
+        return os.path.join(self.path, 'index.json')
+
+    def body_path(self, digest):
+        return os.path.join(self.path, 'objects', digest[:2], digest[2:])
+
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+    def _load(self):
+        # Must be called with self.lock held.
+        if self.entries is not None:
+            return
+
+        self.entries = {}
+        self.refs = {}
+        self.size = 0
+        try:
+            with open(self.index_path, 'r') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+
+        if data.get('version') == self.VERSION:
+            for hkey, meta in data['entries'].items():
+                self._add(hkey, meta)
+
+    def _save(self):
+        # Must be called with self.lock held.
+        if self.max_age is not None:
+            limit = time.time() - self.max_age
+            for hkey, meta in list(self.entries.items()):
+                if meta['stored'] < limit:
+                    self._remove(hkey)
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        # write in a temporary file to avoid corruption problems
+        with tempfile.NamedTemporaryFile(mode='w', dir=self.path, delete=False) as f:
+            json.dump({'version': self.VERSION, 'entries': self.entries}, f)
+        os.rename(f.name, self.index_path)
+        self.dirty = False
+        self.saved = time.time()
+
+    def _add(self, hkey, meta):
+        # Must be called with self.lock held.
+        # Return the previous entry of the key, whose body is still
+        # referenced, see _release().
+        previous = self.entries.get(hkey)
+        self.entries[hkey] = meta
+        digest = meta['body']
+        if digest not in self.refs:
+            self.refs[digest] = 0
+            self.size += meta['size']
+        self.refs[digest] += 1
+        return previous
+
+    def _release(self, meta):
+        # Must be called with self.lock held.
+        # Return True if the body was removed, as no entry uses it anymore.
+        digest = meta['body']
+        self.refs[digest] -= 1
+        if self.refs[digest]:
+            return False
+
+        del self.refs[digest]
+        self.size -= meta['size']
+        try:
+            os.remove(self.body_path(digest))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        return True
+
+    def _remove(self, hkey):
+        # Must be called with self.lock held.
+        meta = self.entries.pop(hkey, None)
+        if meta is not None:
+            self._release(meta)
+        self.dirty = True
+
+    def _evict(self):
+        # Must be called with self.lock held.
+        if self.size <= self.max_size:
+            return
+
+        for hkey, meta in sorted(self.entries.items(), key=lambda item: item[1]['accessed']):
+            if self.size <= self.max_size:
+                break
+            self._remove(hkey)
+
+    def get(self, key, default=None):
+        hkey = self.hash_key(key)
+        with self.lock:
+            self._load()
+            meta = self.entries.get(hkey)
+            if meta is None:
+                return default
+
+            if self.max_age is not None and meta['stored'] < time.time() - self.max_age:
+                self._remove(hkey)
+                return default
+
+            try:
+                with open(self.body_path(meta['body']), 'rb') as f:
+                    content = f.read()
+            except IOError:
+                # Removed by another process.
+                self._remove(hkey)
+                return default
+
+            meta['accessed'] = time.time()
+            self.dirty = True
+
+        return CacheEntry.load(meta, content)
+
+    def __setitem__(self, key, entry):
+        content = entry.response.content
+        digest = hashlib.sha1(content).hexdigest()
+        meta = entry.dump()
+        try:
+            json.dumps(meta)
+        except (TypeError, ValueError) as e:
+            self.logger.warning('unable to store %r in cache: %s', entry.response.url, e)
+            return
+        meta.update(namespace=key[0], body=digest, size=len(content), accessed=time.time())
+
+        hkey = self.hash_key(key)
+        with self.lock:
+            self._load()
+
+            path = self.body_path(digest)
+            if not os.path.exists(path):
+                dirname = os.path.dirname(path)
+                if not os.path.isdir(dirname):
+                    os.makedirs(dirname)
+                with tempfile.NamedTemporaryFile(dir=dirname, delete=False) as f:
+                    f.write(content)
+                os.rename(f.name, path)
+
+            # The new entry is added before the previous one is released, so
+            # that a body they share is kept.
+            previous = self._add(hkey, meta)
+            if previous is not None:
+                self._release(previous)
+            self.dirty = True
+            self._evict()
+            if time.time() - self.saved >= self.SAVE_INTERVAL:
+                self._save()
+
+    def __delitem__(self, key):
+        hkey = self.hash_key(key)
+        with self.lock:
+            self._load()
+            self._remove(hkey)
+            self._save()
+
+    def clear(self, namespace=None):
+        with self.lock:
+            self._load()
+            for hkey, meta in list(self.entries.items()):
+                if namespace is None or meta['namespace'] == namespace:
+                    self._remove(hkey)
+            self._save()
+
+    def close(self):
+        with self.lock:
+            if self.dirty:
+                self._save()
+
+    def stats(self):
+        """
+        Get the number of entries and the size of stored bodies.
+
+        :rtype: :class:`dict`
+        """
+        with self.lock:
+            self._load()
+            return {'entries': len(self.entries),
+                    'size': self.size,
+                    'max_size': self.max_size,
+                   }
+
 
 class CacheMixin(object):
-    """Mixin to inherit in a Browser"""
+    """Mixin to inherit in a Browser
+
+    :param cache: cache store (see :class:`CacheBackend`), a new dict by default
+    :param cache_namespace: name used to keep entries of this browser apart
+                            from other browsers using the same store (the
+                            browser class name by default)
+    :type cache_namespace: :class:`str`
+    """
 
     def __init__(self, *args, **kwargs):
+        cache = kwargs.pop('cache', None)
+        cache_namespace = kwargs.pop('cache_namespace', None)
         super(CacheMixin, self).__init__(*args, **kwargs)
 
-        self.cache = {}
+        self.cache = cache if cache is not None else {}
 
         """Cache store object
 
         To limit the size of the cache, a :class:`weboob.tools.lrudict.LimitedLRUDict`
-        instance can be used.
+        instance can be used. To keep it across runs, use a :class:`DiskCache`.
         """
 
+        self.cache_namespace = cache_namespace or self.__class__.__name__
+
+        """Namespace of entries of this browser in the cache store"""
+
         self.is_updatable = True
 
         """Whether the cache is updatable
@@ -65,6 +412,23 @@ class CacheMixin(object):
         obsolete page in the cache.
         """
 
+        self.cache_ttl = None
+
+        """Number of seconds to keep responses without `ETag` and `Last-Modified`
+
+        By default, such responses are not cached. If set, they are stored,
+        and returned without querying the server until they expire.
+        """
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_bytes_saved = 0
+
+    def deinit(self):
+        super(CacheMixin, self).deinit()
+        if hasattr(self.cache, 'close'):
+            self.cache.close()
+
     def make_cache_key(self, request):
         """Make a key for the cache corresponding to the request."""
 
@@ -72,27 +436,47 @@ class CacheMixin(object):
         headers = tuple(request.headers.values())
         return (request.method, request.url, body, headers)
 
+    def cache_stats(self):
+        """
+        Get hits, misses and bytes not downloaded thanks to the cache.
+
+        :rtype: :class:`dict`
+        """
+        return {'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'bytes_saved': self.cache_bytes_saved,
+               }
+
+    def _cache_hit(self, request, response):
+        self.logger.debug('cache HIT for %r', request.url)
+        self.cache_hits += 1
+        self.cache_bytes_saved += len(response.content)
+        return response
+
     def open_with_cache(self, url, **kwargs):
         """Perform a request using the cache if possible."""
         request = self.build_request(url, **kwargs)
 
-        key = self.make_cache_key(request)
-        if key in self.cache:
-            if not self.is_updatable:
-                self.logger.debug('cache HIT for %r', request.url)
-                return self.cache[key].response
+        key = (self.cache_namespace,) + self.make_cache_key(request)
+        entry = self.cache.get(key)
+        if entry is not None:
+            if not self.is_updatable or entry.is_fresh():
+                return self._cache_hit(request, entry.response)
             else:
-                self.cache[key].update_request(request)
+                entry.update_request(request)
 
         response = super(CacheMixin, self).open(request, **kwargs)
-        if response.status_code == 304:
-            self.logger.debug('cache HIT for %r', request.url)
-            return self.cache[key].response
+        if response.status_code == 304 and entry is not None:
+            return self._cache_hit(request, entry.response)
         elif response.status_code == 200:
             entry = CacheEntry(response)
-            if entry.has_cache_key():
+            if not entry.has_cache_key() and self.cache_ttl is not None:
+                entry = CacheEntry(response, ttl=self.cache_ttl)
+            no_store = 'no-store' in response.headers.get('Cache-Control', '')
+            if not no_store and (entry.has_cache_key() or entry.expires is not None):
                 self.logger.debug('storing %r response in cache', request.url)
                 self.cache[key] = entry
 
         self.logger.debug('cache MISS for %r', request.url)
+        self.cache_misses += 1
         return response
@@ -16,11 +16,17 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with weboob. If not, see <http://www.gnu.org/licenses/>.
 
+import copy
+
 import requests.cookies
 try:
     import cookielib
 except ImportError:
     import http.cookiejar as cookielib
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
 
 
 __all__ = ['WeboobCookieJar']
@@ -34,6 +40,65 @@ class WeboobCookieJar(requests.cookies.RequestsCookieJar):
         """
         return requests.cookies.merge_cookies(klass(), cj)
 
+    @staticmethod
+    def _domains_for_host(host):
+        """
+        Get keys of the jar for domains which may match a host.
+
+        The cookie policy only returns cookies of a domain when ".domain" is a
+        suffix of ".host" (or of the host with ".local" appended if it has no
+        dot), so only these suffixes have to be looked up.
+        """
+        domains = set([''])
+        hosts = [host]
+        if '.' not in host:
+            hosts.append(host + '.local')
+        for host in hosts:
+            labels = host.split('.')
+            for i in range(len(labels)):
+                suffix = '.'.join(labels[i:])
+                domains.add(suffix)
+                domains.add('.' + suffix)
+        return domains
+
+    def for_url(self, url):
+        """
+        Get a new jar containing only cookies which may be sent to an URL.
+
+        Instead of copying the whole jar, only domains matching the host of
+        the URL are looked up, and cookies are not copied, as they are not
+        modified once in a jar. The cookie policy still checks each returned
+        cookie (path, port, expiration, etc.) when building the Cookie header.
+
+        :param url: absolute URL of the request
+        :type url: :class:`str`
+        :rtype: :class:`WeboobCookieJar`
+        """
+        jar = type(self)()
+        # Same as cookielib.request_host()
+        host = cookielib.cut_port_re.sub('', urlparse(url).netloc, 1).lower()
+        try:
+            host.encode('ascii')
+        except UnicodeError:
+            # The prepared URL will have an IDNA encoded host.
+            host = ''
+
+        with self._cookies_lock:
+            if not host:
+                domains = list(self._cookies)
+            else:
+                domains = [domain for domain in self._domains_for_host(host) if domain in self._cookies]
+
+            for domain in domains:
+                jar._cookies[domain] = dict((path, dict(cookies))
+                                            for path, cookies in self._cookies[domain].items())
+
+        for cookie in jar:
+            if hasattr(cookie.value, 'startswith') and cookie.value.startswith('"') and '\\"' in cookie.value:
+                # RequestsCookieJar.set_cookie() would have changed its value.
+                jar.set_cookie(copy.copy(cookie))
+        return jar
+
     def export(self, filename):
         """
         Export all cookies to a file, regardless of expiration, etc.
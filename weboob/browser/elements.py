@@ -20,16 +20,19 @@
 import os
 import re
 import sys
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 from copy import deepcopy
 
 import lxml.html
 
+from weboob.capabilities.base import IMMUTABLE_TYPES
 from weboob.tools.log import getLogger, DEBUG_FILTERS
 from weboob.browser.pages import NextPage
 
 from .filters.standard import _Filter, CleanText
 from .filters.html import AttributeNotFound, XPathNotFound
+from .profiler import FilterProfiler
+from .xpath import xpath
 
 
 __all__ = ['DataError', 'AbstractElement', 'ListElement', 'ItemElement', 'TableElement', 'SkipItem']
@@ -51,10 +54,100 @@ def method(klass):
     return inner
 
 
+class _Env(dict):
+    """
+    Copy-on-write environment of an element.
+
+    It is created from the environment of the parent element (or from the
+    page parameters) without copying values: values which are not immutable
+    are deep-copied only when they are read for the first time, so each
+    element can still modify them without side effects on other elements.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(_Env, self).__init__(*args, **kwargs)
+        self._shared = set(key for key, value in dict.iteritems(self)
+                           if not isinstance(value, IMMUTABLE_TYPES))
+
+    def _own(self, key):
+        if key in self._shared:
+            self._shared.discard(key)
+            dict.__setitem__(self, key, deepcopy(dict.__getitem__(self, key)))
+
+    def _own_all(self):
+        for key in list(self._shared):
+            self._own(key)
+
+    def __getitem__(self, key):
+        if self._shared:
+            self._own(key)
+        return super(_Env, self).__getitem__(key)
+
+    def __setitem__(self, key, value):
+        self._shared.discard(key)
+        super(_Env, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._shared.discard(key)
+        super(_Env, self).__delitem__(key)
+
+    def get(self, key, default=None):
+        if self._shared:
+            self._own(key)
+        return super(_Env, self).get(key, default)
+
+    def pop(self, key, *args):
+        if self._shared:
+            self._own(key)
+        return super(_Env, self).pop(key, *args)
+
+    def setdefault(self, key, default=None):
+        if self._shared:
+            self._own(key)
+        return super(_Env, self).setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        values = dict(*args, **kwargs)
+        self._shared.difference_update(values)
+        super(_Env, self).update(values)
+
+    def clear(self):
+        self._shared.clear()
+        super(_Env, self).clear()
+
+    def copy(self):
+        return _Env(self)
+
+    def values(self):
+        self._own_all()
+        return super(_Env, self).values()
+
+    def items(self):
+        self._own_all()
+        return super(_Env, self).items()
+
+    def itervalues(self):
+        self._own_all()
+        return super(_Env, self).itervalues()
+
+    def iteritems(self):
+        self._own_all()
+        return super(_Env, self).iteritems()
+
+    def __reduce__(self):
+        self._own_all()
+        return (_Env, (dict(self),))
+
+
+_ElementPlan = namedtuple('_ElementPlan', 'elements loaders attrs')
+
+
 class AbstractElement(object):
     _creation_counter = 0
     condition = None
 
+    _el = None
+
     def __init__(self, page, parent=None, el=None):
         self.page = page
         self.parent = parent
@@ -62,13 +155,11 @@ class AbstractElement(object):
             self.el = el
         elif parent is not None:
             self.el = parent.el
-        else:
-            self.el = page.doc
 
         if parent is not None:
-            self.env = deepcopy(parent.env)
+            self.env = _Env(parent.env)
         else:
-            self.env = deepcopy(page.params)
+            self.env = _Env(page.params or {})
 
         # Used by debug
         self._random_id = AbstractElement._creation_counter
@@ -76,7 +167,60 @@ class AbstractElement(object):
 
         self.loaders = {}
 
+    @property
+    def el(self):
+        # The document of the page is only used when needed, as it may be
+        # parsed incrementally instead (see ListElement.stream).
+        if self._el is None:
+            self._el = self.page.doc
+        return self._el
+
+    @el.setter
+    def el(self, el):
+        self._el = el
+
+    @classmethod
+    def _get_plan(cls):
+        """
+        Get attributes of the class used to parse each node: nested elements,
+        loaders and obj_* attributes.
+
+        It is computed once per class, instead of calling dir() for each node.
+        """
+        plan = cls.__dict__.get('_plan')
+        if plan is None:
+            elements = []
+            loaders = []
+            for attrname in dir(cls):
+                attr = getattr(cls, attrname)
+                if isinstance(attr, type) and issubclass(attr, AbstractElement) and attr is not cls:
+                    elements.append(attrname)
+                m = re.match('load_(.*)', attrname)
+                if m:
+                    loaders.append((m.group(1), attrname))
+            attrs = [(attr, 'obj_%s' % attr) for attr in getattr(cls, '_attrs', None) or ()]
+
+            plan = cls._plan = _ElementPlan(elements, loaders, attrs)
+        return plan
+
     def use_selector(self, func, key=None):
+        profiler = FilterProfiler.active
+        if profiler is None:
+            return self._use_selector(func, key)
+
+        name = '%s.%s' % (self.__class__.__name__, key)
+        if self.parent is not None:
+            # Item classes are often just named "item".
+            name = '%s.%s' % (self.parent.__class__.__name__, name)
+        profiler.push(name, attribute=True)
+        profiler.push(getattr(func, '__name__', func.__class__.__name__))
+        try:
+            return self._use_selector(func, key)
+        finally:
+            profiler.pop()
+            profiler.pop()
+
+    def _use_selector(self, func, key=None):
         if isinstance(func, _Filter):
             func._obj = self
             func._key = key
@@ -97,14 +241,10 @@ class AbstractElement(object):
         return self.el.cssselect(*args, **kwargs)
 
     def xpath(self, *args, **kwargs):
-        return self.el.xpath(*args, **kwargs)
+        return xpath(self.el, *args, **kwargs)
 
     def handle_loaders(self):
-        for attrname in dir(self):
-            m = re.match('load_(.*)', attrname)
-            if not m:
-                continue
-            name = m.group(1)
+        for name, attrname in self._get_plan().loaders:
             if name in self.loaders:
                 continue
             loader = getattr(self, attrname)
@@ -116,6 +256,25 @@ class ListElement(AbstractElement):
     flush_at_end = False
     ignore_duplicate = False
 
+    stream = False
+    """
+    If True, and if the document of the page has not been built yet (see
+    :attr:`weboob.browser.pages.Page.LAZY_DOC`), items are processed while
+    the page is parsed incrementally, and removed from the tree once done,
+    so memory does not grow with the number of items.
+
+    It requires an :attr:`item_xpath` made of tag names with optional
+    attribute conditions, like ``//table[@id="list"]/tbody/tr``. Items must
+    not be nested in each other, and item elements can only select their own
+    descendants. Otherwise, or if the document has already been built, the
+    page is iterated as usual.
+
+    The list can't read the rest of the page, as it isn't parsed yet: a
+    list defining :meth:`parse` is iterated as usual, with a warning.
+    :class:`TableElement` can't be streamed either, as it reads the header
+    of the table first.
+    """
+
     def __init__(self, *args, **kwargs):
         super(ListElement, self).__init__(*args, **kwargs)
         self.logger = getLogger(self.__class__.__name__.lower())
@@ -134,7 +293,7 @@ class ListElement(AbstractElement):
         sufficient.
         """
         if self.item_xpath is not None:
-            for el in self.el.xpath(self.item_xpath):
+            for el in xpath(self.el, self.item_xpath):
                 yield el
         else:
             yield self.el
@@ -143,19 +302,25 @@ class ListElement(AbstractElement):
         if self.condition is not None and not self.condition():
             return
 
+        if self.stream and self._can_stream():
+            matcher = _SimpleXPathMatcher.compile(self.item_xpath)
+            if matcher is not None:
+                for obj in self._iter_stream(matcher):
+                    yield obj
+                return
+
         self.parse(self.el)
 
         items = []
+        elements = [getattr(self, attrname) for attrname in self._get_plan().elements]
         for el in self.find_elements():
-            for attrname in dir(self):
-                attr = getattr(self, attrname)
-                if isinstance(attr, type) and issubclass(attr, AbstractElement) and attr != type(self):
-                    item = attr(self.page, self, el)
-                    if item.condition is not None and not item.condition():
-                        continue
+            for attr in elements:
+                item = attr(self.page, self, el)
+                if item.condition is not None and not item.condition():
+                    continue
 
-                    item.handle_loaders()
-                    items.append(item)
+                item.handle_loaders()
+                items.append(item)
 
         for item in items:
             for obj in item:
@@ -169,6 +334,55 @@ class ListElement(AbstractElement):
 
         self.check_next_page()
 
+    def _can_stream(self):
+        parse = type(self).parse
+        if getattr(parse, '__func__', parse) is not AbstractElement.__dict__['parse']:
+            self.logger.warning('%s is not streamed, as parse() would not get the page content',
+                                type(self).__name__)
+            return False
+
+        return self._el is None and 'doc' not in vars(self.page) and \
+            getattr(self.page, 'LAZY_DOC', False) and hasattr(self.page, 'iterparse')
+
+    def _iter_stream(self, matcher):
+        events = self.page.iterparse()
+        for event, root in events:
+            # The first event is the start of the root element.
+            self.el = root
+            break
+        else:
+            return
+
+        self.parse(self.el)
+
+        elements = [getattr(self, attrname) for attrname in self._get_plan().elements]
+        for event, el in events:
+            if event != 'end' or not matcher.match(el):
+                continue
+
+            for attr in elements:
+                item = attr(self.page, self, el)
+                if item.condition is not None and not item.condition():
+                    continue
+
+                item.handle_loaders()
+                for obj in item:
+                    obj = self.store(obj)
+                    if obj and not self.flush_at_end:
+                        yield obj
+
+            # This item is done, remove it to save memory.
+            parent = el.getparent()
+            el.clear()
+            if parent is not None:
+                parent.remove(el)
+
+        if self.flush_at_end:
+            for obj in self.flush():
+                yield obj
+
+        self.check_next_page()
+
     def flush(self):
         for obj in self.objects.itervalues():
             yield obj
@@ -201,6 +415,81 @@ class ListElement(AbstractElement):
         return obj
 
 
+class _SimpleXPathMatcher(object):
+    """
+    Check if an element matches a simple XPath expression, using only the
+    element and its ancestors. It is used to match elements while the
+    document is being parsed.
+    """
+
+    STEP_RE = re.compile(r"""(//|/)([\w-]+|\*)((?:\[@[\w-]+(?:=(?:"[^"]*"|'[^']*'))?\])*)""")
+    CONDITION_RE = re.compile(r"""\[@([\w-]+)(?:=(?:"([^"]*)"|'([^']*)'))?\]""")
+
+    def __init__(self, steps):
+        self.steps = steps
+
+    @classmethod
+    def compile(cls, expression):
+        """
+        Get a matcher for an expression, or None if it is not supported.
+        """
+        if not isinstance(expression, basestring):
+            return None
+        if expression.startswith('.//'):
+            expression = expression[1:]
+
+        steps = []
+        pos = 0
+        while pos < len(expression):
+            m = cls.STEP_RE.match(expression, pos)
+            if not m:
+                return None
+            conditions = []
+            for c in cls.CONDITION_RE.finditer(m.group(3)):
+                value = c.group(2) if c.group(2) is not None else c.group(3)
+                conditions.append((c.group(1), value))
+            steps.append((m.group(1), m.group(2), conditions))
+            pos = m.end()
+
+        if not steps:
+            return None
+        return cls(steps)
+
+    def _match_step(self, el, step):
+        _, tag, conditions = step
+        if not isinstance(el.tag, basestring) or (tag != '*' and el.tag != tag):
+            return False
+        for attr, value in conditions:
+            if value is None:
+                if attr not in el.attrib:
+                    return False
+            elif el.get(attr) != value:
+                return False
+        return True
+
+    def _match(self, el, i):
+        step = self.steps[i]
+        if not self._match_step(el, step):
+            return False
+
+        parent = el.getparent()
+        if i == 0:
+            # "/tag" only matches the root element.
+            return step[0] == '//' or parent is None
+
+        if step[0] == '/':
+            return parent is not None and self._match(parent, i - 1)
+
+        while parent is not None:
+            if self._match(parent, i - 1):
+                return True
+            parent = parent.getparent()
+        return False
+
+    def match(self, el):
+        return self._match(el, len(self.steps) - 1)
+
+
 class SkipItem(Exception):
     """
     Raise this exception in an :class:`ItemElement` subclass to skip an item.
@@ -300,8 +589,8 @@ class ItemElement(AbstractElement):
                     self.obj = self.build_object()
                 self.parse(self.el)
                 self.handle_loaders()
-                for attr in self._attrs:
-                    self.handle_attr(attr, getattr(self, 'obj_%s' % attr))
+                for attr, attrname in self._get_plan().attrs:
+                    self.handle_attr(attr, getattr(self, attrname))
             except SkipItem:
                 return
 
@@ -335,6 +624,10 @@ class TableElement(ListElement):
     def __init__(self, *args, **kwargs):
         super(TableElement, self).__init__(*args, **kwargs)
 
+        if self.stream:
+            self.logger.warning('%s is not streamed, as the header of the table is read first',
+                                type(self).__name__)
+
         self._cols = {}
 
         columns = {}
@@ -347,7 +640,7 @@ class TableElement(ListElement):
                 columns[m.group(1)] = [s.lower() if isinstance(s, (str, unicode)) else s for s in cols]
 
         colnum = 0
-        for el in self.el.xpath(self.head_xpath):
+        for el in xpath(self.el, self.head_xpath):
             title = self.cleaner.clean(el)
             for name, titles in columns.iteritems():
                 if name in self._cols:
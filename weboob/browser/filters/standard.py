@@ -35,6 +35,8 @@ from weboob.capabilities.base import Currency as BaseCurrency
 from weboob.tools.compat import basestring
 from weboob.exceptions import ParseError
 from weboob.browser.url import URL
+from weboob.browser.profiler import FilterProfiler
+from weboob.browser.xpath import xpath
 from weboob.tools.log import getLogger, DEBUG_FILTERS
 
 
@@ -180,16 +182,18 @@ class Filter(_Filter):
         self.selector = selector
 
     def select(self, selector, item):
-        if isinstance(selector, basestring):
-            ret = item.xpath(selector)
-        elif isinstance(selector, _Filter):
-            selector._key = self._key
-            selector._obj = self._obj
-            ret = selector(item)
-        elif callable(selector):
-            ret = selector(item)
+        profiler = FilterProfiler.active
+        if profiler is not None and (isinstance(selector, basestring) or callable(selector)):
+            if isinstance(selector, basestring):
+                profiler.push(FilterProfiler.XPATH)
+            else:
+                profiler.push(getattr(selector, '__name__', selector.__class__.__name__))
+            try:
+                ret = self._select(selector, item)
+            finally:
+                profiler.pop()
         else:
-            ret = selector
+            ret = self._select(selector, item)
 
         if isinstance(ret, lxml.html.HtmlElement):
             self.highlight_el(ret, item)
@@ -200,6 +204,19 @@ class Filter(_Filter):
 
         return ret
 
+    def _select(self, selector, item):
+        if isinstance(selector, basestring):
+            ret = xpath(item, selector)
+        elif isinstance(selector, _Filter):
+            selector._key = self._key
+            selector._obj = self._obj
+            ret = selector(item)
+        elif callable(selector):
+            ret = selector(item)
+        else:
+            ret = selector
+        return ret
+
     def __call__(self, item):
         return self.filter(self.select(self.selector, item))
 
@@ -347,7 +364,7 @@ class TableCell(_Filter):
         for name in self.names:
             idx = item.parent.get_colnum(name)
             if idx is not None:
-                ret = item.xpath(self.td % (idx + 1))
+                ret = xpath(item, self.td % (idx + 1))
                 for el in ret:
                     self.highlight_el(el, item)
                 return ret
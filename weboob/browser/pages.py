@@ -24,6 +24,7 @@ from functools import wraps
 import warnings
 from io import BytesIO
 import codecs
+import re
 from cgi import parse_header
 try:
     import urlparse
@@ -38,7 +39,7 @@ from weboob.tools.log import getLogger
 from weboob.tools.pdf import decompress_pdf
 
 
-def pagination(func):
+def pagination(func=None, predict=None, prefetch=2):
     r"""
     This helper decorator can be used to handle pagination pages easily.
 
@@ -47,6 +48,11 @@ def pagination(func):
 
     :class:`NextPage` constructor can take an url or a Request object.
 
+    If next pages can be predicted, the *predict* callable can be given to
+    request the next *prefetch* pages while the current one is parsed (see
+    :meth:`weboob.browser.browsers.PagesBrowser.prefetch_pagination`), for
+    example with ``@pagination(predict=lambda url: url.replace(...))``.
+
     >>> class Page(HTMLPage):
     ...     @pagination
     ...     def iter_values(self):
@@ -68,17 +74,33 @@ def pagination(func):
     ['One', 'Two', 'Three', 'Four']
     """
 
+    if func is None:
+        return lambda func: pagination(func, predict=predict, prefetch=prefetch)
+
     @wraps(func)
     def inner(page, *args, **kwargs):
-        while True:
-            try:
-                for r in func(page, *args, **kwargs):
-                    yield r
-            except NextPage as e:
-                result = page.browser.location(e.request)
-                page = result.page
-            else:
-                return
+        prefetcher = None
+        if predict is not None:
+            from .browsers import PaginationPrefetcher
+            prefetcher = PaginationPrefetcher(page.browser, predict, prefetch)
+            prefetcher.fill(page.url, page.url)
+
+        try:
+            while True:
+                try:
+                    for r in func(page, *args, **kwargs):
+                        yield r
+                except NextPage as e:
+                    if prefetcher is not None:
+                        result = prefetcher.location(e.request)
+                    else:
+                        result = page.browser.location(e.request)
+                    page = result.page
+                else:
+                    return
+        finally:
+            if prefetcher is not None:
+                prefetcher.cancel()
 
     return inner
 
@@ -130,6 +152,14 @@ class Page(object):
     :class:`LoginBrowser` and the :func:`need_login` decorator.
     """
 
+    LAZY_DOC = False
+    """
+    If True, :attr:`doc` is only built when it is accessed for the first time,
+    instead of in constructor. It allows
+    :class:`weboob.browser.elements.ListElement` objects with ``stream = True``
+    to parse the page incrementally.
+    """
+
     def __init__(self, browser, response, params=None, encoding=None):
         self.browser = browser
         self.logger = getLogger(self.__class__.__name__.lower(), browser.logger)
@@ -141,15 +171,23 @@ class Page(object):
         self.forced_encoding = encoding or self.ENCODING
         if self.forced_encoding:
             self.response.encoding = self.forced_encoding
-        self.doc = self.build_doc(self.data)
-
-        # Last chance to change encoding, according to :meth:`detect_encoding`,
-        # which can be used to detect a document-level encoding declaration
-        if not self.forced_encoding:
+        else:
+            # Change encoding according to :meth:`detect_encoding`, which can
+            # be used to detect a document-level encoding declaration, before
+            # building the document.
             encoding = self.detect_encoding()
             if encoding and encoding != self.encoding:
                 self.response.encoding = encoding
-                self.doc = self.build_doc(self.data)
+
+        if not self.LAZY_DOC:
+            self.doc = self.build_doc(self.data)
+
+    def __getattr__(self, name):
+        if name == 'doc' and self.LAZY_DOC:
+            self.doc = self.build_doc(self.data)
+            return self.doc
+        raise AttributeError("'%s' object has no attribute '%s'" % (
+            self.__class__.__name__, name))
 
     # Encoding issues are delegated to Response instance, implemented by
     # requests module.
@@ -207,6 +245,8 @@ class Page(object):
         """
         Override this method to implement detection of document-level encoding
         declaration, if any (eg. html5's <meta charset="some-charset">).
+
+        It is called before :meth:`build_doc`, so it can't use :attr:`doc`.
         """
         return None
 
@@ -573,6 +613,8 @@ class HTMLPage(Page):
         This method is called in constructor of :class:`HTMLPage` and can be
         overloaded by children classes to add extra functions.
         """
+        from .xpath import xpath
+
         ns['lower-case'] = lambda context, args: ' '.join([s.lower() for s in args])
         ns['replace'] = lambda context, args, old, new: ' '.join([s.replace(old, new) for s in args])
 
@@ -602,8 +644,8 @@ class HTMLPage(Page):
             0
             """
             expressions = ' and '.join(["contains(concat(' ', normalize-space(@class), ' '), ' {0} ')".format(c) for c in classes])
-            xpath = 'self::*[@class and {0}]'.format(expressions)
-            return bool(context.context_node.xpath(xpath))
+            expression = 'self::*[@class and {0}]'.format(expressions)
+            return bool(xpath(context.context_node, expression))
 
         def starts_with(context, text, prefix):
             if not isinstance(text, list):
@@ -619,31 +661,90 @@ class HTMLPage(Page):
         ns['starts-with'] = starts_with
         ns['ends-with'] = ends_with
 
-    def build_doc(self, content):
-        """
-        Method to build the lxml document from response and given encoding.
-        """
+    def _parser_encoding(self):
         encoding = self.encoding
         if encoding == 'latin-1':
             encoding = 'latin1'
         if encoding:
             encoding = encoding.replace('ISO8859_', 'ISO8859-')
+        return encoding
+
+    def build_doc(self, content):
+        """
+        Method to build the lxml document from response and given encoding.
+        """
         import lxml.html as html
-        parser = html.HTMLParser(encoding=encoding)
+        parser = html.HTMLParser(encoding=self._parser_encoding())
         return html.parse(BytesIO(content), parser)
 
+    def iterparse(self, chunk_size=65536):
+        """
+        Parse the document incrementally.
+
+        Elements are the same as in :attr:`doc`, but they are yielded while
+        the tree is built: on a "start" event, only the attributes of the
+        element and its ancestors are known; on an "end" event, the element
+        and its children are complete.
+
+        :rtype: iter[(:class:`str`, :class:`lxml.html.HtmlElement`)]
+        """
+        import lxml.html as html
+        parser = html.etree.HTMLPullParser(events=('start', 'end'), encoding=self._parser_encoding())
+        parser.set_element_class_lookup(html.HtmlElementClassLookup())
+
+        data = self.data
+        for pos in range(0, len(data), chunk_size):
+            parser.feed(data[pos:pos + chunk_size])
+            for event in parser.read_events():
+                yield event
+        parser.close()
+        for event in parser.read_events():
+            yield event
+
+    HEAD_END_RE = re.compile(br'</head\s*>|<body[\s>]', re.IGNORECASE)
+
+    ENCODING_DETECTION_SIZE = 65536
+    """
+    Encoding declarations are looked for in the head of the document, within
+    this number of bytes.
+    """
+
     def detect_encoding(self):
         """
         Look for encoding in the document "http-equiv" and "charset" meta nodes.
+
+        Only the head of the document is parsed, so that the whole document
+        is parsed once, with the right encoding.
         """
+        import lxml.html as html
+        from .xpath import xpath
+
+        data = self.data[:self.ENCODING_DETECTION_SIZE]
+        m = self.HEAD_END_RE.search(data)
+        if m:
+            data = data[:m.start()]
+
+        head = None
+        if data.strip():
+            try:
+                head = html.parse(BytesIO(data), html.HTMLParser(encoding=self._parser_encoding()))
+            except html.etree.LxmlError:
+                pass
+        if head is None or head.getroot() is None:
+            metas = []
+            charsets = []
+        else:
+            metas = xpath(head, '//head/meta[lower-case(@http-equiv)="content-type"]/@content')
+            charsets = xpath(head, '//head/meta[@charset]/@charset')
+
         encoding = self.encoding
-        for content in self.doc.xpath('//head/meta[lower-case(@http-equiv)="content-type"]/@content'):
+        for content in metas:
             # meta http-equiv=content-type content=...
             _, params = parse_header(content)
             if 'charset' in params:
                 encoding = params['charset'].strip("'\"")
 
-        for charset in self.doc.xpath('//head/meta[@charset]/@charset'):
+        for charset in charsets:
             # meta charset=...
             encoding = charset.lower()
 
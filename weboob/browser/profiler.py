@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+import threading
+from timeit import default_timer
+
+
+__all__ = ['FilterProfiler']
+
+
+class FilterProfiler(object):
+    """
+    Measure time spent in filters of elements.
+
+    While a profiler is started, each ``obj_*`` attribute and loader of
+    elements, each filter, each selector of filters and each XPath
+    selection is a frame. For each stack of frames, the number of calls,
+    the cumulative time and the self time (without time of inner frames) are
+    aggregated, so it is possible to find which filter of which element
+    class is slow, and if time goes in XPath selection or in processing of
+    values.
+
+    It is disabled by default, and only one profiler can be started at the
+    same time, for all threads.
+
+    >>> profiler = FilterProfiler()
+    >>> with profiler:  # doctest: +SKIP
+    ...     objs = list(page.iter_history())
+    >>> print(profiler.report())  # doctest: +SKIP
+    >>> profiler.dump_stacks('history.folded')  # doctest: +SKIP
+
+    Stacks are written in the "folded" format of flamegraph.pl, which can be
+    read by most flame graph viewers.
+    """
+
+    active = None
+    """
+    Profiler currently started, if any.
+    """
+
+    XPATH = 'xpath'
+    """
+    Name of frames of XPath selection.
+    """
+
+    def __init__(self):
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def start(self):
+        FilterProfiler.active = self
+
+    def stop(self):
+        if FilterProfiler.active is self:
+            FilterProfiler.active = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    def clear(self):
+        with self.lock:
+            self.stats = {}
+
+    def push(self, name, attribute=False):
+        """
+        Enter a frame.
+
+        :param name: name of frame
+        :type name: :class:`str`
+        :param attribute: if True, the frame is an attribute of an element
+                          (``Element.attr``)
+        :type attribute: :class:`bool`
+        """
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        # name, is attribute, start time, time of inner frames
+        stack.append([name, attribute, default_timer(), 0.0])
+
+    def pop(self):
+        """
+        Leave the current frame.
+        """
+        end = default_timer()
+        stack = self.local.stack
+        key = tuple((frame[0], frame[1]) for frame in stack)
+        name, attribute, start, inner = stack.pop()
+        elapsed = end - start
+        if stack:
+            stack[-1][3] += elapsed
+
+        with self.lock:
+            stat = self.stats.get(key)
+            if stat is None:
+                stat = self.stats[key] = [0, 0.0, 0.0]
+            stat[0] += 1
+            stat[1] += elapsed
+            stat[2] += elapsed - inner
+
+    def get_stats(self):
+        """
+        Aggregate stats by element attribute and filter type.
+
+        The element attribute is the nearest ``Element.attr`` frame of each
+        stack; time of frames of nested elements is counted in their own
+        attributes. The filter of the frame of the attribute itself is an
+        empty string, its cumulative time is the total time of the attribute.
+
+        :returns: (attribute, filter) -> [calls, cumulative time, self time]
+        :rtype: :class:`dict`
+        """
+        stats = {}
+        with self.lock:
+            items = list(self.stats.items())
+        for key, (calls, cumulative, self_time) in items:
+            attribute = next((name for name, is_attr in reversed(key) if is_attr), '')
+            name, is_attr = key[-1]
+            row = stats.setdefault((attribute, '' if is_attr else name), [0, 0.0, 0.0])
+            row[0] += calls
+            # A filter can be nested in itself, don't count it twice.
+            if not any(frame == key[-1] for frame in key[:-1]):
+                row[1] += cumulative
+            row[2] += self_time
+        return stats
+
+    def report(self, sort='self', limit=None):
+        """
+        Get a report of stats by element attribute and filter type, sorted
+        by self time (*sort* = ``'self'``), cumulative time (``'cumulative'``)
+        or number of calls (``'calls'``).
+
+        :rtype: :class:`str`
+        """
+        index = {'calls': 0, 'cumulative': 1, 'self': 2}[sort]
+        stats = sorted(self.get_stats().items(), key=lambda item: item[1][index], reverse=True)
+
+        total = sum(stat[2] for _, stat in stats)
+        xpath = sum(stat[2] for (_, name), stat in stats if name == self.XPATH)
+
+        lines = ['%8s %10s %10s  %-40s %s' % ('calls', 'cumtime', 'selftime', 'attribute', 'filter')]
+        for (attribute, name), (calls, cumulative, self_time) in stats[:limit]:
+            lines.append('%8d %10.4f %10.4f  %-40s %s' % (calls, cumulative, self_time, attribute, name))
+        lines.append('')
+        lines.append('Total: %.4fs, XPath selection: %.4fs, other processing: %.4fs' % (total, xpath, total - xpath))
+        return '\n'.join(lines)
+
+    def iter_stacks(self):
+        """
+        Iterate on stacks in the folded format: frames separated by
+        semicolons, and self time in microseconds.
+        """
+        with self.lock:
+            items = sorted(self.stats.items())
+        for key, (calls, cumulative, self_time) in items:
+            yield '%s %d' % (';'.join(name for name, _ in key), int(self_time * 1e6))
+
+    def dump_stacks(self, filename):
+        """
+        Write stacks in the folded format, see :meth:`iter_stacks`.
+        """
+        with open(filename, 'w') as f:
+            for line in self.iter_stacks():
+                f.write(line + '\n')
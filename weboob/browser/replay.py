@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import re
+from collections import namedtuple
+from io import BytesIO
+from threading import Lock
+
+try:
+    from requests.packages.urllib3.response import HTTPResponse
+    from requests.packages.urllib3._collections import HTTPHeaderDict
+except ImportError:
+    from urllib3.response import HTTPResponse
+    from urllib3._collections import HTTPHeaderDict
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+
+
+__all__ = ['ReplayTransport', 'ReplayAdapter', 'ResponseNotRecorded', 'RecordedResponse', 'load_responses']
+
+
+class ResponseNotRecorded(ConnectionError):
+    """
+    Raised when no recorded response matches a request.
+    """
+
+
+RecordedResponse = namedtuple('RecordedResponse', ('method', 'url', 'body', 'status', 'reason', 'headers', 'content', 'filename'))
+"""
+Response saved by :meth:`weboob.browser.browsers.Browser.save_response`,
+with the request it answered.
+"""
+
+# Headers describing the transfer of the body, which has been saved decoded.
+TRANSFER_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+# Split a Set-Cookie header joined by requests, but not on commas of dates.
+SET_COOKIE_SPLIT_RE = re.compile(r', (?=[^ ;,=]+=)')
+
+
+def _read(path, mode='r'):
+    with open(path, mode) as f:
+        return f.read()
+
+
+def _parse_headers(lines):
+    headers = []
+    for line in lines:
+        key, sep, value = line.partition(': ')
+        if sep:
+            headers.append((key, value))
+    return headers
+
+
+def _native_body(body):
+    """
+    Get a request body as the native string it was saved as.
+    """
+    if body is None or isinstance(body, str):
+        return body
+    if isinstance(body, bytes):
+        return body.decode('utf-8', 'replace')
+    if hasattr(body, 'encode'):
+        return body.encode('utf-8')
+    # Streamed body, which was not saved.
+    return None
+
+
+def load_responses(dirname):
+    """
+    Load responses saved in a directory by
+    :meth:`weboob.browser.browsers.Browser.save_response` (``-a`` option of
+    applications), in the order they were received.
+
+    :param dirname: directory of saved responses
+    :type dirname: :class:`str`
+    :rtype: list[:class:`RecordedResponse`]
+    """
+    responses = []
+    status = reason = None
+    for line in _read(os.path.join(dirname, 'url_response_match.txt')).splitlines():
+        if line.startswith('# '):
+            status, _, reason = line[2:].partition(' ')
+            # The reason is followed by the content type.
+            reason = reason.rpartition(' ')[0]
+            continue
+
+        url, _, filename = line.partition('\t')
+        path = os.path.join(dirname, filename)
+
+        # "METHOD URL", then headers, then the body if there is one.
+        request = _read(path + '-request.txt')
+        first_line, _, request = request.partition('\n\n\n')
+        method, _, url = first_line.partition(' ')
+        body = None
+        if request.startswith('\n\n\n'):
+            body = request[3:]
+        elif '\n\n\n\n' in request:
+            body = request.partition('\n\n\n\n')[2]
+
+        headers = []
+        if os.path.exists(path + '-response.txt'):
+            # Optional "Time: ...", "STATUS REASON", then headers.
+            lines = _read(path + '-response.txt').split('\n\n\n', 1)
+            status, _, reason = lines[0].splitlines()[-1].partition(' ')
+            if len(lines) > 1:
+                headers = _parse_headers(lines[1].splitlines())
+
+        responses.append(RecordedResponse(method, url, body, int(status), reason, headers,
+                                          _read(path, 'rb'), filename))
+    return responses
+
+
+class _RecordedMessage(object):
+    """
+    Headers of a recorded response, as python-requests reads them to get
+    cookies from the original :mod:`httplib` response.
+    """
+
+    def __init__(self, headers):
+        self.headers = headers
+
+    def get_all(self, name, default=None):
+        values = [value for key, value in self.headers if key.lower() == name.lower()]
+        if name.lower() == 'set-cookie':
+            values = [cookie for value in values for cookie in SET_COOKIE_SPLIT_RE.split(value)]
+        return values or default
+
+    def getheaders(self, name):
+        return self.get_all(name, [])
+
+
+class _RecordedOriginalResponse(object):
+    def __init__(self, headers):
+        self.msg = _RecordedMessage(headers)
+
+    def isclosed(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class ReplayAdapter(HTTPAdapter):
+    """
+    python-requests adapter serving recorded responses instead of sending
+    requests.
+
+    A request is answered by the next response recorded for the same
+    method, URL and body. If there isn't any, because the body contains a
+    password or a timestamp for example, the method and URL are enough.
+    Once all matching responses have been served, the last one is served
+    again.
+
+    :param responses: recorded responses
+    :type responses: list[:class:`RecordedResponse`]
+    """
+
+    def __init__(self, responses):
+        super(ReplayAdapter, self).__init__()
+        self.lock = Lock()
+        self.by_request = {}
+        self.by_url = {}
+        for response in responses:
+            self.by_request.setdefault((response.method, response.url, response.body), []).append(response)
+            self.by_url.setdefault((response.method, response.url), []).append(response)
+        self.rewind()
+
+    def rewind(self):
+        """
+        Serve responses again from the first ones.
+        """
+        with self.lock:
+            self.served = {}
+            self.hits = 0
+            self.misses = 0
+
+    def _next(self, key, candidates):
+        index = self.served.get(key, 0)
+        self.served[key] = index + 1
+        return candidates[min(index, len(candidates) - 1)]
+
+    def find(self, request):
+        """
+        Get the recorded response answering a request.
+
+        :type request: :class:`requests.PreparedRequest`
+        :rtype: :class:`RecordedResponse`
+        :raises: :class:`ResponseNotRecorded`
+        """
+        with self.lock:
+            key = (request.method, request.url, _native_body(request.body))
+            if key in self.by_request:
+                self.hits += 1
+                return self._next(key, self.by_request[key])
+            key = (request.method, request.url)
+            if key in self.by_url:
+                self.hits += 1
+                return self._next(key, self.by_url[key])
+            self.misses += 1
+        raise ResponseNotRecorded('No response recorded for %s %s' % (request.method, request.url), request=request)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        recorded = self.find(request)
+
+        headers = HTTPHeaderDict()
+        for key, value in recorded.headers:
+            if key.lower() not in TRANSFER_HEADERS:
+                headers.add(key, value)
+        headers['Content-Length'] = str(len(recorded.content))
+
+        raw = HTTPResponse(body=BytesIO(recorded.content), headers=headers,
+                           status=recorded.status, reason=recorded.reason,
+                           preload_content=False, decode_content=False,
+                           original_response=_RecordedOriginalResponse(recorded.headers))
+        return self.build_response(request, raw)
+
+
+class ReplayTransport(object):
+    """
+    Transport of browsers serving responses previously saved in a
+    directory, without network access.
+
+    Responses are saved by browsers given a ``responses_dirname``, for
+    example with the ``-a`` option of applications. Giving this transport to
+    a browser (or to :class:`weboob.core.ouiboube.WebNip`, for browsers of
+    all backends) runs it again on these responses, to debug, profile or
+    test parsing offline.
+
+    :param dirname: directory of saved responses
+    :type dirname: :class:`str`
+    """
+
+    executor = None
+    """
+    Browsers use their own executor for asynchronous requests.
+    """
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        self.adapter = ReplayAdapter(load_responses(dirname))
+
+    def mount(self, session):
+        """
+        Serve recorded responses to a session.
+
+        :type session: :class:`requests.Session`
+        """
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+
+    def rewind(self):
+        """
+        Serve responses again from the first ones.
+        """
+        self.adapter.rewind()
+
+    def stats(self):
+        """
+        Get the number of requests which were answered (``hits``) or not
+        (``misses``).
+
+        :rtype: :class:`dict`
+        """
+        with self.adapter.lock:
+            return {'hits': self.adapter.hits, 'misses': self.adapter.misses}
+
+    def close(self):
+        pass
@@ -34,6 +34,8 @@ from requests.sessions import merge_setting
 from requests.structures import CaseInsensitiveDict
 from requests.utils import get_netrc_auth
 
+from .cookies import WeboobCookieJar
+
 
 def merge_hooks(request_hooks, session_hooks, dict_class=OrderedDict):
     """
@@ -75,8 +77,15 @@ class WeboobSession(Session):
             cookies = cookiejar_from_dict(cookies)
 
         # Merge with session cookies
-        merged_cookies = RequestsCookieJar()
-        merged_cookies.update(self.cookies)
+        if isinstance(self.cookies, WeboobCookieJar) and not self.headers.get('Host') and \
+           not (request.headers and request.headers.get('Host')):
+            # Only take cookies of the session which may be sent to this URL,
+            # without copying them. When there is a Host header, cookielib
+            # uses it instead of the URL host.
+            merged_cookies = self.cookies.for_url(request.url)
+        else:
+            merged_cookies = RequestsCookieJar()
+            merged_cookies.update(self.cookies)
         merged_cookies.update(cookies)
 
 
@@ -111,9 +120,11 @@ class FuturesSession(WeboobSession):
           not picklable.
 
         * If you provide both `executor` and `max_workers`, the latter is
-          ignored and provided executor is used as is.
+          ignored and provided executor is used as is. It is not shut down
+          when the session is closed.
         """
         super(FuturesSession, self).__init__(*args, **kwargs)
+        self.own_executor = executor is None
         if executor is None and ThreadPoolExecutor is not None:
             executor = ThreadPoolExecutor(max_workers=max_workers)
             # set connection pool size equal to max_workers if needed
@@ -160,5 +171,5 @@ class FuturesSession(WeboobSession):
 
     def close(self):
         super(FuturesSession, self).close()
-        if self.executor:
+        if self.executor and self.own_executor:
             self.executor.shutdown()
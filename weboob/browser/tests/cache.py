@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+
+from weboob.browser import DomainBrowser
+from weboob.browser.cache import CacheMixin, DiskCache
+
+
+class MyAdapter(BaseAdapter):
+    """
+    Serve /etag (with an ETag) and /plain (without validator) documents.
+    """
+
+    def __init__(self):
+        super(MyAdapter, self).__init__()
+        self.requested = []
+
+    def send(self, request, **kwargs):
+        self.requested.append(request.url)
+
+        response = Response()
+        response.url = request.url
+        response.request = request
+        if request.url.endswith('/etag'):
+            response.headers['ETag'] = '"v1"'
+            if request.headers.get('If-None-Match') == '"v1"':
+                response.status_code = 304
+                response._content = b''
+                return response
+        response.status_code = 200
+        response.headers['Content-Type'] = 'application/json'
+        response._content = ('{"path": "%s"}' % urlparse(request.url).path).encode('ascii')
+        return response
+
+    def close(self):
+        pass
+
+
+class MyBrowser(CacheMixin, DomainBrowser):
+    BASEURL = 'http://weboob.org/'
+
+    def __init__(self, *args, **kwargs):
+        super(MyBrowser, self).__init__(*args, **kwargs)
+        self.adapter = MyAdapter()
+        self.session.mount('http://', self.adapter)
+
+
+class CacheTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_memory(self):
+        browser = MyBrowser()
+        self.assertEqual(browser.open_with_cache('/etag').json(), {'path': '/etag'})
+        self.assertEqual(browser.open_with_cache('/etag').json(), {'path': '/etag'})
+        self.assertEqual(len(browser.adapter.requested), 2)
+
+        # Not stored without validator or TTL.
+        browser.open_with_cache('/plain')
+        browser.open_with_cache('/plain')
+        self.assertEqual(len(browser.adapter.requested), 4)
+        self.assertEqual(browser.cache_stats(), {'hits': 1, 'misses': 3, 'bytes_saved': 17})
+
+    def test_ttl(self):
+        browser = MyBrowser()
+        browser.cache_ttl = 60
+        browser.open_with_cache('/plain')
+        browser.open_with_cache('/plain')
+        self.assertEqual(len(browser.adapter.requested), 1)
+
+        browser.cache_ttl = -1
+        browser.open_with_cache('/other/plain')
+        browser.open_with_cache('/other/plain')
+        self.assertEqual(len(browser.adapter.requested), 3)
+
+    def test_disk(self):
+        browser = MyBrowser(cache=DiskCache(self.path))
+        browser.cache_ttl = 60
+        browser.open_with_cache('/etag')
+        browser.open_with_cache('/plain')
+        browser.open_with_cache('/plain', headers={'X-Foo': 'bar'})
+        browser.deinit()
+
+        # Another process, with the same store.
+        browser = MyBrowser(cache=DiskCache(self.path))
+        self.assertEqual(browser.open_with_cache('/etag').json(), {'path': '/etag'})
+        response = browser.open_with_cache('/plain')
+        self.assertEqual(response.json(), {'path': '/plain'})
+        self.assertEqual(response.headers['content-type'], 'application/json')
+        self.assertEqual(browser.adapter.requested, ['http://weboob.org/etag'])
+        # Bodies are stored once.
+        self.assertEqual(browser.cache.stats()['entries'], 3)
+        self.assertEqual(browser.cache.stats()['size'], 35)
+
+        # Namespaces are separated.
+        other = MyBrowser(cache=browser.cache, cache_namespace='other')
+        other.cache_ttl = 60
+        other.open_with_cache('/plain')
+        self.assertEqual(other.adapter.requested, ['http://weboob.org/plain'])
+        self.assertEqual(browser.cache.stats()['entries'], 4)
+        browser.cache.clear('other')
+        self.assertEqual(browser.cache.stats()['entries'], 3)
+
+    def test_disk_eviction(self):
+        browser = MyBrowser(cache=DiskCache(self.path, max_size=40))
+        browser.cache_ttl = 60
+        browser.open_with_cache('/a')
+        browser.open_with_cache('/b')
+        browser.open_with_cache('/a')
+        browser.open_with_cache('/c')
+        self.assertEqual(browser.cache.stats()['size'], 28)
+
+        # /b was the least recently used.
+        browser.open_with_cache('/a')
+        browser.open_with_cache('/c')
+        browser.open_with_cache('/b')
+        self.assertEqual(browser.adapter.requested, ['http://weboob.org/a', 'http://weboob.org/b',
+                                                     'http://weboob.org/c', 'http://weboob.org/b'])
+
+    def test_disk_same_content(self):
+        browser = MyBrowser(cache=DiskCache(self.path))
+        # Stored, but refetched each time.
+        browser.cache_ttl = -1
+        browser.open_with_cache('/plain')
+        browser.open_with_cache('/plain')
+        self.assertEqual(len(browser.adapter.requested), 2)
+        self.assertEqual(browser.cache.stats(), {'entries': 1, 'size': 18, 'max_size': browser.cache.max_size})
+
+        # The body is still there after the second store of the same content.
+        browser.is_updatable = False
+        self.assertEqual(browser.open_with_cache('/plain').json(), {'path': '/plain'})
+        self.assertEqual(len(browser.adapter.requested), 2)
+
+    def test_disk_save(self):
+        cache = DiskCache(self.path)
+        browser = MyBrowser(cache=cache)
+        browser.cache_ttl = 60
+        browser.open_with_cache('/a')
+        browser.open_with_cache('/b')
+        # Only the first store is written immediately.
+        with open(cache.index_path) as f:
+            self.assertEqual(len(json.load(f)['entries']), 1)
+
+        browser.deinit()
+        with open(cache.index_path) as f:
+            self.assertEqual(len(json.load(f)['entries']), 2)
+        self.assertEqual(len(os.listdir(os.path.join(self.path, 'objects'))), 2)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from requests import Request
+from requests.cookies import RequestsCookieJar, create_cookie
+
+from weboob.browser.cookies import WeboobCookieJar
+from weboob.browser.sessions import WeboobSession
+
+
+class CookiesForUrlTest(TestCase):
+    DOMAINS = ['', 'bank.fr', '.bank.fr', 'www.bank.fr', '.www.bank.fr', 'ank.fr',
+               '.fr', 'other.fr', 'localhost', '.local', '127.0.0.1']
+    PATHS = ['/', '/a', '/a/b', '/b']
+    URLS = ['http://www.bank.fr/a/b', 'https://www.bank.fr/', 'http://bank.fr:8080/a',
+            'http://sub.www.bank.fr/b', 'http://localhost/', 'http://127.0.0.1:5000/a',
+            'http://other.fr/', u'http://\xe9t\xe9.fr/']
+
+    def setUp(self):
+        self.jar = WeboobCookieJar()
+        i = 0
+        for domain in self.DOMAINS:
+            for path in self.PATHS:
+                for secure in (False, True):
+                    self.jar.set_cookie(create_cookie('c%d' % i, 'v%d' % i, domain=domain, path=path, secure=secure))
+                    i += 1
+
+    def get_cookies(self, jar, url):
+        session = WeboobSession()
+        session.cookies = jar
+        header = session.prepare_request(Request('GET', url, cookies={'foo': 'bar'})).headers.get('Cookie', '')
+        return sorted(header.split('; '))
+
+    def test_same_cookies(self):
+        full_jar = RequestsCookieJar()
+        full_jar.update(self.jar)
+        for url in self.URLS:
+            self.assertEqual(self.get_cookies(self.jar, url), self.get_cookies(full_jar, url))
+
+    def test_not_copied(self):
+        jar = self.jar.for_url('http://www.bank.fr/')
+        self.assertNotIn('other.fr', jar._cookies)
+        self.assertIs(jar._cookies['.bank.fr']['/']['c16'], self.jar._cookies['.bank.fr']['/']['c16'])
+
+        jar.set_cookie(create_cookie('new', 'value', domain='.bank.fr'))
+        self.assertNotIn('new', self.jar._cookies['.bank.fr']['/'])
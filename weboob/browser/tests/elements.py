@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+from unittest import TestCase
+
+import lxml.html
+from requests.models import Response
+
+from weboob.browser.elements import ItemElement, ListElement, TableElement, method, _SimpleXPathMatcher
+from weboob.browser.pages import HTMLPage
+from weboob.browser.filters.standard import CleanText, Env
+from weboob.capabilities.base import BaseObject, StringField
+
+
+class MyObject(BaseObject):
+    path = StringField('Path')
+
+
+class MyPage(object):
+    browser = None
+
+    def __init__(self, doc, params):
+        self.doc = doc
+        self.params = params
+
+
+class MyList(ListElement):
+    item_xpath = '//li'
+
+    class item(ItemElement):
+        klass = MyObject
+
+        obj_id = CleanText('.')
+        obj_url = Env('url')
+
+        def obj_path(self):
+            self.env['path'].append(self.obj.id)
+            return u'/'.join(self.env['path'])
+
+        def load_foo(self):
+            return 42
+
+
+class ElementsTest(TestCase):
+    def setUp(self):
+        self.doc = lxml.html.fromstring('<ul><li>a</li><li>b</li></ul>')
+
+    def test_env_copy_on_write(self):
+        params = {'path': ['root'], 'url': u'http://weboob.org'}
+        objs = list(MyList(MyPage(self.doc, params))())
+        self.assertEqual([obj.path for obj in objs], [u'root/a', u'root/b'])
+        self.assertEqual([obj.url for obj in objs], [params['url']] * 2)
+        self.assertEqual(params['path'], ['root'])
+
+    def test_plan(self):
+        self.assertEqual(MyList._get_plan().elements, ['item'])
+        self.assertEqual(MyList.item._get_plan().loaders, [('foo', 'load_foo')])
+        self.assertEqual([attr for attr, _ in MyList.item._get_plan().attrs], ['id', 'url', 'path'])
+
+
+class MyBrowser(object):
+    logger = None
+
+
+class StreamList(ListElement):
+    item_xpath = '//table[@id="list"]/tr'
+    stream = True
+
+    class item(ItemElement):
+        klass = MyObject
+
+        obj_id = CleanText('./td[1]')
+        obj_path = CleanText('./td[2]')
+
+
+class StreamPage(HTMLPage):
+    LAZY_DOC = True
+
+    iter_items = method(StreamList)
+
+
+class FallbackStreamPage(StreamPage):
+    @method
+    class iter_items(StreamList):
+        # Not a simple path, so the document is built.
+        item_xpath = '//table[@id="list"]/tr[td]'
+
+
+class NotLazyStreamPage(StreamPage):
+    LAZY_DOC = False
+
+
+class ParseStreamPage(StreamPage):
+    @method
+    class iter_items(StreamList):
+        def parse(self, el):
+            self.env['title'] = CleanText('//title')(el)
+
+        class item(StreamList.item):
+            obj_path = Env('title')
+
+
+class TableStreamPage(StreamPage):
+    @method
+    class iter_items(TableElement):
+        stream = True
+        item_xpath = '//table[@id="list"]/tr'
+        head_xpath = '//table[@id="list"]/tr[1]/td'
+
+        class item(StreamList.item):
+            pass
+
+
+class Handler(logging.Handler):
+    def __init__(self):
+        super(Handler, self).__init__(logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def build_page(klass, data, encoding=None):
+    response = Response()
+    response.status_code = 200
+    response.url = 'http://weboob.org/'
+    response._content = data
+    response.encoding = encoding
+    return klass(MyBrowser(), response)
+
+
+class StreamTest(TestCase):
+    def setUp(self):
+        rows = u''.join(u'<tr><td>%d</td><td>é%d</td></tr>' % (i, i) for i in range(50))
+        self.data = (u'<html><head><meta charset="utf-8"><title>t</title></head><body>'
+                     u'<table id="other"><tr><td>x</td><td>x</td></tr></table>'
+                     u'<table id="list">%s</table></body></html>' % rows).encode('utf-8')
+
+    def test_detect_encoding(self):
+        page = build_page(HTMLPage, self.data, encoding='ISO-8859-1')
+        self.assertEqual(page.encoding, 'utf-8')
+        self.assertEqual(page.doc.xpath('//tr[2]/td[2]')[0].text, u'é1')
+
+    def test_detect_http_equiv(self):
+        data = self.data.replace(b'<meta charset="utf-8">',
+                                 b'<meta http-equiv="Content-Type" content="text/html; charset=\'utf-8\'">')
+        page = build_page(HTMLPage, data, encoding='ISO-8859-1')
+        self.assertEqual(page.encoding, 'utf-8')
+
+        # A declaration after the head is ignored.
+        data = self.data.replace(b'<meta charset="utf-8">', b'').replace(b'<body>', b'<body><meta charset="utf-8">')
+        page = build_page(HTMLPage, data, encoding='ISO-8859-1')
+        self.assertEqual(page.encoding, 'ISO-8859-1')
+
+    def test_lazy_doc(self):
+        page = build_page(StreamPage, self.data)
+        self.assertNotIn('doc', vars(page))
+        self.assertEqual(page.doc.xpath('//tr[2]/td[2]')[0].text, u'é1')
+        self.assertIn('doc', vars(page))
+        self.assertRaises(AttributeError, getattr, page, 'foo')
+
+    def test_stream_fallback(self):
+        expected = [(u'%d' % i, u'é%d' % i) for i in range(50)]
+        for klass in (FallbackStreamPage, NotLazyStreamPage):
+            page = build_page(klass, self.data)
+            self.assertEqual([(obj.id, obj.path) for obj in page.iter_items()], expected)
+            self.assertIn('doc', vars(page))
+
+    def test_stream_unsupported(self):
+        handler = Handler()
+        logging.getLogger().addHandler(handler)
+        try:
+            page = build_page(ParseStreamPage, self.data)
+            self.assertEqual([(obj.id, obj.path) for obj in page.iter_items()],
+                             [(u'%d' % i, u't') for i in range(50)])
+            page = build_page(TableStreamPage, self.data)
+            self.assertEqual(len(list(page.iter_items())), 50)
+        finally:
+            logging.getLogger().removeHandler(handler)
+        self.assertEqual(handler.messages, ['iter_items is not streamed, as parse() would not get the page content',
+                                            'iter_items is not streamed, as the header of the table is read first'])
+
+    def test_stream(self):
+        page = build_page(StreamPage, self.data)
+        objs = list(page.iter_items())
+        self.assertNotIn('doc', vars(page))
+        self.assertEqual([(obj.id, obj.path) for obj in objs],
+                         [(u'%d' % i, u'é%d' % i) for i in range(50)])
+
+        # Same results when the document is already built.
+        page.doc
+        self.assertEqual([(obj.id, obj.path) for obj in page.iter_items()],
+                         [(obj.id, obj.path) for obj in objs])
+
+    def test_matcher(self):
+        doc = lxml.html.fromstring(self.data)
+        for expression in ('//tr', '//table[@id="list"]/tr', "//body/table[@id='list']//td",
+                           '/html/body/*/tr', '//table[@id]/tr'):
+            matcher = _SimpleXPathMatcher.compile(expression)
+            self.assertEqual([el for el in doc.iter() if matcher.match(el)], doc.xpath(expression))
+
+        for expression in ('//tr[1]', '//tr/text()', 'tr', '//a | //b'):
+            self.assertIsNone(_SimpleXPathMatcher.compile(expression))
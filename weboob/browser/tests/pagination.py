@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+import re
+from threading import Lock
+from time import sleep
+from unittest import TestCase
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+
+from weboob.browser import PagesBrowser, URL
+from weboob.browser.pages import HTMLPage, NextPage, pagination
+
+
+def next_url(url):
+    return re.sub(r'\d+', lambda m: str(int(m.group(0)) + 1), url)
+
+
+class MyPage(HTMLPage):
+    def iter_values(self):
+        for el in self.doc.xpath('//li'):
+            yield el.text
+        for link in self.doc.xpath('//a'):
+            raise NextPage(link.attrib['href'])
+
+    @pagination(predict=next_url, prefetch=3)
+    def iter_prefetched_values(self):
+        return self.iter_values()
+
+
+class MyResponse(Response):
+    def close(self):
+        self.adapter.closed.append(self.url)
+
+
+class MyAdapter(BaseAdapter):
+    """
+    Serve pages list-1.html to list-N.html. Page 3 links to page 5 instead of
+    page 4, to check mispredictions.
+    """
+
+    def __init__(self, pages):
+        super(MyAdapter, self).__init__()
+        self.pages = pages
+        self.lock = Lock()
+        self.requested = []
+        self.closed = []
+
+    def send(self, request, **kwargs):
+        with self.lock:
+            self.requested.append(request.url)
+        sleep(0.01)
+        num = int(re.search(r'list-(\d+)', request.url).group(1))
+        links = ''
+        if num < self.pages:
+            links = '<a href="list-%d.html">next</a>' % (5 if num == 3 else num + 1)
+
+        response = MyResponse()
+        response.adapter = self
+        response.status_code = 200
+        response.url = request.url
+        response.request = request
+        response.headers['Content-Type'] = 'text/html'
+        response._content = ('<html><body><ul><li>%d-a</li><li>%d-b</li></ul>%s</body></html>' % (num, num, links)).encode('ascii')
+        return response
+
+    def close(self):
+        pass
+
+
+class MyBrowser(PagesBrowser):
+    BASEURL = 'http://example.org/'
+    list = URL(r'/list-(?P<num>\d+)\.html', MyPage)
+
+
+class PrefetchPaginationTest(TestCase):
+    def get_browser(self, pages=8):
+        browser = MyBrowser()
+        browser.adapter = MyAdapter(pages)
+        browser.session.mount('http://', browser.adapter)
+        browser.list.go(num=1)
+        return browser
+
+    def test_same_results(self):
+        browser = self.get_browser()
+        expected = list(browser.pagination(lambda: browser.page.iter_values()))
+        self.assertEqual(expected[:6], ['1-a', '1-b', '2-a', '2-b', '3-a', '3-b'])
+        self.assertEqual(expected[6:8], ['5-a', '5-b'])
+
+        browser = self.get_browser()
+        values = list(browser.prefetch_pagination(lambda: browser.page.iter_values(), next_url, 3))
+        self.assertEqual(values, expected)
+        self.assertEqual(browser.url, 'http://example.org/list-8.html')
+
+        # Page 4 has been requested by speculation.
+        self.assertIn('http://example.org/list-4.html', browser.adapter.requested)
+
+    def test_decorator(self):
+        browser = self.get_browser()
+        expected = list(browser.pagination(lambda: browser.page.iter_values()))
+
+        browser = self.get_browser()
+        self.assertEqual(list(browser.page.iter_prefetched_values()), expected)
+
+    def test_no_prediction(self):
+        browser = self.get_browser()
+        expected = list(browser.pagination(lambda: browser.page.iter_values()))
+
+        browser = self.get_browser()
+        values = list(browser.prefetch_pagination(lambda: browser.page.iter_values(), lambda url: None))
+        self.assertEqual(values, expected)
+        self.assertNotIn('http://example.org/list-4.html', browser.adapter.requested)
+
+    def test_cancel(self):
+        browser = self.get_browser()
+        values = browser.prefetch_pagination(lambda: browser.page.iter_values(), next_url, 3)
+        self.assertEqual(next(values), '1-a')
+        values.close()
+        browser.session.executor.shutdown()
+
+        # Responses of prefetched pages which are not used are closed, even
+        # if the request was already sent.
+        prefetched = [url for url in browser.adapter.requested if not url.endswith('list-1.html')]
+        self.assertTrue(prefetched)
+        self.assertEqual(sorted(browser.adapter.closed), sorted(prefetched))
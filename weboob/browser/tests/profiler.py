@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from decimal import Decimal
+import shutil
+import tempfile
+from unittest import TestCase
+
+import lxml.html
+
+from weboob.browser.elements import ItemElement, ListElement
+from weboob.browser.filters.standard import CleanText, CleanDecimal, Regexp
+from weboob.browser.profiler import FilterProfiler
+from weboob.capabilities.base import BaseObject, DecimalField, StringField
+
+
+class MyObject(BaseObject):
+    label = StringField('Label')
+    amount = DecimalField('Amount')
+
+
+class MyPage(object):
+    browser = None
+    params = None
+
+    def __init__(self, doc):
+        self.doc = doc
+
+
+class MyList(ListElement):
+    item_xpath = '//li'
+
+    class item(ItemElement):
+        klass = MyObject
+
+        obj_id = Regexp(CleanText('./@id'), r'op-(\d+)')
+        obj_label = CleanText('./span[1]')
+        obj_amount = CleanDecimal('./span[2]', replace_dots=True)
+
+        def obj_url(self):
+            return u'http://weboob.org/%s' % self.obj.id
+
+
+class FilterProfilerTest(TestCase):
+    def setUp(self):
+        self.page = MyPage(lxml.html.fromstring(
+            '<ul>%s</ul>' % ''.join('<li id="op-%d"><span>Op %d</span><span>1 234,%02d</span></li>' % (i, i, i)
+                                    for i in range(10))))
+
+    def test_disabled(self):
+        profiler = FilterProfiler()
+        self.assertEqual(len(list(MyList(self.page)())), 10)
+        self.assertIsNone(FilterProfiler.active)
+        self.assertEqual(profiler.get_stats(), {})
+
+    def test_stats(self):
+        with FilterProfiler() as profiler:
+            objs = list(MyList(self.page)())
+        self.assertIsNone(FilterProfiler.active)
+        self.assertEqual(objs[3].amount, Decimal('1234.03'))
+
+        stats = profiler.get_stats()
+        self.assertEqual(sorted(key for key in stats if key[0] == 'MyList.item.id'),
+                         [('MyList.item.id', ''), ('MyList.item.id', 'CleanText'),
+                          ('MyList.item.id', 'Regexp'), ('MyList.item.id', 'xpath')])
+        self.assertEqual(stats[('MyList.item.amount', 'CleanDecimal')][0], 10)
+        self.assertEqual(stats[('MyList.item.amount', 'xpath')][0], 10)
+        self.assertEqual(stats[('MyList.item.url', 'obj_url')][0], 10)
+        self.assertGreaterEqual(stats[('MyList.item.id', '')][1], stats[('MyList.item.id', 'Regexp')][1])
+
+        # Cumulative time includes the time of inner frames.
+        calls, cumulative, self_time = stats[('MyList.item.id', 'Regexp')]
+        self.assertGreaterEqual(cumulative, self_time + stats[('MyList.item.id', 'CleanText')][1] * 0.99)
+
+        report = profiler.report()
+        self.assertIn('MyList.item.amount', report)
+        self.assertIn('XPath selection', report)
+
+        stacks = list(profiler.iter_stacks())
+        self.assertIn('MyList.item.id;Regexp;CleanText;xpath', [line.rsplit(' ', 1)[0] for line in stacks])
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'stacks')
+            profiler.dump_stacks(filename)
+            with open(filename) as f:
+                self.assertEqual(f.read().splitlines(), stacks)
+        finally:
+            shutil.rmtree(tmpdir)
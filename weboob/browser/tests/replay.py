@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import shutil
+import tempfile
+from io import BytesIO
+from threading import Thread
+from unittest import TestCase
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from weboob.browser import Browser
+from weboob.browser.replay import ReplayTransport, ResponseNotRecorded
+
+
+class MyHandler(BaseHTTPRequestHandler):
+    counter = 0
+
+    def do_GET(self):
+        if self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/cookie')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/cookie':
+            self.send(b'cookie', [('Set-Cookie', 'a=1; Path=/'), ('Set-Cookie', 'b=2; Path=/; Expires=Wed, 09 Jun 2100 10:18:14 GMT')])
+        elif self.path == '/gzip':
+            buf = BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                f.write(b'compressed')
+            self.send(buf.getvalue(), [('Content-Encoding', 'gzip')])
+        else:
+            MyHandler.counter += 1
+            self.send(('count %d' % MyHandler.counter).encode('ascii'))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.send(b'posted ' + body)
+
+    def send(self, content, headers=()):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(content)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class ReplayTest(TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        server = HTTPServer(('127.0.0.1', 0), MyHandler)
+        thread = Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:%d' % server.server_address[1]
+
+        MyHandler.counter = 0
+        browser = Browser(responses_dirname=self.dirname)
+        try:
+            self.recorded = [browser.open(self.url + path, data=data)
+                             for path, data in (('/count', None), ('/count', None), ('/redirect', None),
+                                                ('/gzip', None), ('/post', {'a': 'b'}), ('/post', {'a': 'c'}))]
+        finally:
+            browser.deinit()
+            server.shutdown()
+            server.server_close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def test_replay(self):
+        transport = ReplayTransport(self.dirname)
+        browser = Browser(transport=transport)
+
+        self.assertEqual(browser.open(self.url + '/count').text, u'count 1')
+        self.assertEqual(browser.open(self.url + '/count').text, u'count 2')
+        # The last matching response is served again.
+        self.assertEqual(browser.open(self.url + '/count').text, u'count 2')
+
+        response = browser.open(self.url + '/redirect')
+        self.assertEqual(response.url, self.url + '/cookie')
+        self.assertEqual(response.history[0].status_code, 302)
+        self.assertEqual(browser.session.cookies.get('a'), '1')
+        self.assertEqual(browser.session.cookies.get('b'), '2')
+
+        self.assertEqual(browser.open(self.url + '/gzip').content, b'compressed')
+        self.assertEqual(browser.open(self.url + '/post', data={'a': 'c'}).text, u'posted a=c')
+        self.assertEqual(browser.open(self.url + '/post', data={'a': 'b'}).text, u'posted a=b')
+        # Unknown body, only method and URL are matched.
+        self.assertEqual(browser.open(self.url + '/post', data={'a': 'd'}).text, u'posted a=b')
+
+        self.assertRaises(ResponseNotRecorded, browser.open, self.url + '/unknown')
+        self.assertEqual(transport.stats(), {'hits': 9, 'misses': 1})
+
+        transport.rewind()
+        self.assertEqual(browser.open(self.url + '/count').text, u'count 1')
+        self.assertEqual(browser.open(self.url + '/count', is_async=True).result().text, u'count 2')
+        browser.deinit()
@@ -118,6 +118,15 @@ class URLTest(TestCase):
         res = self.myBrowser.urlSameParams.build(id=2, name="weboob")
         self.assertEquals(res, "http://test.com?id=2&name=weboob")
 
+    # Checks that build picks the pattern which takes exactly the given
+    # parameters, even if it is not the first one
+    def test_build_urlSameParams_select(self):
+        res = self.myBrowser.urlSameParams.build(id=2)
+        self.assertEquals(res, "http://test.com/2")
+        self.myBrowser.urlSameParams.urls.insert(0, "http://test.com/item")
+        res = self.myBrowser.urlSameParams.build()
+        self.assertEquals(res, "http://test.com/item")
+
     # Checks that an exception is raised when a parameter is missing
     # (here, the parameter name)
     def test_build_urlParams_KO_missedparams(self):
@@ -135,3 +144,20 @@ class URLTest(TestCase):
         self.assertRaisesRegexp(AssertionError, "You can use this method" +
                                 " only if there is a Page class handler.",
                                 self.myBrowser.urlRegex.is_here, id=2)
+
+    # Check that URLs with a page class matching an url are returned in the
+    # declaration order
+    def test_iter_matching_urls(self):
+        res = list(self.myBrowser.iter_matching_urls("http://weboob.org/foo"))
+        self.assertEqual(res, [self.myBrowser.urlIsHere])
+        res = list(self.myBrowser.iter_matching_urls("http://free.fr/"))
+        self.assertEqual(res, [self.myBrowser.urlIsHereDifKlass])
+        res = list(self.myBrowser.iter_matching_urls("http://weboob2.org/"))
+        self.assertEqual(res, [])
+
+    # Check that the index is updated when regexps of an URL change
+    def test_iter_matching_urls_changed(self):
+        self.myBrowser.urlIsHereDifKlass.urls.insert(0, "http://weboob\.org/(?P<id>\d+)")
+        res = list(self.myBrowser.iter_matching_urls("http://weboob.org/42"))
+        self.assertEqual(res, [self.myBrowser.urlIsHere, self.myBrowser.urlIsHereDifKlass])
+        self.assertEqual(self.myBrowser.urlIsHereDifKlass.match("http://weboob.org/42").group('id'), '42')
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+import lxml.html
+
+from weboob.browser.filters.standard import CleanText
+from weboob.browser.xpath import XPathCache, xpath, xpath_cache
+
+
+class XPathCacheTest(TestCase):
+    def setUp(self):
+        self.root = lxml.html.fromstring('<ul><li class="a">1</li><li>2</li></ul>')
+
+    def test_hits(self):
+        cache = XPathCache()
+        cache.get('//li')
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertIs(cache.get('//li'), cache.get('//li'))
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertIsNot(cache.get('//li', namespaces={'x': 'urn:x'}), cache.get('//li'))
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_max_entries(self):
+        cache = XPathCache(max_entries=2)
+        for expr in ('//a', '//b', '//c'):
+            cache.get(expr)
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_same_results(self):
+        for expr in ('//li', '//li/text()', 'count(//li)', '//li[@class="a"]'):
+            self.assertEqual(xpath(self.root, expr), self.root.xpath(expr))
+        self.assertEqual(xpath(self.root, '//li[text()=$v]', v='2'), self.root.xpath('//li[text()=$v]', v='2'))
+
+    def test_filters(self):
+        f = CleanText('//li[1]')
+        hits = xpath_cache.stats()['hits']
+        self.assertEqual(f(self.root), u'1')
+        self.assertEqual(f(self.root), u'1')
+        self.assertGreater(xpath_cache.stats()['hits'], hits)
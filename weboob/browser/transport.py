@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+from threading import Condition, Lock
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+from requests.adapters import HTTPAdapter
+
+
+__all__ = ['SharedTransport', 'SharedHTTPAdapter']
+
+
+class SharedHTTPAdapter(HTTPAdapter):
+    """
+    HTTP adapter mounted on sessions of several browsers.
+
+    Requests wait for a slot in the :class:`SharedTransport` before being
+    sent, and closing a session does not close the connection pools, which
+    are owned by the transport.
+
+    Requests are sent with the pools of this adapter when they verify
+    certificates with the default bundle and without a client certificate.
+    For other TLS settings (see :attr:`weboob.browser.browsers.Browser.VERIFY`),
+    each set of settings has pools of its own. A pool keeps the settings of
+    the last request sent on it, and a connection kept alive is not verified
+    again, so a connection opened without verification must never be given
+    to a browser which requires it.
+    """
+
+    DEFAULT_TLS = (True, None)
+
+    def __init__(self, transport, *args, **kwargs):
+        self.transport = transport
+        self.adapter_args = (args, kwargs)
+        self.adapters = {self.DEFAULT_TLS: self}
+        self.adapters_lock = Lock()
+        super(SharedHTTPAdapter, self).__init__(*args, **kwargs)
+
+    def get_adapter(self, verify, cert):
+        """
+        Get the adapter whose pools are used by requests with these TLS
+        settings.
+
+        :param verify: verify argument of :meth:`send`
+        :param cert: cert argument of :meth:`send`
+        :rtype: :class:`requests.adapters.HTTPAdapter`
+        """
+        if isinstance(cert, list):
+            cert = tuple(cert)
+        key = (verify, cert)
+        with self.adapters_lock:
+            adapter = self.adapters.get(key)
+            if adapter is None:
+                args, kwargs = self.adapter_args
+                adapter = self.adapters[key] = HTTPAdapter(*args, **kwargs)
+            return adapter
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        adapter = self.get_adapter(verify, cert)
+        if adapter is self:
+            send = super(SharedHTTPAdapter, self).send
+        else:
+            send = adapter.send
+        with self.transport.slot(urlparse(request.url).netloc.lower()):
+            return send(request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+
+    def iter_managers(self):
+        """
+        Iterate on pool managers of all TLS settings.
+        """
+        with self.adapters_lock:
+            adapters = list(self.adapters.values())
+        for adapter in adapters:
+            yield adapter.poolmanager
+            for manager in adapter.proxy_manager.values():
+                yield manager
+
+    def close(self):
+        # Called when a session is closed, but pools are still used by
+        # other browsers. See SharedTransport.close().
+        pass
+
+    def close_pools(self):
+        with self.adapters_lock:
+            adapters = [adapter for adapter in self.adapters.values() if adapter is not self]
+        for adapter in adapters:
+            adapter.close()
+        super(SharedHTTPAdapter, self).close()
+
+
+class SharedTransport(object):
+    """
+    Executor and HTTP connection pools shared by several browsers.
+
+    By default, each browser has its own executor for asynchronous requests
+    and its own connection pools. When a lot of browsers are used in the
+    same process, this is a lot of idle threads, and connections to a same
+    host are not reused across browsers.
+
+    Browsers given a transport (see :attr:`weboob.browser.browsers.Browser.TRANSPORT`)
+    still have their own session, so cookies, headers and profile are not
+    shared, but asynchronous requests are run by :attr:`executor` and
+    connections are taken from the same per-host pools.
+
+    The number of requests sent at the same time can be limited globally
+    and per host. Other requests wait for a slot. A request holds its slot
+    until its response is received; the body of a response requested with
+    ``stream=True`` is read afterwards, so such reads are not limited.
+
+    :param max_workers: maximum number of threads running asynchronous requests
+    :type max_workers: :class:`int`
+    :param max_connections: maximum number of requests sent at the same time
+                            (None for no limit)
+    :type max_connections: :class:`int`
+    :param max_host_connections: maximum number of requests sent at the same
+                                 time to a host, and number of connections
+                                 kept alive per host (None for no limit)
+    :type max_host_connections: :class:`int`
+    :param max_hosts: number of hosts for which connections are kept alive
+    :type max_hosts: :class:`int`
+    :param max_retries: number of retries of failed connections
+    :type max_retries: :class:`int`
+    """
+
+    def __init__(self, max_workers=10, max_connections=100, max_host_connections=10,
+                 max_hosts=100, max_retries=2):
+        self.max_workers = max_workers
+        self.max_connections = max_connections
+        self.max_host_connections = max_host_connections
+
+        self.cond = Condition(Lock())
+        self.active = {}
+        self.active_total = 0
+        self.requests = {}
+        self.waits = 0
+
+        self.adapter = SharedHTTPAdapter(self, pool_connections=max_hosts,
+                                         pool_maxsize=max_host_connections or 10,
+                                         max_retries=max_retries)
+        self._executor = None
+
+    @property
+    def executor(self):
+        """
+        Executor running asynchronous requests of all browsers. It is
+        created on first use.
+        """
+        with self.cond:
+            if self._executor is None and ThreadPoolExecutor is not None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def mount(self, session):
+        """
+        Use shared connection pools in a session.
+
+        :type session: :class:`requests.Session`
+        """
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+
+    def _is_full(self, host):
+        if self.max_connections is not None and self.active_total >= self.max_connections:
+            return True
+        if self.max_host_connections is not None and self.active.get(host, 0) >= self.max_host_connections:
+            return True
+        return False
+
+    @contextmanager
+    def slot(self, host):
+        """
+        Wait until a request can be sent to a host.
+
+        The slot is released once the response headers are received, not
+        when the body has been read.
+
+        :param host: network location of the request
+        :type host: :class:`str`
+        """
+        with self.cond:
+            if self._is_full(host):
+                self.waits += 1
+                while self._is_full(host):
+                    self.cond.wait()
+            self.active[host] = self.active.get(host, 0) + 1
+            self.active_total += 1
+            self.requests[host] = self.requests.get(host, 0) + 1
+
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.active[host] -= 1
+                if not self.active[host]:
+                    del self.active[host]
+                self.active_total -= 1
+                self.cond.notify_all()
+
+    def stats(self):
+        """
+        Get a snapshot of the transport state.
+
+        ``pools`` gives, for each host, the number of connections opened
+        and of requests sent on them.
+
+        :rtype: :class:`dict`
+        """
+        pools = {}
+        for manager in self.adapter.iter_managers():
+            for key in manager.pools.keys():
+                pool = manager.pools.get(key)
+                if pool is None:
+                    continue
+                # Pools of a same host with different TLS settings are summed.
+                stats = pools.setdefault('%s://%s:%s' % (pool.scheme, pool.host, pool.port),
+                                         {'connections': 0, 'requests': 0})
+                stats['connections'] += pool.num_connections
+                stats['requests'] += pool.num_requests
+
+        with self.cond:
+            executor = self._executor
+            return {'active': dict(self.active),
+                    'active_total': self.active_total,
+                    'requests': dict(self.requests),
+                    'waits': self.waits,
+                    'workers': len(executor._threads) if executor is not None else 0,
+                    'pools': pools,
+                   }
+
+    def close(self):
+        """
+        Close all connections and stop the executor.
+        """
+        self.adapter.close_pools()
+        with self.cond:
+            executor = self._executor
+            self._executor = None
+        if executor is not None:
+            executor.shutdown()
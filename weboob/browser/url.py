@@ -35,6 +35,59 @@ class UrlNotResolvable(Exception):
     """
 
 
+def uncapture(regex):
+    r"""
+    Turn every group of a regexp into a non-capturing group, so that it can
+    be combined with other regexps in an alternation.
+
+    Return None if it is not possible, because of back references or
+    inline flags.
+
+    >>> uncapture(r'https://weboob\.org/(?P<id>\d+)/(a|b)')
+    'https://weboob\\.org/(?:\\d+)/(?:a|b)'
+    >>> uncapture(r'(?P<x>a)(?P=x)') is None
+    True
+    """
+    out = []
+    i = 0
+    while i < len(regex):
+        c = regex[i]
+        if c == '\\':
+            if regex[i + 1:i + 2].isdigit():
+                return None
+            out.append(regex[i:i + 2])
+            i += 2
+        elif c == '[':
+            # Copy character class, where "]" may be the first character.
+            j = i + 1
+            if regex[j:j + 1] == '^':
+                j += 1
+            if regex[j:j + 1] == ']':
+                j += 1
+            while j < len(regex) and regex[j] != ']':
+                if regex[j] == '\\':
+                    j += 1
+                j += 1
+            out.append(regex[i:j + 1])
+            i = j + 1
+        elif regex.startswith('(?P<', i):
+            out.append('(?:')
+            i = regex.index('>', i) + 1
+        elif regex.startswith('(?', i):
+            if regex[i + 2:i + 3] not in (':', '=', '!', '<'):
+                # Back reference or inline flags.
+                return None
+            out.append('(?')
+            i += 2
+        elif c == '(':
+            out.append('(?:')
+            i += 1
+        else:
+            out.append(c)
+            i += 1
+    return ''.join(out)
+
+
 class URL(object):
     """
     A description of an URL on the PagesBrowser website.
@@ -43,6 +96,8 @@ class URL(object):
     class which is instancied by PagesBrowser.open if the page matches a regex.
     """
     _creation_counter = 0
+    _regexps_cache = None
+    _build_cache = None
 
     def __init__(self, *args):
         self.urls = []
@@ -57,6 +112,33 @@ class URL(object):
         self._creation_counter = URL._creation_counter
         URL._creation_counter += 1
 
+    def __getstate__(self):
+        # Compiled regexps can't be copied on Python 2.
+        state = self.__dict__.copy()
+        state.pop('_regexps_cache', None)
+        state.pop('_build_cache', None)
+        return state
+
+    def get_regexps(self, base):
+        """
+        Get the compiled regexps of this URL, relative ones being resolved
+        with *base*.
+
+        They are compiled once, as long as *base* and :attr:`urls` do not
+        change.
+
+        :rtype: list
+        """
+        cache = self._regexps_cache
+        if cache is None or cache[0] != base or cache[1] != self.urls:
+            regexps = []
+            for regex in self.urls:
+                if not re.match(r'^[\w\?]+://.*', regex):
+                    regex = re.escape(base).rstrip('/') + '/' + regex.lstrip('/')
+                regexps.append(re.compile(regex))
+            cache = self._regexps_cache = (base, list(self.urls), regexps)
+        return cache[2]
+
     def is_here(self, **kwargs):
         """
         Returns True if the current page of browser matches this URL.
@@ -127,33 +209,57 @@ class URL(object):
         """
         browser = kwargs.pop('browser', self.browser)
         params = kwargs.pop('params', None)
-        patterns = []
-        for url in self.urls:
-            patterns += normalize(url)
-
-        for pattern, _ in patterns:
-            url = pattern
-            # only use full-name substitutions, to allow % in URLs
-            args = kwargs.copy()
-            for key in args.keys():  # need to use keys() because of pop()
-                search = '%%(%s)s' % key
-                if search in pattern:
-                    url = url.replace(search, to_unicode(args.pop(key)))
-            # if there are named substitutions left, ignore pattern
-            if re.search('%\([A-z_]+\)s', url):
-                continue
-            # if not all args were used
-            if len(args):
-                continue
-
-            url = browser.absurl(url, base=True)
-            if params:
-                p = requests.models.PreparedRequest()
-                p.prepare_url(url, params)
-                url = p.url
-            return url
-
-        raise UrlNotResolvable('Unable to resolve URL with %r. Available are %s' % (kwargs, ', '.join([pattern for pattern, _ in patterns])))
+
+        try:
+            segments = self.get_templates()[frozenset(kwargs)]
+        except KeyError:
+            raise UrlNotResolvable('Unable to resolve URL with %r. Available are %s' % (kwargs, ', '.join(self.get_patterns())))
+
+        # Even items are literal strings, odd ones are names of parameters.
+        # Only use full-name substitutions, to allow % in URLs.
+        url = u''.join([segment if i % 2 == 0 else to_unicode(kwargs[segment])
+                        for i, segment in enumerate(segments)])
+
+        url = browser.absurl(url, base=True)
+        if params:
+            p = requests.models.PreparedRequest()
+            p.prepare_url(url, params)
+            url = p.url
+        return url
+
+    def get_patterns(self):
+        """
+        Get the patterns of urls this URL can build, in the order they are
+        tried, as returned by :func:`weboob.tools.regex_helper.normalize`.
+
+        :rtype: list[:class:`str`]
+        """
+        return self._get_build_cache()[1]
+
+    def get_templates(self):
+        """
+        Get the templates used by :meth:`build`, by set of parameters names.
+
+        Templates are lists of alternating literal strings and names of
+        parameters. When several patterns take the same parameters, the
+        first one is used.
+
+        :rtype: dict
+        """
+        return self._get_build_cache()[2]
+
+    def _get_build_cache(self):
+        cache = self._build_cache
+        if cache is None or cache[0] != self.urls:
+            patterns = []
+            templates = {}
+            for url in self.urls:
+                for pattern, names in normalize(url):
+                    patterns.append(pattern)
+                    segments = re.split(r'%\(([A-z_]\w*)\)s', pattern)
+                    templates.setdefault(frozenset(segments[1::2]), segments)
+            cache = self._build_cache = (list(self.urls), patterns, templates)
+        return cache
 
     def match(self, url, base=None):
         """
@@ -163,10 +269,8 @@ class URL(object):
             assert self.browser is not None
             base = self.browser.BASEURL
 
-        for regex in self.urls:
-            if not re.match(r'^[\w\?]+://.*', regex):
-                regex = re.escape(base).rstrip('/') + '/' + regex.lstrip('/')
-            m = re.match(regex, url)
+        for regex in self.get_regexps(base):
+            m = regex.match(url)
             if m:
                 return m
 
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from itertools import count
+from threading import Lock
+
+from lxml import etree
+
+
+__all__ = ['XPathCache', 'xpath', 'xpath_cache']
+
+
+class XPathCache(object):
+    """
+    LRU cache of compiled :class:`lxml.etree.XPath` objects.
+
+    Calling ``el.xpath(expression)`` compiles the expression on each call,
+    which is what filters and elements do for every row of every table. This
+    cache compiles each expression once.
+
+    Compiled expressions are keyed by the expression and the namespaces and
+    extensions given to :meth:`get`. Functions registered in the global lxml
+    function namespace (like ``has-class`` defined by
+    :meth:`weboob.browser.pages.HTMLPage.define_xpath_functions`) are looked
+    up by lxml when the expression is evaluated, so they behave exactly as
+    with ``el.xpath()``.
+
+    Lookups don't take any lock, and only store an access tick on the entry.
+    When the cache is full, the least recently used quarter of entries is
+    dropped at once.
+
+    :param max_entries: maximum number of compiled expressions to keep
+    :type max_entries: :class:`int`
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.lock = Lock()
+        self.entries = {}
+        self.ticks = count()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, expression, namespaces=None, extensions=None, smart_strings=True):
+        """
+        Get a compiled XPath expression.
+
+        :rtype: :class:`lxml.etree.XPath`
+        """
+        if namespaces or extensions or not smart_strings:
+            key = (expression,
+                   frozenset(namespaces.items()) if namespaces else None,
+                   self._extensions_key(extensions),
+                   smart_strings)
+        else:
+            key = expression
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry[1] = next(self.ticks)
+            self.hits += 1
+            return entry[0]
+
+        compiled = etree.XPath(expression, namespaces=namespaces, extensions=extensions,
+                               smart_strings=smart_strings)
+        with self.lock:
+            self.misses += 1
+            self.entries[key] = [compiled, next(self.ticks)]
+            if len(self.entries) > self.max_entries:
+                self._evict()
+        return compiled
+
+    def _evict(self):
+        # Must be called with self.lock held.
+        keep = self.max_entries - self.max_entries // 4
+        entries = sorted(self.entries.items(), key=lambda item: item[1][1], reverse=True)
+        self.entries = dict(entries[:keep])
+
+    @staticmethod
+    def _extensions_key(extensions):
+        if not extensions:
+            return None
+        if isinstance(extensions, dict):
+            extensions = [extensions]
+        return tuple(frozenset(ext.items()) for ext in extensions)
+
+    def stats(self):
+        """
+        Get hits and misses counters, and the number of cached expressions.
+
+        As lookups are not locked, counters are approximate when several
+        threads use the cache.
+
+        :rtype: :class:`dict`
+        """
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.entries),
+                'max_entries': self.max_entries,
+               }
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.hits = 0
+            self.misses = 0
+
+
+xpath_cache = XPathCache()
+
+
+def xpath(item, expression, namespaces=None, extensions=None, smart_strings=True, **variables):
+    """
+    Evaluate an XPath expression on an lxml element or tree, like
+    ``item.xpath(expression)``, but with the expression compiled once and
+    kept in :data:`xpath_cache`.
+
+    Other objects are supposed to provide a ``xpath()`` method, which is
+    called directly.
+    """
+    if not isinstance(item, (etree._Element, etree._ElementTree)):
+        if namespaces is not None:
+            variables['namespaces'] = namespaces
+        if extensions is not None:
+            variables['extensions'] = extensions
+        if not smart_strings:
+            variables['smart_strings'] = smart_strings
+        return item.xpath(expression, **variables)
+
+    return xpath_cache.get(expression, namespaces, extensions, smart_strings)(item, **variables)
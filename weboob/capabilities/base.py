@@ -19,11 +19,12 @@
 
 from __future__ import unicode_literals
 
-from collections import OrderedDict
+from collections import OrderedDict, deque
 import warnings
 import re
 from decimal import Decimal
-from copy import deepcopy, copy
+from datetime import date, time, timedelta
+from copy import deepcopy
 
 from weboob.tools.compat import unicode, long
 from weboob.tools.misc import to_unicode
@@ -183,6 +184,36 @@ class Capability(object):
     """
 
 
+def find_types_by_name(name):
+    """
+    Find all classes with the given name.
+
+    This walks the whole classes graph, so it is slow.
+
+    :rtype: :class:`tuple`
+    """
+    # the following is a (almost) copy/paste from
+    # https://stackoverflow.com/questions/11775460/lexical-cast-from-string-to-type
+    types = ()
+    q = deque([object])
+    while q:
+        t = q.popleft()
+        if t.__name__ == name:
+            types += (t,)
+        else:
+            try:
+                # keep looking!
+                q.extend(t.__subclasses__())
+            except TypeError:
+                # type.__subclasses__ needs an argument for
+                # whatever reason.
+                if t is type:
+                    continue
+                else:
+                    raise
+    return types
+
+
 class Field(object):
     """
     Field of a :class:`BaseObject` class.
@@ -208,6 +239,36 @@ class Field(object):
         self._creation_counter = Field._creation_counter
         Field._creation_counter += 1
 
+    _actual_types = None
+
+    def get_types(self, refresh=False):
+        """
+        Get accepted types, with names of types resolved to classes.
+
+        Names are resolved once, and the result is cached as soon as all of
+        them are found.
+
+        :param refresh: if True, resolve names again
+        :type refresh: :class:`bool`
+        :rtype: :class:`tuple`
+        """
+        if self._actual_types is not None and not refresh:
+            return self._actual_types
+
+        actual_types = ()
+        resolved = True
+        for v in self.types:
+            if isinstance(v, str):
+                found = find_types_by_name(v)
+                resolved = resolved and bool(found)
+                actual_types += found
+            else:
+                actual_types += (v,)
+
+        if resolved:
+            self._actual_types = actual_types
+        return actual_types
+
     def convert(self, value):
         """
         Convert value to the wanted one.
@@ -291,6 +352,10 @@ class BytesField(Field):
         return str(value)
 
 
+IMMUTABLE_TYPES = (NotLoadedType, NotAvailableType, type(None), bool, int, long, float, Decimal,
+                   bytes, unicode, date, time, timedelta, frozenset)
+
+
 class _BaseObjectMeta(type):
     def __new__(cls, name, bases, attrs):
         fields = [(field_name, attrs.pop(field_name)) for field_name, obj in attrs.items() if isinstance(obj, Field)]
@@ -303,6 +368,13 @@ class _BaseObjectMeta(type):
             new_class._fields = deepcopy(new_class._fields)
         new_class._fields.update(fields)
 
+        # Instances store values of fields in a list, see BaseObject._get_values().
+        new_class._field_index = dict((name, i) for i, name in enumerate(new_class._fields))
+        new_class._default_values = [field.value for field in new_class._fields.itervalues()]
+        # Default values which have to be copied on each instance.
+        new_class._mutable_defaults = [(i, value) for i, value in enumerate(new_class._default_values)
+                                       if not isinstance(value, IMMUTABLE_TYPES)]
+
         if new_class.__doc__ is None:
             new_class.__doc__ = ''
         for name, field in fields:
@@ -347,9 +419,36 @@ class BaseObject(object):
     def __init__(self, id=u'', url=NotLoaded, backend=None):
         self.id = to_unicode(id)
         self.backend = backend
-        self._fields = deepcopy(self._fields)
         self.__setattr__('url', url)
 
+    def _get_values(self):
+        # Field objects are shared by all instances, which only store values
+        # in a list, indexed by position of fields in the class (see
+        # _field_index).
+        try:
+            return self.__dict__['_values']
+        except KeyError:
+            values = list(self._default_values)
+            for i, value in self._mutable_defaults:
+                values[i] = deepcopy(value)
+            object.__setattr__(self, '_values', values)
+            return values
+
+    def __setstate__(self, state):
+        if '_fields' in state and '_values' not in state:
+            # Pickled by an older version, where Field objects were copied on
+            # each instance.
+            fields = state.pop('_fields')
+            state['_values'] = values = list(self._default_values)
+            for name, field in fields.iteritems():
+                if name in self._field_index:
+                    values[self._field_index[name]] = field.value
+            if any(name not in fields for name in self._fields):
+                # Some fields were deleted from the object.
+                state['_fields'] = OrderedDict((name, field) for name, field in self._fields.iteritems()
+                                               if name in fields)
+        self.__dict__.update(state)
+
     @property
     def fullid(self):
         """
@@ -373,10 +472,15 @@ class BaseObject(object):
         return True
 
     def copy(self):
-        obj = copy(self)
-        obj._fields = copy(self._fields)
+        obj = self.__class__.__new__(self.__class__)
+        obj.__dict__.update(self.__dict__)
+        # Values must not be shared with the copy.
+        obj._values = list(self._get_values())
         return obj
 
+    def __copy__(self):
+        return self.copy()
+
     def __deepcopy__(self, memo):
         return self.copy()
 
@@ -402,8 +506,10 @@ class BaseObject(object):
 
         if hasattr(self, 'id') and self.id is not None:
             yield 'id', self.id
-        for name, field in self._fields.iteritems():
-            yield name, field.value
+        values = self._get_values()
+        index = self._field_index
+        for name in self._fields:
+            yield name, values[index[name]]
 
     def __eq__(self, obj):
         if isinstance(obj, BaseObject):
@@ -413,7 +519,7 @@ class BaseObject(object):
 
     def __getattr__(self, name):
         if self._fields is not None and name in self._fields:
-            return self._fields[name].value
+            return self._get_values()[self._field_index[name]]
         else:
             raise AttributeError("'%s' object has no attribute '%s'" % (
                 self.__class__.__name__, name))
@@ -422,7 +528,7 @@ class BaseObject(object):
         try:
             attr = (self._fields or {})[name]
         except KeyError:
-            if name not in dir(self) and not name.startswith('_'):
+            if not name.startswith('_') and name not in self.__dict__ and not hasattr(type(self), name):
                 warnings.warn('Creating a non-field attribute %s. Please prefix it with _' % name,
                               AttributeCreationWarning, stacklevel=2)
             object.__setattr__(self, name, value)
@@ -442,41 +548,25 @@ class BaseObject(object):
                     # match the wanted following types, so we'll
                     # raise ValueError.
                     pass
-            from collections import deque
-            actual_types = ()
-            for v in attr.types:
-                if isinstance(v, str):
-                    # the following is a (almost) copy/paste from
-                    # https://stackoverflow.com/questions/11775460/lexical-cast-from-string-to-type
-                    q = deque([object])
-                    while q:
-                        t = q.popleft()
-                        if t.__name__ == v:
-                            actual_types += (t,)
-                        else:
-                            try:
-                                # keep looking!
-                                q.extend(t.__subclasses__())
-                            except TypeError:
-                                # type.__subclasses__ needs an argument for
-                                # whatever reason.
-                                if t is type:
-                                    continue
-                                else:
-                                    raise
-                else:
-                    actual_types += (v,)
 
-            if not isinstance(value, actual_types) and not empty(value):
-                raise ValueError(
-                    'Value for "%s" needs to be of type %r, not %r' % (
-                        name, actual_types, type(value)))
-            attr.value = value
+                actual_types = attr.get_types()
+                if not isinstance(value, actual_types):
+                    # A class with a name given as type may have been
+                    # defined since the types were resolved.
+                    actual_types = attr.get_types(refresh=True)
+                    if not isinstance(value, actual_types):
+                        raise ValueError(
+                            'Value for "%s" needs to be of type %r, not %r' % (
+                                name, actual_types, type(value)))
+            self._get_values()[self._field_index[name]] = value
 
     def __delattr__(self, name):
-        try:
-            self._fields.pop(name)
-        except KeyError:
+        if self._fields is not None and name in self._fields:
+            # Only this instance loses the field.
+            fields = OrderedDict(self._fields)
+            fields.pop(name)
+            object.__setattr__(self, '_fields', fields)
+        else:
             object.__delattr__(self, name)
 
     def to_dict(self):
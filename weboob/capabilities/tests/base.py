@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+from copy import copy, deepcopy
+import pickle
+from unittest import TestCase
+import warnings
+
+from weboob.capabilities.base import BaseObject, Field, StringField, IntField, NotLoaded, NotAvailable
+
+
+class MyObject(BaseObject):
+    """
+    Object for tests.
+    """
+    label = StringField('Label')
+    count = IntField('Count', default=0)
+    tags = Field('Tags', list, default=[])
+    extra = Field('Extra', dict, default={})
+
+
+class MyChild(MyObject):
+    """
+    Object with more fields.
+    """
+    child = Field('Child object', 'MyLaterObject')
+
+
+class BaseObjectTest(TestCase):
+    def test_defaults(self):
+        obj = MyObject()
+        self.assertIs(obj.label, NotLoaded)
+        self.assertEqual(obj.count, 0)
+        self.assertEqual(list(obj._fields), ['url', 'label', 'count', 'tags', 'extra'])
+        self.assertEqual(list(MyChild._fields), ['url', 'label', 'count', 'tags', 'extra', 'child'])
+
+    def test_mutable_defaults(self):
+        obj1 = MyObject()
+        obj2 = MyObject()
+        obj1.tags.append('a')
+        obj1.extra['key'] = 'value'
+        # Each instance has its own copy of mutable defaults.
+        self.assertEqual(obj2.tags, [])
+        self.assertEqual(obj2.extra, {})
+        self.assertEqual(MyObject().tags, [])
+        self.assertEqual(MyObject._fields['tags'].value, [])
+
+    def test_set(self):
+        obj = MyObject()
+        obj.label = u'foo'
+        obj.count = 3
+        self.assertEqual(obj.label, u'foo')
+        self.assertEqual(obj.count, 3)
+        self.assertEqual(list(obj.iter_fields()), [('id', u''), ('url', NotLoaded), ('label', u'foo'),
+                                                   ('count', 3), ('tags', []), ('extra', {})])
+        # Other instances are not changed.
+        self.assertIs(MyObject().label, NotLoaded)
+
+        obj.label = NotAvailable
+        self.assertIs(obj.label, NotAvailable)
+        self.assertRaises(ValueError, setattr, obj, 'tags', u'foo')
+
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            obj.label = b'bar'
+        self.assertEqual(obj.label, u'bar')
+        self.assertEqual(len(w), 1)
+
+    def test_copy(self):
+        obj = MyObject(u'id1')
+        obj.label = u'foo'
+        obj.tags = ['a']
+
+        for other in (obj.copy(), copy(obj), deepcopy(obj), deepcopy([obj])[0]):
+            self.assertEqual(other.id, u'id1')
+            self.assertEqual(other.label, u'foo')
+            self.assertEqual(other.tags, ['a'])
+            other.label = u'bar'
+            other.count = 42
+            self.assertEqual(obj.label, u'foo')
+            self.assertEqual(obj.count, 0)
+
+    def test_pickle(self):
+        obj = MyChild(u'id1', backend='backend')
+        obj.label = u'foo'
+        obj.tags = ['a']
+        del obj.extra
+
+        other = pickle.loads(pickle.dumps(obj, 2))
+        self.assertEqual(other.fullid, u'id1@backend')
+        self.assertEqual(other.label, u'foo')
+        self.assertEqual(other.tags, ['a'])
+        self.assertEqual(list(other._fields), ['url', 'label', 'count', 'tags', 'child'])
+
+    def test_setstate_old_pickle(self):
+        # State of an object pickled when Field objects were copied on each
+        # instance.
+        fields = deepcopy(MyObject._fields)
+        fields['label'].value = u'foo'
+        fields['tags'].value = ['a']
+        fields['unknown'] = StringField('Removed since')
+        fields['unknown'].value = u'bar'
+        state = {'id': u'id1', 'backend': 'backend', '_fields': fields}
+
+        obj = MyObject.__new__(MyObject)
+        obj.__setstate__(state)
+        self.assertEqual(obj.fullid, u'id1@backend')
+        self.assertEqual(obj.label, u'foo')
+        self.assertEqual(obj.tags, ['a'])
+        self.assertEqual(obj.count, 0)
+        self.assertFalse(hasattr(obj, 'unknown'))
+        self.assertIs(obj._fields, MyObject._fields)
+        obj.count = 2
+        self.assertEqual(obj.count, 2)
+
+        # Fields deleted from the old object stay deleted.
+        fields = deepcopy(MyObject._fields)
+        del fields['extra']
+        obj = MyObject.__new__(MyObject)
+        obj.__setstate__({'id': u'id2', 'backend': None, '_fields': fields})
+        self.assertEqual(list(obj._fields), ['url', 'label', 'count', 'tags'])
+        self.assertRaises(AttributeError, getattr, obj, 'extra')
+
+    def test_delattr(self):
+        obj = MyObject()
+        obj.label = u'foo'
+        del obj.label
+        self.assertRaises(AttributeError, getattr, obj, 'label')
+        self.assertNotIn('label', dict(obj.iter_fields()))
+        self.assertNotIn('label', obj.to_dict())
+        # Only this instance loses the field.
+        self.assertIn('label', MyObject._fields)
+        self.assertIs(MyObject().label, NotLoaded)
+        self.assertNotIn('label', obj.copy()._fields)
+
+        obj._private = 1
+        del obj._private
+        self.assertRaises(AttributeError, getattr, obj, '_private')
+        self.assertRaises(AttributeError, delattr, obj, '_private')
+
+    def test_string_types(self):
+        obj = MyChild()
+        self.assertRaises(ValueError, setattr, obj, 'child', u'foo')
+
+        # The class named in the field is defined after the first lookup.
+        class MyLaterObject(BaseObject):
+            """
+            Object defined later.
+            """
+
+        later = MyLaterObject(u'later')
+        obj.child = later
+        self.assertIs(obj.child, later)
+        self.assertIn(MyLaterObject, MyChild._fields['child'].get_types())
+        self.assertRaises(ValueError, setattr, obj, 'child', u'foo')
+
+    def test_to_dict(self):
+        obj = MyObject(u'id1', backend='backend')
+        obj.label = u'foo'
+        self.assertEqual(obj.to_dict(), OrderedDict([('id', u'id1@backend'), ('url', NotLoaded), ('label', u'foo'),
+                                                     ('count', 0), ('tags', []), ('extra', {})]))
+        other = MyObject.from_dict({'label': u'bar', 'count': 2})
+        self.assertEqual((other.label, other.count), (u'bar', 2))
@@ -40,6 +40,8 @@ class BackendsConfig(object):
 
     A backend is an instance of a module with a config.
     A module can thus have multiple instances.
+
+    The file is only parsed again when it has changed.
     """
 
     class WrongPermissions(Exception):
@@ -47,6 +49,9 @@ class BackendsConfig(object):
 
     def __init__(self, confpath):
         self.confpath = confpath
+        # parsed config, and (inode, size, mtime) of the file it was read from
+        self._config = None
+        self._config_key = None
         try:
             mode = os.stat(confpath).st_mode
         except OSError:
@@ -70,12 +75,28 @@ class BackendsConfig(object):
                         u'Weboob will not start as long as config file %s is readable by group or other users.' % confpath)
 
     def _read_config(self):
+        """
+        Get the parsed config.
+
+        It is shared between calls, so it must not be changed without
+        being written by :meth:`_write_config`.
+        """
+        st = os.stat(self.confpath)
+        key = (st.st_ino, st.st_size, st.st_mtime)
+        if self._config is not None and key == self._config_key:
+            return self._config
+
         config = RawConfigParser()
         with codecs.open(self.confpath, 'r', 'utf-8') as fd:
             config.readfp(fd)
+        self._config = config
+        self._config_key = key
         return config
 
     def _write_config(self, config):
+        # The config is changed, and values are encoded below.
+        self._config = None
+
         for section in config.sections():
             for k, v in config.items(section):
                 if isinstance(v, unicode):
@@ -101,6 +122,8 @@ class BackendsConfig(object):
             except KeyError:
                 try:
                     module_name = params.pop('_backend')
+                    # Don't change the shared config before it is written.
+                    self._config = None
                     config.set(backend_name, '_module', module_name)
                     config.remove_option(backend_name, '_backend')
                     changed = True
@@ -18,19 +18,30 @@
 # along with weboob. If not, see <http://www.gnu.org/licenses/>.
 
 
+import errno
+import os
+import sys
+from collections import deque
 from copy import copy
-from threading import Thread, Event
+from threading import Thread, Event, Lock, current_thread
 try:
     import Queue
 except ImportError:
     import queue as Queue
+try:
+    import asyncio
+    import inspect
+except ImportError:
+    asyncio = None
 
 from weboob.capabilities.base import BaseObject
+from weboob.core.executor import BackendsExecutor
+from weboob.tools.compat import basestring
 from weboob.tools.misc import get_backtrace
 from weboob.tools.log import getLogger
 
 
-__all__ = ['BackendsCall', 'CallErrors']
+__all__ = ['BackendsCall', 'AsyncBackendsCall', 'CallErrors']
 
 
 class CallErrors(Exception):
@@ -46,9 +57,77 @@ class CallErrors(Exception):
         return self.errors.__iter__()
 
 
+_default_executor = None
+_default_executor_lock = Lock()
+
+
+def get_default_executor():
+    """
+    Get the executor used for backends which are not attached to a
+    :class:`weboob.core.ouiboube.WebNip` instance.
+    """
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = BackendsExecutor()
+        return _default_executor
+
+
+class _WakeupPipe(object):
+    """
+    Pipe to wake up a thread waiting for it, in a way which can be
+    interrupted by signals.
+
+    It is closed when it is garbage collected, and it doesn't reference
+    other objects, so it can't be in a reference cycle.
+    """
+
+    def __init__(self):
+        self.rfd, self.wfd = os.pipe()
+
+    def write(self):
+        os.write(self.wfd, b'.')
+
+    def wait(self):
+        try:
+            os.read(self.rfd, 4096)
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+
+    def close(self):
+        if self.rfd is not None:
+            os.close(self.rfd)
+            os.close(self.wfd)
+            self.rfd = self.wfd = None
+
+    def __del__(self):
+        self.close()
+
+
 class BackendsCall(object):
+    END = object()
+    """
+    Sentinel put in the responses queue when all tasks are finished or when
+    the call is stopped.
+    """
+
+    loop = None
+    """
+    Event loop the results are delivered to, when they are consumed with
+    ``async for``.
+    """
+
     def __init__(self, backends, function, *args, **kwargs):
         """
+        Tasks are submitted to the executor of the Weboob instance of each
+        backend (see :attr:`weboob.core.ouiboube.WebNip.executor`).
+
+        Results are delivered to the consumer as soon as they are produced,
+        and the end of the stream is signalled by the :attr:`END` sentinel
+        put by the last finished task, so nothing is polled (see
+        :meth:`get_response` for the main thread on Python 2).
+
         :param backends: List of backends to call
         :type backends: list[:class:`Module`]
         :param function: backends' method name, or callable object.
@@ -58,15 +137,102 @@ class BackendsCall(object):
 
         self.responses = Queue.Queue()
         self.errors = []
-        self.tasks = Queue.Queue()
         self.stop_event = Event()
-        self.threads = []
+        self.finished_event = Event()
+        self.lock = Lock()
+
+        self.async_responses = deque()
+        self.async_waiter = None
+
+        # Pipe written after each response, when the consumer is the main
+        # thread on Python 2.
+        self.wakeup = None
+
+        backends = list(backends)
+        self.pending = len(backends)
+        if not self.pending:
+            self.finished_event.set()
+            self.put_response(self.END)
 
         for backend in backends:
-            t = Thread(target=self.backend_process, args=(function, args, kwargs))
-            t.start()
-            self.threads.append(t)
-            self.tasks.put(backend)
+            self.submit(backend, function, args, kwargs)
+
+    def submit(self, backend, function, args, kwargs):
+        """Run the task of a backend on its executor."""
+        executor = getattr(backend.weboob, 'executor', None) or get_default_executor()
+        executor.submit(backend, self.backend_process, backend, function, args, kwargs)
+
+    def is_finished(self):
+        """Return True if all backends tasks are finished."""
+        return self.finished_event.is_set()
+
+    def task_done(self):
+        with self.lock:
+            self.pending -= 1
+            finished = self.pending == 0
+        if finished:
+            self.finished_event.set()
+            self.put_response(self.END)
+
+    def put_response(self, response):
+        """Deliver a result (or :attr:`END`) to the consumer."""
+        with self.lock:
+            if self.loop is None:
+                self.responses.put(response)
+                if self.wakeup is not None:
+                    self.wakeup.write()
+            elif not self.loop.is_closed():
+                try:
+                    self.loop.call_soon_threadsafe(self._deliver_async, response)
+                except RuntimeError:
+                    # The loop has been closed in the meantime, so nobody
+                    # is waiting for this result anymore.
+                    pass
+
+    def get_response(self):
+        """
+        Block until a result is available.
+
+        On Python 2, the main thread waits on a pipe instead of the queue,
+        as waiting for a lock can't be interrupted by ^C, and waiting for it
+        with a timeout delays results.
+
+        :returns: a result, or :attr:`END` when there are no more results
+        """
+        if sys.version_info.major >= 3 or current_thread().name != 'MainThread':
+            response = self.responses.get()
+        else:
+            response = self._get_response_interruptible()
+
+        if response is self.END:
+            # Let other consumers know too.
+            self.responses.put(self.END)
+            self._close_wakeup()
+        elif self.stop_event.is_set():
+            return self.END
+        return response
+
+    def _get_response_interruptible(self):
+        # On Python 2, a blocking lock acquisition can't be interrupted by
+        # signals, and waiting with a timeout polls, which delays results.
+        # So the main thread waits for a byte written in a pipe after each
+        # response, as reading it can be interrupted by ^C.
+        with self.lock:
+            if self.wakeup is None:
+                self.wakeup = _WakeupPipe()
+            wakeup = self.wakeup
+
+        while True:
+            try:
+                return self.responses.get_nowait()
+            except Queue.Empty:
+                wakeup.wait()
+
+    def _close_wakeup(self):
+        with self.lock:
+            if self.wakeup is not None:
+                self.wakeup.close()
+                self.wakeup = None
 
     def store_result(self, backend, result):
         """Store the result when a backend task finished."""
@@ -75,17 +241,27 @@ class BackendsCall(object):
 
         if isinstance(result, BaseObject):
             result.backend = backend.name
-        self.responses.put(result)
+        self.put_response(result)
 
-    def backend_process(self, function, args, kwargs):
+    def backend_process(self, backend, function, args, kwargs):
         """
         Internal method to run a method of a backend.
 
-        As this method may be blocking, it should be run on its own thread.
+        As this method may be blocking, it is run by a worker of the executor.
         """
-        backend = self.tasks.get()
-        with backend:
-            try:
+        if self.stop_event.is_set():
+            self.task_done()
+            return
+
+        try:
+            # A nested call made by a concurrent call is run under the
+            # shared lock too, as it can't be upgraded.
+            if backend.is_concurrent_call(function) or backend.lock.is_shared_owned():
+                lock = backend.concurrent_call()
+            else:
+                lock = backend
+
+            with lock:
                 # Call method on backend
                 try:
                     self.logger.debug('%s: Calling function %s', backend, function)
@@ -110,18 +286,19 @@ class BackendsCall(object):
                             self.errors.append((backend, error, get_backtrace(error)))
                     else:
                         self.store_result(backend, result)
-            finally:
-                self.tasks.task_done()
+        except Exception as error:
+            # Unable to lock the backend.
+            self.errors.append((backend, error, get_backtrace(error)))
+        finally:
+            self.task_done()
 
     def _callback_thread_run(self, callback, errback, finishback):
-        while not self.stop_event.is_set() and (self.tasks.unfinished_tasks or not self.responses.empty()):
-            try:
-                response = self.responses.get(timeout=0.1)
-            except Queue.Empty:
-                continue
-            else:
-                if callback:
-                    callback(response)
+        while True:
+            response = self.get_response()
+            if response is self.END:
+                break
+            if callback:
+                callback(response)
 
         # Raise errors
         while errback and self.errors:
@@ -150,8 +327,7 @@ class BackendsCall(object):
 
     def wait(self):
         """Wait until all tasks are finished."""
-        for thread in self.threads:
-            thread.join()
+        self.finished_event.wait()
 
         if self.errors:
             raise CallErrors(self.errors)
@@ -165,20 +341,200 @@ class BackendsCall(object):
         """
 
         self.stop_event.set()
+        self.put_response(self.END)
 
         if wait:
             self.wait()
 
     def __iter__(self):
         try:
-            while not self.stop_event.is_set() and (self.tasks.unfinished_tasks or not self.responses.empty()):
-                try:
-                    yield self.responses.get(timeout=0.1)
-                except Queue.Empty:
-                    continue
+            while True:
+                response = self.get_response()
+                if response is self.END:
+                    break
+                yield response
         except:
             self.stop()
             raise
 
         if self.errors:
             raise CallErrors(self.errors)
+
+    def bind_loop(self, loop):
+        """
+        Deliver results to an asyncio event loop instead of the responses
+        queue.
+
+        Results already waiting in the queue are moved to the loop side.
+        This method must be called from the thread running *loop*.
+        """
+        with self.lock:
+            if self.loop is not None:
+                return
+            while True:
+                try:
+                    self.async_responses.append(self.responses.get_nowait())
+                except Queue.Empty:
+                    break
+            self.loop = loop
+
+    def _deliver_async(self, response):
+        if self.stop_event.is_set():
+            response = self.END
+
+        waiter = self.async_waiter
+        if waiter is not None and not waiter.done():
+            self.async_waiter = None
+            self._resolve_async(waiter, response)
+        else:
+            self.async_responses.append(response)
+
+    def _resolve_async(self, future, response):
+        if response is self.END:
+            # Let next calls to __anext__() end too.
+            self.async_responses.appendleft(self.END)
+            if self.errors:
+                future.set_exception(CallErrors(self.errors))
+            else:
+                future.set_exception(StopAsyncIteration())
+        else:
+            future.set_result(response)
+
+    def __aiter__(self):
+        self.bind_loop(asyncio.get_event_loop())
+        return self
+
+    def __anext__(self):
+        future = self.loop.create_future()
+        if self.async_responses:
+            response = self.async_responses.popleft()
+            if self.stop_event.is_set():
+                response = self.END
+            self._resolve_async(future, response)
+        else:
+            self.async_waiter = future
+        return future
+
+
+class AsyncBackendsCall(BackendsCall):
+    """
+    Call on backends whose results are consumed with ``async for``.
+
+    It has to be created from a running asyncio event loop, see
+    :meth:`weboob.core.ouiboube.WebNip.async_do`.
+
+    Blocking methods are run by the executor as usual, but methods which are
+    coroutine functions or asynchronous generator functions are natively run
+    by the event loop. Such methods are not called with the backend locked,
+    so they must not rely on it.
+
+    When the consumer stops iterating before the end, it has to call
+    :meth:`aclose` (or to use the call with ``async with``), so that
+    backends stop producing results.
+    """
+
+    def __init__(self, backends, function, *args, **kwargs):
+        if asyncio is None:
+            raise ImportError('asyncio is required for asynchronous calls')
+
+        # Bind the loop before any task is started.
+        self.loop = asyncio.get_event_loop()
+        self.async_tasks = set()
+        super(AsyncBackendsCall, self).__init__(backends, function, *args, **kwargs)
+
+    def aclose(self):
+        """
+        Stop the call: coroutines of backends are cancelled, and other
+        backends stop at their next result.
+
+        :returns: an awaitable
+        """
+        self.stop()
+        for task in list(self.async_tasks):
+            task.cancel()
+        future = self.loop.create_future()
+        future.set_result(None)
+        return future
+
+    def __aenter__(self):
+        future = self.loop.create_future()
+        future.set_result(self)
+        return future
+
+    def __aexit__(self, t, v, tb):
+        return self.aclose()
+
+    def bind_loop(self, loop):
+        assert loop is self.loop, 'results are already delivered to another event loop'
+
+    def submit(self, backend, function, args, kwargs):
+        if callable(function):
+            method = function
+            args = (backend,) + tuple(args)
+        else:
+            method = getattr(backend, function, None)
+
+        if asyncio.iscoroutinefunction(method) or inspect.isasyncgenfunction(method):
+            self.logger.debug('%s: Calling asynchronous function %s', backend, function)
+            try:
+                result = method(*args, **kwargs)
+            except Exception as error:
+                self._async_error(backend, error)
+                self.task_done()
+                return
+            if hasattr(result, '__aiter__'):
+                self._async_next(backend, result.__aiter__())
+            else:
+                self._async_task(result, lambda future: self._async_result(backend, future))
+        else:
+            super(AsyncBackendsCall, self).submit(backend, function, args, kwargs)
+
+    def _async_task(self, awaitable, callback):
+        task = asyncio.ensure_future(awaitable, loop=self.loop)
+        self.async_tasks.add(task)
+        task.add_done_callback(self.async_tasks.discard)
+        task.add_done_callback(callback)
+
+    def _async_error(self, backend, error):
+        self.logger.debug('%s: Called function raised an error: %r', backend, error)
+        self.errors.append((backend, error, get_backtrace(error)))
+
+    def _async_result(self, backend, future):
+        if future.cancelled():
+            self.task_done()
+            return
+
+        try:
+            result = future.result()
+        except Exception as error:
+            self._async_error(backend, error)
+        else:
+            if hasattr(result, '__iter__') and not isinstance(result, basestring):
+                for subresult in result:
+                    self.store_result(backend, subresult)
+            else:
+                self.store_result(backend, result)
+        self.task_done()
+
+    def _async_next(self, backend, iterator):
+        if self.stop_event.is_set():
+            self.task_done()
+            return
+
+        self._async_task(iterator.__anext__(), lambda future: self._async_item(backend, iterator, future))
+
+    def _async_item(self, backend, iterator, future):
+        if future.cancelled():
+            self.task_done()
+            return
+
+        try:
+            result = future.result()
+        except StopAsyncIteration:
+            self.task_done()
+        except Exception as error:
+            self._async_error(backend, error)
+            self.task_done()
+        else:
+            self.store_result(backend, result)
+            self._async_next(backend, iterator)
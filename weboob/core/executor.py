@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+
+from collections import deque
+from threading import Condition, Thread, current_thread
+
+from weboob.tools.log import getLogger
+from weboob.tools.misc import get_backtrace
+
+
+__all__ = ['BackendsExecutor']
+
+
+class BackendsExecutor(object):
+    """
+    Bounded pool of worker threads running backends tasks.
+
+    Instead of starting one thread per backend on each call, tasks are
+    queued and run by at most *max_workers* threads, which are started
+    lazily and reused across calls.
+
+    A concurrency limit can be set per module, so that a module with a lot
+    of instances does not take all the workers (or hammer the same website).
+    Tasks exceeding this limit wait in a per-module queue.
+
+    :param max_workers: maximum number of worker threads
+    :type max_workers: :class:`int`
+    :param module_limit: default maximum number of concurrent tasks per
+                         module (None for no limit)
+    :type module_limit: :class:`int`
+    """
+
+    def __init__(self, max_workers=20, module_limit=None):
+        self.logger = getLogger('executor')
+        self.max_workers = max_workers
+        self.module_limit = module_limit
+        self.module_limits = {}
+
+        self.cond = Condition()
+        self.workers = []
+        self.idle_workers = 0
+        self.ready = deque()
+        self.waiting = {}
+        self.admitted = {}
+        self.shutdown_requested = False
+
+    def set_module_limit(self, module, limit):
+        """
+        Set the maximum number of concurrent tasks for a module.
+
+        :param module: name of the module
+        :type module: :class:`str`
+        :param limit: maximum number of tasks (None to use the default limit)
+        :type limit: :class:`int`
+        """
+        with self.cond:
+            if limit is None:
+                self.module_limits.pop(module, None)
+            else:
+                self.module_limits[module] = limit
+            self._admit(module)
+
+    def get_module_limit(self, module):
+        return self.module_limits.get(module, self.module_limit)
+
+    def submit(self, backend, function, *args):
+        """
+        Queue a task for a backend.
+
+        If this method is called from one of the workers, the task is run
+        immediately in the current thread, to prevent a nested call from
+        waiting on workers which are all waiting for it. So tasks of a call
+        made by a backend method are run one after the other, and module
+        limits don't apply to them.
+
+        :param backend: backend the task is related to
+        :type backend: :class:`weboob.tools.backend.Module`
+        :param function: function to call, with *args* as arguments
+        :type function: :class:`callable`
+        """
+        if current_thread() in self.workers:
+            self._run(function, args)
+            return
+
+        module = getattr(backend, 'NAME', None)
+        with self.cond:
+            self.shutdown_requested = False
+            self.waiting.setdefault(module, deque()).append((module, function, args))
+            self._admit(module)
+
+    def _admit(self, module):
+        # Must be called with self.cond held.
+        waiting = self.waiting.get(module)
+        limit = self.get_module_limit(module)
+        while waiting and (limit is None or self.admitted.get(module, 0) < limit):
+            self.ready.append(waiting.popleft())
+            self.admitted[module] = self.admitted.get(module, 0) + 1
+            if len(self.ready) > self.idle_workers and len(self.workers) < self.max_workers:
+                self._start_worker()
+            self.cond.notify()
+        if not waiting:
+            self.waiting.pop(module, None)
+
+    def _start_worker(self):
+        thread = Thread(target=self._worker_run, name='weboob-worker-%d' % len(self.workers))
+        thread.daemon = True
+        self.workers.append(thread)
+        thread.start()
+
+    def _worker_run(self):
+        while True:
+            with self.cond:
+                while not self.ready and not self.shutdown_requested:
+                    self.idle_workers += 1
+                    self.cond.wait()
+                    self.idle_workers -= 1
+
+                if not self.ready:
+                    self.workers.remove(current_thread())
+                    return
+                module, function, args = self.ready.popleft()
+
+            try:
+                self._run(function, args)
+            finally:
+                with self.cond:
+                    self.admitted[module] -= 1
+                    if not self.admitted[module]:
+                        del self.admitted[module]
+                    self._admit(module)
+
+    def _run(self, function, args):
+        try:
+            function(*args)
+        except Exception as e:
+            # Tasks are expected to handle their own errors.
+            self.logger.error('Unhandled error in task %r: %s', function, get_backtrace(e))
+
+    @property
+    def queue_depth(self):
+        """
+        Number of tasks waiting for a worker or for a module slot.
+        """
+        with self.cond:
+            return len(self.ready) + sum(len(tasks) for tasks in self.waiting.values())
+
+    def stats(self):
+        """
+        Get a snapshot of the executor state.
+
+        :rtype: :class:`dict`
+        """
+        with self.cond:
+            return {'workers': len(self.workers),
+                    'idle_workers': self.idle_workers,
+                    'ready': len(self.ready),
+                    'queue_depth': len(self.ready) + sum(len(tasks) for tasks in self.waiting.values()),
+                    'admitted': dict(self.admitted),
+                    'waiting': dict((module, len(tasks)) for module, tasks in self.waiting.items()),
+                   }
+
+    def shutdown(self, wait=True):
+        """
+        Stop workers once the queued tasks are done.
+
+        The executor can still be used afterwards, as new workers are
+        started when tasks are submitted.
+
+        :param wait: if True, wait for workers to end
+        :type wait: :class:`bool`
+        """
+        with self.cond:
+            self.shutdown_requested = True
+            self.cond.notify_all()
+            workers = list(self.workers)
+
+        if wait:
+            for thread in workers:
+                if thread is not current_thread():
+                    thread.join()
@@ -20,7 +20,8 @@
 
 import os
 
-from weboob.core.bcall import BackendsCall
+from weboob.core.bcall import BackendsCall, AsyncBackendsCall
+from weboob.core.executor import BackendsExecutor
 from weboob.core.modules import ModulesLoader, RepositoryModulesLoader
 from weboob.core.backendscfg import BackendsConfig
 from weboob.core.requests import RequestsManager
@@ -52,14 +53,37 @@ class WebNip(object):
     :type storage: :class:`weboob.tools.storage.IStorage`
     :param scheduler: what scheduler to use; default is :class:`weboob.core.scheduler.Scheduler`
     :type scheduler: :class:`weboob.core.scheduler.IScheduler`
+    :param executor: pool of workers running backends calls; default is a
+                     :class:`weboob.core.executor.BackendsExecutor` with
+                     :attr:`MAX_WORKERS` threads
+    :type executor: :class:`weboob.core.executor.BackendsExecutor`
+    :param transport: executor and connection pools shared by browsers of
+                      all backends; by default, each browser has its own ones
+    :type transport: :class:`weboob.browser.transport.SharedTransport`
     """
     VERSION = '1.3'
 
-    def __init__(self, modules_path=None, storage=None, scheduler=None):
+    MAX_WORKERS = 20
+    """
+    Maximum number of threads used to run calls on backends.
+    """
+
+    MODULE_MAX_WORKERS = None
+    """
+    Default maximum number of concurrent calls on backends of a same module
+    (None for no limit).
+    """
+
+    def __init__(self, modules_path=None, storage=None, scheduler=None, executor=None, transport=None):
         self.logger = getLogger('weboob')
         self.backend_instances = {}
         self.requests = RequestsManager()
 
+        if executor is None:
+            executor = BackendsExecutor(self.MAX_WORKERS, self.MODULE_MAX_WORKERS)
+        self.executor = executor
+        self.transport = transport
+
         if modules_path is None:
             import pkg_resources
             # Package weboob_modules is provided by
@@ -87,6 +111,9 @@ class WebNip(object):
         properly unload all correctly.
         """
         self.unload_backends()
+        self.executor.shutdown()
+        if self.transport is not None:
+            self.transport.close()
 
     def build_backend(self, module_name, params=None, storage=None, name=None, nofail=False):
         """
@@ -154,18 +181,38 @@ class WebNip(object):
         :param names: if specified, only unload that backends
         :type names: :class:`list`
         """
-        unloaded = {}
         if isinstance(names, basestring):
             names = [names]
         elif names is None:
             names = self.backend_instances.keys()
 
-        for name in names:
-            backend = self.backend_instances.pop(name)
+        backends = [self.backend_instances.pop(name) for name in names]
+
+        # Storages are written once, after all backends are unloaded.
+        storages = []
+        for backend in backends:
+            storage = backend.storage.storage
+            if storage is not None and hasattr(storage, 'batch') and storage not in storages:
+                storages.append(storage)
+
+        return self._deinit_backends(backends, storages)
+
+    def _deinit_backends(self, backends, storages):
+        """
+        Deinit backends, in a batch of each storage.
+
+        Batches are nested, so that they are all ended even if one of them
+        fails.
+        """
+        if storages:
+            with storages[0].batch():
+                return self._deinit_backends(backends, storages[1:])
+
+        unloaded = {}
+        for backend in backends:
             with backend:
                 backend.deinit()
             unloaded[backend.name] = backend
-
         return unloaded
 
     def __getitem__(self, name):
@@ -223,17 +270,21 @@ class WebNip(object):
 
     def do(self, function, *args, **kwargs):
         r"""
-        Do calls on loaded backends with specified arguments, in separated
-        threads.
+        Do calls on loaded backends with specified arguments, in the
+        workers of :attr:`executor`.
 
         This function has two modes:
 
         - If *function* is a string, it calls the method with this name on
           each backends with the specified arguments;
-        - If *function* is a callable, it calls it in a separated thread with
+        - If *function* is a callable, it calls it in a worker thread with
           the locked backend instance at first arguments, and \*args and
           \*\*kwargs.
 
+        When it is called from a backend method (so in a worker), backends
+        are called one after the other in the current thread, before this
+        method returns (see :meth:`weboob.core.executor.BackendsExecutor.submit`).
+
         :param function: backend's method name, or a callable object
         :type function: :class:`str`
         :param backends: list of backends to iterate on
@@ -242,6 +293,47 @@ class WebNip(object):
         :type caps: list[:class:`weboob.capabilities.base.Capability`]
         :rtype: A :class:`weboob.core.bcall.BackendsCall` object (iterable)
         """
+        backends = self._select_backends(kwargs)
+
+        # The return value MUST BE the BackendsCall instance. Please never iterate
+        # here on this object, because caller might want to use other methods, like
+        # wait() on callback_thread().
+        # Thanks a lot.
+        return BackendsCall(backends, function, *args, **kwargs)
+
+    def async_do(self, function, *args, **kwargs):
+        r"""
+        Do calls on loaded backends, and get results with an asynchronous
+        iterator.
+
+        It must be called from a running asyncio event loop, and takes the
+        same arguments than :meth:`do`::
+
+            async for result in weboob.async_do('iter_accounts'):
+                print(result)
+
+        Blocking methods are run in the workers of :attr:`executor`, but
+        methods which are coroutine functions or asynchronous generator
+        functions are natively run by the event loop.
+
+        To stop before the end, use the call as an asynchronous context
+        manager, or call its ``aclose()`` method::
+
+            async with weboob.async_do('iter_accounts') as accounts:
+                async for account in accounts:
+                    if account.id == wanted:
+                        break
+
+        :rtype: A :class:`weboob.core.bcall.AsyncBackendsCall` object (asynchronous iterable)
+        """
+        backends = self._select_backends(kwargs)
+        return AsyncBackendsCall(backends, function, *args, **kwargs)
+
+    def _select_backends(self, kwargs):
+        """
+        Pop the *backends* and *caps* arguments of :meth:`do` from *kwargs*
+        and return the selected backends.
+        """
         backends = self.backend_instances.values()
         _backends = kwargs.pop('backends', None)
         if _backends is not None:
@@ -270,11 +362,7 @@ class WebNip(object):
             caps = kwargs.pop('caps')
             backends = [backend for backend in backends if backend.has_caps(caps)]
 
-        # The return value MUST BE the BackendsCall instance. Please never iterate
-        # here on this object, because caller might want to use other methods, like
-        # wait() on callback_thread().
-        # Thanks a lot.
-        return BackendsCall(backends, function, *args, **kwargs)
+        return backends
 
     def schedule(self, interval, function, *args):
         """
@@ -341,11 +429,17 @@ class Weboob(WebNip):
     :type backends_filename: str
     :param storage: provide a storage where backends can save data
     :type storage: :class:`weboob.tools.storage.IStorage`
+    :param executor: pool of workers running backends calls
+    :type executor: :class:`weboob.core.executor.BackendsExecutor`
+    :param transport: executor and connection pools shared by browsers
+    :type transport: :class:`weboob.browser.transport.SharedTransport`
     """
     BACKENDS_FILENAME = 'backends'
 
-    def __init__(self, workdir=None, datadir=None, backends_filename=None, scheduler=None, storage=None):
-        super(Weboob, self).__init__(modules_path=False, scheduler=scheduler, storage=storage)
+    def __init__(self, workdir=None, datadir=None, backends_filename=None, scheduler=None, storage=None,
+                 executor=None, transport=None):
+        super(Weboob, self).__init__(modules_path=False, scheduler=scheduler, storage=storage, executor=executor,
+                                     transport=transport)
 
         # Create WORKDIR
         if workdir is None:
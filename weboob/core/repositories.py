@@ -19,7 +19,9 @@
 
 
 from __future__ import print_function
+import ast
 import imp
+import json
 import posixpath
 import shutil
 import re
@@ -27,11 +29,16 @@ import sys
 import os
 import subprocess
 import hashlib
+import tarfile
+import tempfile
 from datetime import datetime
+from threading import local
 from contextlib import closing
 from compileall import compile_dir
 from io import BytesIO
 
+import weboob.capabilities
+from weboob.capabilities.base import Capability
 from weboob.exceptions import BrowserHTTPError, BrowserHTTPNotFound, ModuleInstallError
 from .modules import LoadedModule
 from weboob.tools.log import getLogger
@@ -41,6 +48,11 @@ try:
 except ImportError:
     from configparser import RawConfigParser, DEFAULTSECT
 
+try:
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+except ImportError:
+    ThreadPoolExecutor = ProcessPoolExecutor = as_completed = None
+
 
 class ModuleInfo(object):
     """
@@ -111,6 +123,7 @@ class Repository(object):
     Represents a repository.
     """
     INDEX = 'modules.list'
+    INDEX_CACHE = '.modules.cache'
     KEYDIR = '.keys'
     KEYRING = 'trusted.gpg'
 
@@ -165,8 +178,13 @@ class Repository(object):
             except IOError as e:
                 # This local repository doesn't contain a built modules.list index.
                 self.name = Repositories.url2filename(self.url)
-                self.build_index(self.localurl2path(), filename)
-                fp = open(filename, 'r')
+            else:
+                with fp:
+                    self.parse_index(fp)
+
+            # Always rebuild index of a local repository. Only changed
+            # modules are inspected again.
+            self.build_index(self.localurl2path(), filename)
         else:
             # This is a remote repository, download file
             try:
@@ -174,11 +192,7 @@ class Repository(object):
             except BrowserHTTPError as e:
                 raise RepositoryUnavailable(unicode(e))
 
-        self.parse_index(fp)
-
-        if self.local:
-            # Always rebuild index of a local repository.
-            self.build_index(self.localurl2path(), filename)
+            self.parse_index(fp)
 
         # Save the repository index in ~/.weboob/repositories/
         self.save(repo_path, private=True)
@@ -258,6 +272,11 @@ class Repository(object):
         """
         Rebuild index of modules of repository.
 
+        Information about modules is kept in a cache file in the source
+        directory of the repository (not next to the index, which may be
+        published), so that only modules whose files changed are inspected
+        again.
+
         :param path: path of the repository
         :type path: str
         :param filename: file to save index
@@ -273,46 +292,211 @@ class Repository(object):
             self.signed = False
             self.key_update = 0
 
+        # Capabilities of modules depend on the hierarchy of capabilities.
+        _, caps_signature = self.get_tree_signature(os.path.dirname(weboob.capabilities.__file__))
+        cache_filename = os.path.join(path, self.INDEX_CACHE)
+        cache = self.load_index_cache(cache_filename, caps_signature)
+        new_cache = {}
+
         for name in sorted(os.listdir(path)):
             module_path = os.path.join(path, name)
             if not os.path.isdir(module_path) or '.' in name or name == self.KEYDIR:
                 continue
 
-            try:
-                fp, pathname, description = imp.find_module(name, [path])
-                try:
-                    module = LoadedModule(imp.load_module(name, fp, pathname, description))
-                finally:
-                    if fp:
-                        fp.close()
-            except Exception as e:
-                print('Unable to build module %s: [%s] %s' % (name, type(e).__name__, e), file=sys.stderr)
-                self.logger.debug(get_backtrace(e))
+            mtime, signature = self.get_tree_signature(module_path)
+            cached = cache.get(name)
+            if cached is not None and cached['signature'] == signature:
+                m = ModuleInfo(cached['name'])
+                m.load(cached['info'])
             else:
-                m = ModuleInfo(module.name)
-                m.version = self.get_tree_mtime(module_path)
-                m.capabilities = list(set([c.__name__ for c in module.iter_caps()]))
-                m.description = module.description
-                m.maintainer = module.maintainer
-                m.license = module.license
-                m.icon = module.icon or ''
-                self.modules[module.name] = m
+                m = self.inspect_module(path, name)
+                if m is None:
+                    continue
+                m.version = mtime
+
+            self.modules[m.name] = m
+            new_cache[name] = {'signature': signature,
+                               'name': m.name,
+                               'info': dict(m.dump()),
+                              }
 
         self.update = int(datetime.now().strftime('%Y%m%d%H%M'))
         self.save(filename)
+        self.save_index_cache(cache_filename, caps_signature, new_cache)
+
+    def load_index_cache(self, filename, caps_signature):
+        try:
+            with open(filename, 'r') as fp:
+                data = json.load(fp)
+        except (IOError, ValueError):
+            return {}
+
+        if data.get('capabilities') != caps_signature:
+            return {}
+        return data['modules']
+
+    def save_index_cache(self, filename, caps_signature, modules):
+        try:
+            with open(filename, 'w') as fp:
+                json.dump({'capabilities': caps_signature, 'modules': modules}, fp)
+        except IOError as e:
+            self.logger.warning('Unable to save index cache %s: %s', filename, e)
+
+    def inspect_module(self, path, name):
+        """
+        Get information about a module, by reading its sources, or by
+        importing it if it can't be done statically.
+
+        :rtype: :class:`ModuleInfo` or None
+        """
+        try:
+            m = self.parse_module(os.path.join(path, name))
+        except Exception as e:
+            self.logger.debug('Unable to read module %s statically: %s', name, e)
+            m = None
+        if m is not None:
+            return m
+
+        try:
+            fp, pathname, description = imp.find_module(name, [path])
+            try:
+                module = LoadedModule(imp.load_module(name, fp, pathname, description))
+            finally:
+                if fp:
+                    fp.close()
+        except Exception as e:
+            print('Unable to build module %s: [%s] %s' % (name, type(e).__name__, e), file=sys.stderr)
+            self.logger.debug(get_backtrace(e))
+            return None
+
+        m = ModuleInfo(module.name)
+        m.capabilities = list(set([c.__name__ for c in module.iter_caps()]))
+        m.description = module.description
+        m.maintainer = module.maintainer
+        m.license = module.license
+        m.icon = module.icon or ''
+        return m
+
+    MODULE_REQUIRED_ATTRS = ('NAME', 'MAINTAINER', 'EMAIL', 'DESCRIPTION', 'LICENSE')
+
+    @classmethod
+    def parse_module(cls, module_path):
+        """
+        Read information about a module from its ``__init__.py`` and
+        ``module.py`` files, without importing it.
+
+        This only works for modules whose class is imported in
+        ``__init__.py`` from ``.module``, inherits directly from
+        :class:`weboob.tools.backend.Module` and capabilities, and defines
+        its attributes with literal values. Otherwise, None is returned.
+
+        :rtype: :class:`ModuleInfo` or None
+        """
+        with open(os.path.join(module_path, '__init__.py'), 'rb') as fp:
+            init = ast.parse(fp.read())
+
+        names = set()
+        for node in init.body:
+            if isinstance(node, ast.ImportFrom) and node.level == 1 and node.module == 'module':
+                names.update(alias.asname or alias.name for alias in node.names)
+
+        with open(os.path.join(module_path, 'module.py'), 'rb') as fp:
+            source = ast.parse(fp.read())
+
+        imports = {}
+        klasses = []
+        for node in source.body:
+            if isinstance(node, ast.ImportFrom) and node.level == 0:
+                for alias in node.names:
+                    imports[alias.asname or alias.name] = (node.module, alias.name)
+            elif isinstance(node, ast.ClassDef) and node.name in names:
+                klasses.append(node)
+
+        if len(klasses) != 1:
+            return None
+        klass = klasses[0]
+
+        caps = set()
+        is_module = False
+        for base in klass.bases:
+            if not isinstance(base, ast.Name) or base.id not in imports:
+                return None
+            modname, attrname = imports[base.id]
+            if (modname, attrname) == ('weboob.tools.backend', 'Module'):
+                is_module = True
+            elif modname.startswith('weboob.capabilities.'):
+                cap = getattr(__import__(modname, fromlist=[attrname]), attrname)
+                if not issubclass(cap, Capability):
+                    return None
+                caps.update(c.__name__ for c in cap.__mro__
+                            if issubclass(c, Capability) and c is not Capability)
+            else:
+                return None
+        if not is_module:
+            return None
+
+        attrs = {}
+        for node in klass.body:
+            if isinstance(node, ast.Assign) and len(node.targets) == 1 and \
+               isinstance(node.targets[0], ast.Name):
+                attrs[node.targets[0].id] = node.value
+
+        values = {}
+        for attrname in cls.MODULE_REQUIRED_ATTRS + ('ICON',):
+            if attrname not in attrs:
+                continue
+            try:
+                values[attrname] = ast.literal_eval(attrs[attrname])
+            except ValueError:
+                return None
+        if any(attrname not in values for attrname in cls.MODULE_REQUIRED_ATTRS):
+            return None
+
+        m = ModuleInfo(values['NAME'])
+        m.capabilities = list(caps)
+        m.description = values['DESCRIPTION']
+        m.maintainer = u'%s <%s>' % (values['MAINTAINER'], values['EMAIL'])
+        m.license = values['LICENSE']
+        m.icon = values.get('ICON') or ''
+        return m
+
+    @staticmethod
+    def get_tree_signature(path):
+        """
+        Get the modification time of the most recent file in a tree, and a
+        hash of names, sizes and modification times of its files.
+
+        :rtype: tuple[:class:`int`, :class:`str`]
+        """
+        mtime = 0
+        files_info = []
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for f in sorted(files):
+                if f.endswith('.pyc'):
+                    continue
+                st = os.stat(os.path.join(root, f))
+                mtime = max(mtime, st.st_mtime)
+                files_info.append((os.path.relpath(os.path.join(root, f), path), st.st_size, st.st_mtime))
+
+        if mtime:
+            mtime = int(datetime.fromtimestamp(mtime).strftime('%Y%m%d%H%M'))
+        signature = hashlib.sha1(repr(files_info).encode('utf-8')).hexdigest()
+        return mtime, signature
 
     @staticmethod
     def get_tree_mtime(path, include_root=False):
         mtime = 0
         if include_root:
-            mtime = int(datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y%m%d%H%M'))
+            mtime = os.path.getmtime(path)
         for root, dirs, files in os.walk(path):
             for f in files:
                 if f.endswith('.pyc'):
                     continue
-                m = int(datetime.fromtimestamp(os.path.getmtime(os.path.join(root, f))).strftime('%Y%m%d%H%M'))
-                mtime = max(mtime, m)
+                mtime = max(mtime, os.path.getmtime(os.path.join(root, f)))
 
+        if mtime:
+            mtime = int(datetime.fromtimestamp(mtime).strftime('%Y%m%d%H%M'))
         return mtime
 
     def save(self, filename, private=False):
@@ -456,14 +640,20 @@ class Repositories(object):
         else:
             self.load()
 
-    def load_browser(self):
+    def create_browser(self):
+        """
+        Create a new browser to download repositories and modules.
+        """
         from weboob.browser.browsers import Browser
         from weboob.browser.profiles import Weboob as WeboobProfile
 
         class WeboobBrowser(Browser):
             PROFILE = WeboobProfile(self.version)
+        return WeboobBrowser()
+
+    def load_browser(self):
         if self.browser is None:
-            self.browser = WeboobBrowser()
+            self.browser = self.create_browser()
 
     def create_dir(self, name):
         if not os.path.exists(name):
@@ -524,11 +714,15 @@ class Repositories(object):
     def get_module_icon_path(self, module):
         return os.path.join(self.icons_dir, '%s.png' % module.name)
 
-    def retrieve_icon(self, module):
+    def retrieve_icon(self, module, browser=None):
         """
         Retrieve the icon of a module and save it in ~/.local/share/weboob/icons/.
+
+        :param browser: browser to use, instead of :attr:`browser`
+        :type browser: :class:`weboob.browser.browsers.Browser`
         """
         self.load_browser()
+        browser = browser or self.browser
         if not isinstance(module, ModuleInfo):
             module = self.get_module_info(module)
 
@@ -545,7 +739,7 @@ class Repositories(object):
                 icon_url = module.url.replace('.tar.gz', '.png')
 
         try:
-            icon = self.browser.open(icon_url)
+            icon = browser.open(icon_url)
         except BrowserHTTPNotFound:
             pass  # no icon, no problem
         else:
@@ -629,19 +823,7 @@ class Repositories(object):
             progress.progress(1.0, 'All modules are up-to-date.')
             return
 
-        class InstallProgress(PrintProgress):
-            def __init__(self, n):
-                self.n = n
-
-            def progress(self, percent, message):
-                progress.progress(float(self.n)/len(to_update) + 1.0/len(to_update)*percent, message)
-
-        for n, info in enumerate(to_update):
-            inst_progress = InstallProgress(n)
-            try:
-                self.install(info, inst_progress)
-            except ModuleInstallError as e:
-                inst_progress.progress(1.0, unicode(e))
+        self.install_many(to_update, progress)
 
     def install(self, module, progress=PrintProgress()):
         """
@@ -652,7 +834,6 @@ class Repositories(object):
         :param progress: observer object
         :type progress: :class:`IProgress`
         """
-        import tarfile
         self.load_browser()
 
         if isinstance(module, ModuleInfo):
@@ -667,52 +848,214 @@ class Repositories(object):
 
         module = info
 
+        progress.progress(0.3, self._check_install(module))
+
+        progress.progress(0.2, 'Downloading module...')
+        tardata = self._download_module(module)
+
+        # Check signature
+        if self._must_check_signature(module):
+            progress.progress(0.5, 'Checking module authenticity...')
+            self._check_signature(module, tardata)
+
+        progress.progress(0.7, 'Setting up module...')
+        tmpdir = _extract_module(tardata, self.modules_dir, module.name)
+        self._setup_module(module, tmpdir)
+
+        progress.progress(0.9, 'Downloading icon...')
+        self.retrieve_icon(module)
+
+        progress.progress(1.0, 'Module %s has been installed!' % module.name)
+
+    def install_many(self, modules, progress=PrintProgress(), max_workers=8):
+        """
+        Install several modules at once.
+
+        Modules are downloaded and their signatures are checked by a pool
+        of threads, then they are extracted and byte-compiled by a pool of
+        processes. Each module only replaces the installed version once it
+        is completely set up, so a failure leaves it untouched.
+
+        Errors are reported to *progress* and don't stop other installs.
+
+        :param modules: modules to install
+        :type modules: list[:class:`ModuleInfo`]
+        :param progress: observer object
+        :type progress: :class:`IProgress`
+        :param max_workers: maximum number of modules downloaded at the same time
+        :type max_workers: :class:`int`
+        :returns: error messages of modules which failed to install, by name
+        :rtype: :class:`dict`
+        """
+        self.load_browser()
+        errors = {}
+
+        if ThreadPoolExecutor is None:
+            for n, module in enumerate(modules):
+                try:
+                    self.install(module, _ModuleProgress(progress, n, len(modules)))
+                except ModuleInstallError as e:
+                    errors[module.name] = unicode(e)
+                    progress.progress(float(n + 1) / len(modules), unicode(e))
+            return errors
+
+        try:
+            processes = ProcessPoolExecutor()
+            # Processes are forked on the first submitted task: do it before
+            # any thread is started, as only the forking thread exists in
+            # the child.
+            processes.submit(os.getpid).result()
+        except (NotImplementedError, OSError):
+            # For example when semaphores are not available.
+            processes = None
+
+        # A requests session is not thread-safe, so each thread has its own
+        # browser.
+        thread_data = local()
+        browsers = []
+
+        def get_browser():
+            if not hasattr(thread_data, 'browser'):
+                thread_data.browser = self.create_browser()
+                browsers.append(thread_data.browser)
+            return thread_data.browser
+
+        def prepare(module):
+            browser = get_browser()
+            tardata = self._download_module(module, browser)
+            if self._must_check_signature(module):
+                self._check_signature(module, tardata, browser)
+            if processes is None:
+                return _extract_module(tardata, self.modules_dir, module.name)
+            return processes.submit(_extract_module, tardata, self.modules_dir, module.name).result()
+
+        def retrieve_icon(module):
+            self.retrieve_icon(module, get_browser())
+
+        done = 0
+        futures = {}
+        consumed = set()
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as threads:
+                try:
+                    for module in modules:
+                        try:
+                            self._check_install(module)
+                        except ModuleInstallError as e:
+                            errors[module.name] = unicode(e)
+                            done += 1
+                            progress.progress(float(done) / len(modules), unicode(e))
+                        else:
+                            futures[threads.submit(prepare, module)] = module
+
+                    if futures:
+                        progress.progress(float(done) / len(modules), 'Downloading %d modules...' % len(futures))
+
+                    icons = []
+                    for future in as_completed(futures):
+                        consumed.add(future)
+                        module = futures[future]
+                        try:
+                            self._setup_module(module, future.result())
+                        except ModuleInstallError as e:
+                            errors[module.name] = unicode(e)
+                            message = unicode(e)
+                        except Exception as e:
+                            self.logger.error('Unable to install %s: %s', module.name, get_backtrace(e))
+                            errors[module.name] = message = 'Unable to install %s: %s' % (module.name, to_unicode(e))
+                        else:
+                            icons.append(threads.submit(retrieve_icon, module))
+                            message = 'Module %s has been installed!' % module.name
+                        done += 1
+                        progress.progress(float(done) / len(modules), message)
+
+                    for future in icons:
+                        try:
+                            future.result()
+                        except Exception as e:
+                            self.logger.warning('Unable to retrieve icon: %s', e)
+                finally:
+                    for future in futures:
+                        future.cancel()
+        finally:
+            # Remove modules extracted but not installed, if the loop above
+            # has been interrupted.
+            for future in futures:
+                if future not in consumed and not future.cancelled() and future.exception() is None:
+                    shutil.rmtree(future.result(), ignore_errors=True)
+            for browser in browsers:
+                browser.deinit()
+            if processes is not None:
+                processes.shutdown()
+
+        return errors
+
+    def _check_install(self, module):
+        """
+        Check that a module can be installed, and get a message about what
+        will be done.
+        """
         if module.is_local():
             raise ModuleInstallError('%s is available on local.' % module.name)
 
         module_dir = os.path.join(self.modules_dir, module.name)
         installed = self.versions.get(module.name)
         if installed is None or not os.path.exists(module_dir):
-            progress.progress(0.3, 'Module %s is not installed yet' % module.name)
+            return 'Module %s is not installed yet' % module.name
         elif module.version > installed:
-            progress.progress(0.3, 'A new version of %s is available' % module.name)
+            return 'A new version of %s is available' % module.name
         else:
             raise ModuleInstallError('The latest version of %s is already installed' % module.name)
 
-        progress.progress(0.2, 'Downloading module...')
+    def _download_module(self, module, browser=None):
+        browser = browser or self.browser
         try:
-            tardata = self.browser.open(module.url).content
+            return browser.open(module.url).content
         except BrowserHTTPError as e:
             raise ModuleInstallError('Unable to fetch module: %s' % e)
 
-        # Check signature
-        if module.signed and (Keyring.find_gpg() or Keyring.find_gpgv()):
-            progress.progress(0.5, 'Checking module authenticity...')
-            sig_data = self.browser.open(posixpath.join(module.url + '.sig')).content
-            keyring_path = os.path.join(self.keyrings_dir, self.url2filename(module.repo_url))
-            keyring = Keyring(keyring_path)
-            if not keyring.exists():
-                raise ModuleInstallError('No keyring found, please update repos.')
-            if not keyring.is_valid(tardata, sig_data):
-                raise ModuleInstallError('Invalid signature for %s.' % module.name)
-
-        # Extract module from tarball.
-        if os.path.isdir(module_dir):
-            shutil.rmtree(module_dir)
-        progress.progress(0.7, 'Setting up module...')
-        with closing(tarfile.open('', 'r:gz', BytesIO(tardata))) as tar:
-            tar.extractall(self.modules_dir)
-        if not os.path.isdir(module_dir):
-            raise ModuleInstallError('The archive for %s looks invalid.' % module.name)
-        # Precompile
-        compile_dir(module_dir, quiet=True)
-
-        self.versions.set(module.name, module.version)
+    def _must_check_signature(self, module):
+        return module.signed and (Keyring.find_gpg() or Keyring.find_gpgv())
 
-        progress.progress(0.9, 'Downloading icon...')
-        self.retrieve_icon(module)
+    def _check_signature(self, module, tardata, browser=None):
+        browser = browser or self.browser
+        try:
+            sig_data = browser.open(posixpath.join(module.url + '.sig')).content
+        except BrowserHTTPError as e:
+            raise ModuleInstallError('Unable to fetch signature of %s: %s' % (module.name, e))
+        keyring_path = os.path.join(self.keyrings_dir, self.url2filename(module.repo_url))
+        keyring = Keyring(keyring_path)
+        if not keyring.exists():
+            raise ModuleInstallError('No keyring found, please update repos.')
+        if not keyring.is_valid(tardata, sig_data):
+            raise ModuleInstallError('Invalid signature for %s.' % module.name)
 
-        progress.progress(1.0, 'Module %s has been installed!' % module.name)
+    def _setup_module(self, module, tmpdir):
+        """
+        Replace the installed version of a module by the one extracted in
+        *tmpdir* by :func:`_extract_module`.
+        """
+        module_dir = os.path.join(self.modules_dir, module.name)
+        old_dir = os.path.join(tmpdir, '%s.old' % module.name)
+        previous_version = self.versions.get(module.name)
+        try:
+            if os.path.exists(module_dir):
+                os.rename(module_dir, old_dir)
+            os.rename(os.path.join(tmpdir, module.name), module_dir)
+            self.versions.set(module.name, module.version)
+        except (IOError, OSError) as e:
+            # Put back the previous version.
+            if os.path.exists(old_dir):
+                if os.path.exists(module_dir):
+                    shutil.rmtree(module_dir)
+                os.rename(old_dir, module_dir)
+            if previous_version is None:
+                self.versions.versions.pop(module.name, None)
+            else:
+                self.versions.versions[module.name] = previous_version
+            raise ModuleInstallError('Unable to install %s: %s' % (module.name, e))
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
 
     @staticmethod
     def url2filename(url):
@@ -724,6 +1067,54 @@ class Repositories(object):
         return ''.join([l if l.isalnum() else '_' for l in url])
 
 
+class _ModuleProgress(IProgress):
+    """
+    Report progress of the install of the n-th module out of *count*.
+    """
+
+    def __init__(self, progress, n, count):
+        self.parent = progress
+        self.n = n
+        self.count = count
+
+    def progress(self, percent, message):
+        self.parent.progress(float(self.n) / self.count + 1.0 / self.count * percent, message)
+
+    def error(self, message):
+        self.parent.error(message)
+
+    def prompt(self, message):
+        return self.parent.prompt(message)
+
+
+def _extract_module(tardata, modules_dir, name):
+    """
+    Extract a module from its tarball in a temporary directory of
+    *modules_dir*, and byte-compile it.
+
+    It can be run in another process.
+
+    :returns: path of the temporary directory
+    :rtype: :class:`str`
+    """
+    tmpdir = tempfile.mkdtemp(prefix='.%s-' % name, dir=modules_dir)
+    try:
+        try:
+            with closing(tarfile.open('', 'r:gz', BytesIO(tardata))) as tar:
+                tar.extractall(tmpdir)
+        except tarfile.TarError as e:
+            raise ModuleInstallError('Unable to extract %s: %s' % (name, e))
+        module_dir = os.path.join(tmpdir, name)
+        if not os.path.isdir(module_dir):
+            raise ModuleInstallError('The archive for %s looks invalid.' % name)
+        # Precompile, with the path of the module once installed.
+        compile_dir(module_dir, ddir=os.path.join(modules_dir, name), quiet=True)
+    except:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
+    return tmpdir
+
+
 class InvalidSignature(Exception):
     def __init__(self, filename):
         self.filename = filename
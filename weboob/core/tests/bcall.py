@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from textwrap import dedent
+from threading import Event, Lock, current_thread
+from time import sleep
+from unittest import TestCase, skipIf
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+from weboob.core.bcall import BackendsCall, AsyncBackendsCall, CallErrors
+from weboob.core.executor import BackendsExecutor
+from weboob.core.ouiboube import WebNip
+from weboob.tools.backend import Module
+
+
+class MyModule(Module):
+    NAME = 'mymodule'
+
+    def iter_numbers(self, count):
+        for i in range(count):
+            yield i
+
+    def iter_broken(self):
+        yield 'ok'
+        raise ValueError('broken')
+
+    def get_thread(self):
+        return current_thread().name
+
+    def iter_nested(self, others):
+        outer = current_thread().name
+        for res in BackendsCall(others, 'get_thread'):
+            yield (outer, res)
+
+
+class OtherModule(MyModule):
+    NAME = 'othermodule'
+
+    def get_error(self):
+        raise ValueError('error of %s' % self.name)
+
+
+class ConcurrentModule(MyModule):
+    NAME = 'concurrentmodule'
+    CONCURRENT_CALLS = ('iter_outer',)
+
+    def iter_outer(self):
+        for res in self.weboob.do('get_shared', backends=[self]):
+            yield res
+
+    def get_shared(self):
+        return self.lock.is_shared_owned()
+
+
+class BackendsCallTest(TestCase):
+    def setUp(self):
+        self.weboob = WebNip(modules_path=False)
+
+    def tearDown(self):
+        self.weboob.deinit()
+
+    def test_order(self):
+        backends = [MyModule(self.weboob, 'a'), MyModule(self.weboob, 'b')]
+        results = {}
+        for res in BackendsCall(backends, lambda backend: ((backend.name, i) for i in range(50))):
+            results.setdefault(res[0], []).append(res[1])
+        # Results of each backend are delivered in order.
+        self.assertEqual(results, {'a': list(range(50)), 'b': list(range(50))})
+
+    def test_errors(self):
+        backends = [MyModule(self.weboob, 'a'), OtherModule(self.weboob, 'b')]
+        call = BackendsCall(backends, 'iter_broken')
+        results = []
+        with self.assertRaises(CallErrors) as cm:
+            for res in call:
+                results.append(res)
+        self.assertEqual(results, ['ok', 'ok'])
+        self.assertEqual(sorted(backend.name for backend, error, backtrace in cm.exception), ['a', 'b'])
+
+        call = BackendsCall(backends[1:], 'get_error')
+        with self.assertRaises(CallErrors) as cm:
+            call.wait()
+        (backend, error, backtrace), = cm.exception.errors
+        self.assertIs(backend, backends[1])
+        self.assertIsInstance(error, ValueError)
+        self.assertIn('error of b', backtrace)
+
+    def test_missing_method(self):
+        call = BackendsCall([MyModule(self.weboob, 'a')], 'iter_nothing')
+        with self.assertRaises(CallErrors):
+            list(call)
+
+    def test_no_backend(self):
+        call = BackendsCall([], 'iter_numbers', 3)
+        self.assertTrue(call.is_finished())
+        self.assertEqual(list(call), [])
+
+    def test_main_thread(self):
+        # Tests are run by the main thread, which waits on a pipe on Python 2.
+        resume = Event()
+
+        def slow(backend):
+            yield 1
+            resume.wait(5)
+            yield 2
+
+        call = BackendsCall([MyModule(self.weboob, 'a')], slow)
+        self.assertEqual(call.get_response(), 1)
+        resume.set()
+        self.assertEqual(call.get_response(), 2)
+        self.assertIs(call.get_response(), call.END)
+        self.assertIsNone(call.wakeup)
+        self.assertIs(call.get_response(), call.END)
+
+    def test_stop(self):
+        produced = []
+        resume = Event()
+
+        def slow(backend):
+            for i in range(100):
+                produced.append(i)
+                yield i
+                resume.wait(5)
+
+        call = BackendsCall([MyModule(self.weboob, 'a')], slow)
+        results = []
+        for res in call:
+            results.append(res)
+            call.stop()
+            resume.set()
+        call.wait()
+        self.assertEqual(results, [0])
+        # The generator is stopped at the next result.
+        self.assertLessEqual(len(produced), 2)
+        self.assertTrue(call.is_finished())
+
+    def test_callback_thread(self):
+        results = []
+        errors = []
+        finished = Event()
+        backends = [MyModule(self.weboob, 'a'), OtherModule(self.weboob, 'b')]
+        call = BackendsCall(backends, 'iter_broken')
+        thread = call.callback_thread(results.append,
+                                      lambda backend, error, backtrace: errors.append(backend.name),
+                                      finished.set)
+        thread.join(10)
+        self.assertTrue(finished.is_set())
+        self.assertEqual(results, ['ok', 'ok'])
+        self.assertEqual(sorted(errors), ['a', 'b'])
+
+    def test_nested_call(self):
+        outer = MyModule(self.weboob, 'a')
+        others = [OtherModule(self.weboob, 'b%d' % i) for i in range(3)]
+        results = list(BackendsCall([outer], 'iter_nested', others))
+        self.assertEqual(len(results), 3)
+        # The nested call is run in the worker which made it, instead of
+        # waiting for other workers.
+        for outer_thread, inner_thread in results:
+            self.assertEqual(outer_thread, inner_thread)
+            self.assertTrue(outer_thread.startswith('weboob-worker-'))
+
+    def test_nested_call_concurrent(self):
+        # The shared lock of a concurrent call can't be upgraded to run the
+        # nested call.
+        backend = ConcurrentModule(self.weboob, 'a')
+        self.assertEqual(list(BackendsCall([backend], 'iter_outer')), [True])
+        self.assertEqual(list(BackendsCall([backend], 'get_shared')), [False])
+
+    def test_nested_call_single_worker(self):
+        weboob = WebNip(modules_path=False, executor=BackendsExecutor(max_workers=1))
+        try:
+            outer = MyModule(weboob, 'a')
+            others = [OtherModule(weboob, 'b%d' % i) for i in range(3)]
+            # Would wait forever if the nested call was queued.
+            call = BackendsCall([outer], 'iter_nested', others)
+            self.assertTrue(call.finished_event.wait(10))
+            self.assertEqual(len(list(call)), 3)
+        finally:
+            weboob.deinit()
+
+
+class BackendsExecutorTest(TestCase):
+    def test_module_limit(self):
+        executor = BackendsExecutor(max_workers=10, module_limit=2)
+        weboob = WebNip(modules_path=False, executor=executor)
+        lock = Lock()
+        active = [0, 0]
+
+        def task(backend):
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            Event().wait(0.02)
+            with lock:
+                active[0] -= 1
+            return backend.name
+
+        try:
+            backends = [MyModule(weboob, 'b%d' % i) for i in range(6)]
+            self.assertEqual(sorted(BackendsCall(backends, task)), sorted(b.name for b in backends))
+            self.assertEqual(active[1], 2)
+        finally:
+            weboob.deinit()
+
+    def test_deinit_shutdown(self):
+        weboob = WebNip(modules_path=False, executor=BackendsExecutor(max_workers=4))
+        backends = [MyModule(weboob, 'b%d' % i) for i in range(4)]
+        self.assertEqual(len(list(BackendsCall(backends, 'iter_numbers', 5))), 20)
+        workers = list(weboob.executor.workers)
+        self.assertTrue(workers)
+
+        weboob.deinit()
+        self.assertEqual(weboob.executor.stats()['workers'], 0)
+        for thread in workers:
+            self.assertFalse(thread.is_alive())
+
+        # The executor can be used again.
+        self.assertEqual(sorted(BackendsCall(backends[:1], 'iter_numbers', 2)), [0, 1])
+        weboob.executor.shutdown()
+
+    def test_error_in_task(self):
+        executor = BackendsExecutor(max_workers=1)
+        done = Event()
+
+        def broken():
+            raise ValueError('not handled')
+
+        try:
+            executor.submit(None, broken)
+            executor.submit(None, done.set)
+            # The worker survives errors of tasks.
+            self.assertTrue(done.wait(10))
+        finally:
+            executor.shutdown()
+
+
+class FakeBackend(object):
+    """
+    Minimal backend, as :class:`Module` can't be built on Python 3 yet.
+    """
+
+    NAME = 'fakemodule'
+
+    def __init__(self, executor, name):
+        self.weboob = self
+        self.executor = executor
+        self.name = name
+        self.lock = Lock()
+
+    def __enter__(self):
+        self.lock.acquire()
+
+    def __exit__(self, t, v, tb):
+        self.lock.release()
+
+    def is_concurrent_call(self, function):
+        return False
+
+    def iter_results(self):
+        for i in range(3):
+            yield '%s-%d' % (self.name, i)
+
+
+class ErrorBackend(FakeBackend):
+    def iter_results(self):
+        raise ValueError('error of %s' % self.name)
+
+
+class SlowBackend(FakeBackend):
+    produced = 0
+
+    def iter_results(self):
+        for i in range(20):
+            self.produced += 1
+            yield i
+            sleep(0.01)
+
+
+if asyncio is not None:
+    # The "async" syntax can't be parsed by Python 2.
+    exec(dedent("""
+        class CoroutineBackend(FakeBackend):
+            async def iter_results(self):
+                await asyncio.sleep(0)
+                return ['%s-%d' % (self.name, i) for i in range(3)]
+
+        class AsyncGeneratorBackend(FakeBackend):
+            async def iter_results(self):
+                for i in range(3):
+                    await asyncio.sleep(0)
+                    yield '%s-%d' % (self.name, i)
+
+        class EndlessBackend(FakeBackend):
+            produced = 0
+
+            async def iter_results(self):
+                while True:
+                    self.produced += 1
+                    yield self.produced
+                    await asyncio.sleep(0)
+
+        class StuckCoroutineBackend(FakeBackend):
+            async def iter_results(self):
+                await asyncio.sleep(3600)
+    """))
+
+
+@skipIf(asyncio is None, 'asyncio is not available')
+class AsyncBackendsCallTest(TestCase):
+    def setUp(self):
+        self.executor = BackendsExecutor()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        if not self.loop.is_closed():
+            self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def collect(self, call, count=None):
+        """
+        Get results like ``async for`` does, stopping after *count* results.
+        """
+        results = []
+        iterator = call.__aiter__()
+        while count is None or len(results) < count:
+            try:
+                results.append(self.loop.run_until_complete(iterator.__anext__()))
+            except StopAsyncIteration:
+                break
+        return results
+
+    def test_results_and_errors(self):
+        call = AsyncBackendsCall([FakeBackend(self.executor, 'sync'),
+                                  CoroutineBackend(self.executor, 'coro'),
+                                  AsyncGeneratorBackend(self.executor, 'agen'),
+                                  ErrorBackend(self.executor, 'error')],
+                                 'iter_results')
+        results = []
+        with self.assertRaises(CallErrors) as cm:
+            while True:
+                results.extend(self.collect(call, 1))
+        (backend, error, backtrace), = cm.exception.errors
+        self.assertEqual(backend.name, 'error')
+        self.assertIsInstance(error, ValueError)
+
+        self.assertEqual(sorted(results), ['%s-%d' % (name, i) for name in ('agen', 'coro', 'sync') for i in range(3)])
+        # Results of a backend are in order.
+        for name in ('agen', 'coro', 'sync'):
+            self.assertEqual([r for r in results if r.startswith(name)], ['%s-%d' % (name, i) for i in range(3)])
+        self.assertTrue(call.is_finished())
+
+    def test_aclose(self):
+        endless = EndlessBackend(self.executor, 'endless')
+        stuck = StuckCoroutineBackend(self.executor, 'stuck')
+        call = AsyncBackendsCall([endless, stuck], 'iter_results')
+        self.assertEqual(self.collect(call, 3), [1, 2, 3])
+
+        self.loop.run_until_complete(call.aclose())
+        # Let cancelled tasks end.
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertTrue(call.is_finished())
+        self.assertEqual(call.errors, [])
+        produced = endless.produced
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertEqual(endless.produced, produced)
+        self.assertEqual(self.collect(call), [])
+
+    def test_closed_loop(self):
+        slow = SlowBackend(self.executor, 'slow')
+        call = AsyncBackendsCall([slow], 'iter_results')
+        self.assertEqual(self.collect(call, 1), [0])
+
+        # The consumer goes away without closing the call.
+        self.loop.close()
+        self.assertTrue(call.finished_event.wait(10))
+        self.assertEqual(call.errors, [])
+        self.assertEqual(slow.produced, 20)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+
+from weboob.core.ouiboube import WebNip
+from weboob.tools.backend import Module
+from weboob.tools.storage import IStorage
+
+
+class MyStorage(IStorage):
+    def __init__(self, error=None):
+        self.error = error
+        self.batches = 0
+        self.saved = []
+
+    def load(self, what, name, default={}):
+        pass
+
+    def save(self, what, name):
+        self.saved.append((name, self.batches))
+
+    def batch(self):
+        return MyBatch(self)
+
+
+class MyBatch(object):
+    # Not a generator, which would be ended when it is garbage collected.
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __enter__(self):
+        self.storage.batches += 1
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.storage.batches -= 1
+        if self.storage.error is not None:
+            raise self.storage.error
+
+
+class MyModule(Module):
+    NAME = 'mymodule'
+
+    def deinit(self):
+        self.storage.save()
+
+
+class UnloadBackendsTest(TestCase):
+    def setUp(self):
+        self.weboob = WebNip(modules_path=False)
+
+    def add_backend(self, name, storage):
+        self.weboob.backend_instances[name] = MyModule(self.weboob, name, storage=storage)
+
+    def test_batch(self):
+        storage = MyStorage()
+        self.add_backend('a', storage)
+        self.add_backend('b', storage)
+        self.add_backend('c', None)
+        self.assertEqual(sorted(self.weboob.unload_backends()), ['a', 'b', 'c'])
+        # Saved in a single batch.
+        self.assertEqual(sorted(storage.saved), [('a', 1), ('b', 1)])
+        self.assertEqual(storage.batches, 0)
+
+    def test_batch_error(self):
+        storages = [MyStorage(), MyStorage(ValueError('first')), MyStorage(), MyStorage(ValueError('last'))]
+        for n, storage in enumerate(storages):
+            self.add_backend(str(n), storage)
+
+        self.assertRaises(ValueError, self.weboob.unload_backends, ['0', '1', '2', '3'])
+        self.assertEqual(self.weboob.backend_instances, {})
+        # All batches are ended, so later saves are not deferred.
+        for storage in storages:
+            self.assertEqual(storage.batches, 0)
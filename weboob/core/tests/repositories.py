@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tarfile
+import tempfile
+from io import BytesIO
+from threading import current_thread
+from unittest import TestCase
+
+from requests.exceptions import ConnectionError
+
+from weboob.core.repositories import ModuleInfo, Repositories, Repository, IProgress
+
+
+def make_tarball(name):
+    data = BytesIO()
+    tar = tarfile.open(mode='w:gz', fileobj=data)
+    content = b'VERSION = 1\n'
+    info = tarfile.TarInfo('%s/__init__.py' % name)
+    info.size = len(content)
+    tar.addfile(info, BytesIO(content))
+    tar.close()
+    return data.getvalue()
+
+
+class MyResponse(object):
+    def __init__(self, content):
+        self.content = content
+
+
+class MyBrowser(object):
+    def __init__(self):
+        self.threads = set()
+
+    def open(self, url):
+        self.threads.add(current_thread())
+        if 'broken' in url:
+            raise ConnectionError('connection refused')
+        if url.endswith('.png'):
+            return MyResponse(b'icon')
+        return MyResponse(make_tarball(url.rsplit('/', 1)[1].split('.')[0]))
+
+    def deinit(self):
+        pass
+
+
+class MyRepositories(Repositories):
+    def __init__(self, *args, **kwargs):
+        self.browsers = []
+        super(MyRepositories, self).__init__(*args, **kwargs)
+
+    def create_browser(self):
+        browser = MyBrowser()
+        self.browsers.append(browser)
+        return browser
+
+
+class MyProgress(IProgress):
+    def __init__(self):
+        self.messages = []
+
+    def progress(self, percent, message):
+        self.messages.append(message)
+
+
+class RepositoriesTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        # Prevent from updating repositories.
+        with open(os.path.join(self.path, Repositories.SOURCES_LIST), 'w'):
+            pass
+        self.repositories = MyRepositories(self.path, self.path, '1.0')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def make_module(self, name):
+        module = ModuleInfo(name)
+        module.url = 'http://weboob.org/modules/%s.tar.gz' % name
+        module.repo_url = 'http://weboob.org/modules/'
+        module.version = 1
+        module.signed = False
+        return module
+
+    def test_install_many(self):
+        modules = [self.make_module(name) for name in ('foo', 'broken', 'bar')]
+        progress = MyProgress()
+        errors = self.repositories.install_many(modules, progress, max_workers=2)
+
+        self.assertEqual(list(errors), ['broken'])
+        self.assertIn('connection refused', errors['broken'])
+        self.assertEqual(self.repositories.versions.get('foo'), 1)
+        self.assertEqual(self.repositories.versions.get('bar'), 1)
+        self.assertIsNone(self.repositories.versions.get('broken'))
+        self.assertEqual(sorted(os.listdir(self.repositories.modules_dir)), ['bar', 'foo', 'versions.list'])
+        self.assertTrue(os.path.exists(self.repositories.get_module_icon_path(modules[0])))
+        self.assertIn('Module foo has been installed!', progress.messages)
+
+        # The main browser is not shared by the workers.
+        self.assertTrue(len(self.repositories.browsers) > 1)
+        for browser in self.repositories.browsers:
+            self.assertTrue(len(browser.threads) <= 1)
+
+
+MODULE_INIT = b"""from .module import FooModule
+
+__all__ = ['FooModule']
+"""
+
+MODULE_SOURCE = b"""from weboob.tools.backend import Module
+from weboob.capabilities.base import Capability
+
+
+class FooModule(Module, Capability):
+    NAME = 'foo'
+    MAINTAINER = u'Romain Bignon'
+    EMAIL = 'romain@weboob.org'
+    VERSION = '1.3'
+    DESCRIPTION = u'Foo'
+    LICENSE = 'AGPLv3+'
+"""
+
+
+class BuildIndexTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.source = os.path.join(self.path, 'source')
+        self.published = os.path.join(self.path, 'published')
+        os.makedirs(os.path.join(self.source, 'foo'))
+        os.makedirs(self.published)
+        with open(os.path.join(self.source, 'foo', '__init__.py'), 'wb') as f:
+            f.write(MODULE_INIT)
+        with open(os.path.join(self.source, 'foo', 'module.py'), 'wb') as f:
+            f.write(MODULE_SOURCE)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_build_index(self):
+        index = os.path.join(self.published, Repository.INDEX)
+        repository = Repository('file://%s' % self.source)
+        repository.build_index(self.source, index)
+        self.assertEqual(list(repository.modules), ['foo'])
+        self.assertEqual(repository.modules['foo'].maintainer, u'Romain Bignon <romain@weboob.org>')
+
+        # The cache is kept with the sources, not with the published index.
+        self.assertEqual(os.listdir(self.published), [Repository.INDEX])
+        self.assertTrue(os.path.exists(os.path.join(self.source, Repository.INDEX_CACHE)))
+
+        repository = Repository('file://%s' % self.source)
+        repository.build_index(self.source, index)
+        self.assertEqual(list(repository.modules), ['foo'])
+        self.assertEqual(repository.modules['foo'].description, u'Foo')
@@ -194,8 +194,8 @@ class Application(object):
         :rtype: :class:`weboob.tools.storage.IStorage`
         """
         if klass is None:
-            from weboob.tools.storage import StandardStorage
-            klass = StandardStorage
+            from weboob.tools.storage import ShardedStorage
+            klass = ShardedStorage
 
         if path is None:
             path = os.path.join(self.CONFDIR, self.APPNAME + '.storage')
@@ -18,18 +18,20 @@
 
 
 import os
-from threading import RLock
+from contextlib import contextmanager
+from threading import Condition, Lock, local
 from copy import copy
 
 from weboob.capabilities.base import BaseObject, FieldNotFound, \
     Capability, NotLoaded, NotAvailable
 from weboob.tools.misc import iter_fields
 from weboob.tools.log import getLogger
+from weboob.tools.rwlock import RWLock
 from weboob.tools.value import ValuesDict
 from weboob.exceptions import ModuleInstallError
 
 
-__all__ = ['BackendStorage', 'BackendConfig', 'Module']
+__all__ = ['BackendStorage', 'BackendConfig', 'BrowserPool', 'Module']
 
 
 class BackendStorage(object):
@@ -203,6 +205,65 @@ class BackendConfig(ValuesDict):
         self.weboob.backends_config.add_backend(self.instname, self.modname, dump, edit)
 
 
+class BrowserPool(object):
+    """
+    Pool of browsers used by concurrent calls on a backend.
+
+    Browsers are built lazily with :meth:`Module.create_pool_browser`, up to
+    *size* browsers.
+
+    :param module: backend which owns the browsers
+    :type module: :class:`Module`
+    :param size: maximum number of browsers
+    :type size: :class:`int`
+    """
+
+    def __init__(self, module, size):
+        self.module = module
+        self.size = size
+        self.cond = Condition()
+        self.browsers = []
+        self.free = []
+        self.building = 0
+
+    def acquire(self):
+        """
+        Get a browser, waiting for one to be released if the pool is full.
+        """
+        with self.cond:
+            while not self.free and len(self.browsers) + self.building >= self.size:
+                self.cond.wait()
+            if self.free:
+                return self.free.pop()
+            self.building += 1
+
+        try:
+            browser = self.module.create_pool_browser()
+        finally:
+            with self.cond:
+                self.building -= 1
+                self.cond.notify()
+
+        with self.cond:
+            self.browsers.append(browser)
+        return browser
+
+    def release(self, browser):
+        with self.cond:
+            self.free.append(browser)
+            self.cond.notify()
+
+    def clear(self):
+        """
+        Forget all browsers, and return them.
+        """
+        with self.cond:
+            browsers = self.browsers
+            self.browsers = []
+            self.free = []
+            return browsers
+
+
 class Module(object):
     """
     Base class for modules.
@@ -249,6 +310,16 @@ class Module(object):
     # When the method is called, fields are only the one which are
     # NOT yet filled.
     OBJECTS = {}
+    # Methods which can be called concurrently on a same backend, by name, or
+    # capabilities whose all methods can be called concurrently.
+    # These calls hold a shared lock instead of the exclusive one, and each
+    # one gets its own browser from a pool (see create_pool_browser()).
+    # Calls made on the same backend by these methods (for example with
+    # self.weboob.do(..., backends=[self])) are concurrent calls too, using
+    # the same browser, whatever the called method is.
+    CONCURRENT_CALLS = ()
+    # Maximum number of browsers used by concurrent calls.
+    BROWSER_POOL_SIZE = 4
 
     class ConfigError(Exception):
         """
@@ -261,6 +332,49 @@ class Module(object):
     def __exit__(self, t, v, tb):
         self.lock.release()
 
+    def is_concurrent_call(self, function):
+        """
+        Check if a method can be called concurrently with other calls on
+        this backend, according to :attr:`CONCURRENT_CALLS`.
+
+        :param function: name of the method
+        :type function: :class:`str`
+        :rtype: :class:`bool`
+        """
+        if not isinstance(function, basestring):
+            return False
+
+        for item in self.CONCURRENT_CALLS:
+            if isinstance(item, basestring):
+                if item == function:
+                    return True
+            elif isinstance(self, item) and hasattr(item, function):
+                return True
+        return False
+
+    @contextmanager
+    def concurrent_call(self):
+        """
+        Context manager to use for calls allowed by :attr:`CONCURRENT_CALLS`.
+
+        It holds the shared lock of the backend, and, while it is active,
+        the :attr:`browser` attribute is a browser taken from the pool for
+        the current thread.
+        """
+        with self.lock.shared():
+            if getattr(self._concurrent, 'browser', None) is not None or not self.BROWSER:
+                # Nested call, or nothing to pool.
+                yield
+                return
+
+            browser = self.browser_pool.acquire()
+            self._concurrent.browser = browser
+            try:
+                yield
+            finally:
+                self._concurrent.browser = None
+                self.browser_pool.release(browser)
+
     def __repr__(self):
         return "<Backend %r>" % self.name
 
@@ -268,7 +382,10 @@ class Module(object):
         self.logger = getLogger(name, parent=logger)
         self.weboob = weboob
         self.name = name
-        self.lock = RLock()
+        self.lock = RWLock()
+        self.browser_pool = BrowserPool(self, self.BROWSER_POOL_SIZE)
+        self._concurrent = local()
+        self._browser_lock = Lock()
         if config is None:
             config = {}
 
@@ -285,6 +402,10 @@ class Module(object):
         """
         This abstract method is called when the backend is unloaded.
         """
+        for browser in self.browser_pool.clear():
+            if hasattr(browser, 'deinit'):
+                browser.deinit()
+
         if self._browser is None:
             return
 
@@ -303,7 +424,14 @@ class Module(object):
         of this attribute, to avoid useless pages access.
 
         Note that the :func:`create_default_browser` method is called to create it.
+
+        During a concurrent call (see :attr:`CONCURRENT_CALLS`), this is the
+        browser lent by the pool to the current thread.
         """
+        browser = getattr(self._concurrent, 'browser', None)
+        if browser is not None:
+            return browser
+
         if self._browser is None:
             self._browser = self.create_default_browser()
         return self._browser
@@ -315,6 +443,25 @@ class Module(object):
         """
         return self.create_browser()
 
+    def create_pool_browser(self):
+        """
+        Build a browser for the pool used by concurrent calls.
+
+        It is built like the default browser, and shares the cookies of the
+        default browser, so that sessions are the same.
+        """
+        # Not under the condition of the pool, as building a browser may be
+        # long, and other threads have to return their browsers meanwhile.
+        with self._browser_lock:
+            if self._browser is None:
+                self._browser = self.create_default_browser()
+            main = self._browser
+
+        browser = self.create_default_browser()
+        if hasattr(browser, 'session') and hasattr(main, 'session'):
+            browser.session.cookies = main.session.cookies
+        return browser
+
     def create_browser(self, *args, **kwargs):
         """
         Build a browser from the BROWSER class attribute and the
@@ -339,6 +486,8 @@ class Module(object):
             kwargs.setdefault('responses_dirname', self._private_config['_debug_dir'])
         if self._private_config.get('_highlight_el', ''):
             kwargs.setdefault('highlight_el', bool(int(self._private_config['_highlight_el'])))
+        if getattr(self.weboob, 'transport', None) is not None:
+            kwargs.setdefault('transport', self.weboob.transport)
 
 
         browser = klass(*args, **kwargs)
@@ -22,15 +22,102 @@ import hashlib
 import tempfile
 
 try:
-    from PIL import Image
+    from PIL import Image, ImageChops
 except ImportError:
     raise ImportError('Please install python-imaging')
 
 
+# Modes of images whose bands are stored on 8 bits, like their masks.
+MASK_MODES = ('1', 'L', 'P', 'LA', 'RGB', 'RGBA', 'RGBX', 'CMYK')
+
+# Translation of a mask to the string hashed by VirtKeyboard.checksum().
+CHECKSUM_TABLE = b' ' * 255 + b'.'
+
+_band_tables = {}
+_grid_coords = {}
+
+
+def band_table(value):
+    """
+    Lookup table to use with :meth:`Image.Image.point` to get the mask of
+    pixels of a band which are equal to *value*.
+    """
+    try:
+        return _band_tables[value]
+    except KeyError:
+        table = _band_tables[value] = [255 if v == value else 0 for v in range(256)]
+        return table
+
+
+def grid_coords(symbols, cols, rows, width, height):
+    """
+    Coordinates of keys of a grid keyboard, by symbol.
+
+    They only depend on the layout of the keyboard, so they are shared
+    between keyboards with the same one.
+    """
+    symbols = tuple(symbols)
+    key = (symbols, cols, rows, width, height)
+    try:
+        return _grid_coords[key]
+    except KeyError:
+        pass
+
+    tileW = float(width) / cols
+    tileH = float(height) / rows
+    positions = ((s, i * tileW % width, i / cols * tileH)
+                 for i, s in enumerate(symbols))
+    coords = _grid_coords[key] = dict((s, tuple(map(int, (x, y, x + tileW, y + tileH))))
+                                      for (s, x, y) in positions)
+    return coords
+
+
 class VirtKeyboardError(Exception):
     pass
 
 
+class SymbolsDict(dict):
+    """
+    Hashes of symbols, by symbol, which can be searched by hash.
+
+    The index of symbols by hash is built on the first search, and built
+    again after the dict is changed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SymbolsDict, self).__init__(*args, **kwargs)
+        self._index = None
+
+    def find(self, md5sum):
+        """
+        Get the first symbol with this hash.
+
+        :raises: :class:`KeyError` if there is none
+        """
+        if self._index is None:
+            index = {}
+            for symbol, value in self.items():
+                index.setdefault(value, symbol)
+            self._index = index
+        return self._index[md5sum]
+
+    def _changed(method):
+        def inner(self, *args, **kwargs):
+            self._index = None
+            return method(self, *args, **kwargs)
+        inner.__name__ = method.__name__
+        return inner
+
+    __setitem__ = _changed(dict.__setitem__)
+    __delitem__ = _changed(dict.__delitem__)
+    clear = _changed(dict.clear)
+    pop = _changed(dict.pop)
+    popitem = _changed(dict.popitem)
+    setdefault = _changed(dict.setdefault)
+    update = _changed(dict.update)
+    del _changed
+
+
 class VirtKeyboard(object):
     """
     Handle a virtual keyboard.
@@ -89,6 +176,18 @@ class VirtKeyboard(object):
 
         self.width, self.height = self.image.size
         self.pixar = self.image.load()
+        self._mask = None
+
+    @property
+    def md5(self):
+        """
+        Hashes of symbols, by symbol, as a :class:`SymbolsDict`.
+        """
+        return self._md5
+
+    @md5.setter
+    def md5(self, value):
+        self._md5 = value if isinstance(value, SymbolsDict) else SymbolsDict(value)
 
     def load_symbols(self, coords):
         self.coords = {}
@@ -103,6 +202,49 @@ class VirtKeyboard(object):
     def check_color(self, pixel):
         return pixel == self.color
 
+    def get_mask(self):
+        """
+        Get an image of mode "L" where pixels of the color of symbols are
+        255, and others are 0.
+
+        It can only be computed if :meth:`check_color` isn't overridden
+        and if the image has 8 bits per band.
+
+        :rtype: :class:`Image.Image` or None
+        """
+        check_color = type(self).check_color
+        if getattr(check_color, '__func__', check_color) is not VirtKeyboard.__dict__['check_color'] or \
+           self.image.mode not in MASK_MODES:
+            return None
+
+        if self._mask is not None and self._mask[0] == self.color:
+            return self._mask[1]
+
+        if self.image.mode == '1':
+            bands = [self.image.convert('L')]
+        elif self.image.mode == 'P':
+            # Compare palette indexes, like pixel access does.
+            bands = [Image.frombytes('L', self.image.size, self.image.tobytes())]
+        else:
+            bands = self.image.split()
+
+        # Pixels are compared to the color, so only integers match bands of
+        # single-band images, and tuples match pixels of other ones.
+        if len(bands) == 1:
+            colors = None if isinstance(self.color, (tuple, list)) else (self.color,)
+        else:
+            colors = self.color if isinstance(self.color, tuple) and len(self.color) == len(bands) else None
+
+        if colors is None:
+            mask = Image.new('L', self.image.size, 0)
+        else:
+            mask = bands[0].point(band_table(colors[0]))
+            for band, value in zip(bands[1:], colors[1:]):
+                mask = ImageChops.darker(mask, band.point(band_table(value)))
+
+        self._mask = (self.color, mask)
+        return mask
+
     def get_symbol_coords(self, coords):
         """Return narrow coordinates around symbol."""
         (x1, y1, x2, y2) = coords
@@ -110,6 +252,17 @@ class VirtKeyboard(object):
             top, right, bottom, left = self.margin
             x1, y1, x2, y2 = x1 + left, y1 + top, x2 - right, y2 - bottom
 
+        mask = self.get_mask()
+        if mask is not None and x1 >= 0 and y1 >= 0:
+            x2 = min(x2, self.width - 1)
+            y2 = min(y2, self.height - 1)
+            bbox = None
+            if x1 <= x2 and y1 <= y2:
+                bbox = mask.crop((x1, y1, x2 + 1, y2 + 1)).getbbox()
+            if bbox is None:
+                return (-1, -1, -1, -1)
+            return (x1 + bbox[0], y1 + bbox[1], x1 + bbox[2] - 1, y1 + bbox[3] - 1)
+
         newY1 = -1
         newY2 = -1
         for y in range(y1, min(y2 + 1, self.height)):
@@ -138,13 +291,19 @@ class VirtKeyboard(object):
 
     def checksum(self, coords):
         (x1, y1, x2, y2) = coords
-        s = ''
-        for y in range(y1, min(y2 + 1, self.height)):
-            for x in range(x1, min(x2 + 1, self.width)):
-                if self.check_color(self.pixar[x, y]):
-                    s += "."
-                else:
-                    s += " "
+        x2 = min(x2, self.width - 1)
+        y2 = min(y2, self.height - 1)
+
+        mask = self.get_mask()
+        if mask is not None and x1 >= 0 and y1 >= 0:
+            if x1 > x2 or y1 > y2:
+                s = b''
+            else:
+                s = mask.crop((x1, y1, x2 + 1, y2 + 1)).tobytes().translate(CHECKSUM_TABLE)
+        else:
+            s = ''.join('.' if self.check_color(self.pixar[x, y]) else ' '
+                        for y in range(y1, y2 + 1)
+                        for x in range(x1, x2 + 1))
         return hashlib.md5(s).hexdigest()
 
     def get_symbol_code(self, md5sum_list):
@@ -152,6 +311,13 @@ class VirtKeyboard(object):
             md5sum_list = [md5sum_list]
 
         for md5sum in md5sum_list:
+            if isinstance(self.md5, SymbolsDict):
+                try:
+                    return self.md5.find(md5sum)
+                except KeyError:
+                    continue
+
+            # md5 is a plain dict defined by a subclass.
             for i in self.md5:
                 if md5sum == self.md5[i]:
                     return i
@@ -232,12 +398,7 @@ class GridVirtKeyboard(VirtKeyboard):
     def __init__(self, symbols, cols, rows, image, color, convert=None):
         self.load_image(image, color, convert)
 
-        tileW = float(self.width) / cols
-        tileH = float(self.height) / rows
-        positions = ((s, i * tileW % self.width, i / cols * tileH)
-                     for i, s in enumerate(symbols))
-        coords = dict((s, tuple(map(int, (x, y, x + tileW, y + tileH))))
-                      for (s, x, y) in positions)
+        coords = grid_coords(symbols, cols, rows, self.width, self.height)
 
         super(GridVirtKeyboard, self).__init__()
 
@@ -17,14 +17,24 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with weboob. If not, see <http://www.gnu.org/licenses/>.
 
+from bisect import bisect_right
 from io import BytesIO
 from collections import namedtuple
 import os
+import re
 import subprocess
+import zlib
 from tempfile import mkstemp
 
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
 
-__all__ = ['decompress_pdf', 'get_pdf_rows']
+from weboob.tools.misc import find_exe
+
+
+__all__ = ['decompress_pdf', 'inflate_pdf', 'get_pdf_rows']
 
 
 def decompress_pdf(inpdf):
@@ -32,8 +42,26 @@ def decompress_pdf(inpdf):
     Takes PDF file contents as a string and returns decompressed version
     of the file contents, suitable for text parsing.
 
+    Streams are inflated in-process by :func:`inflate_pdf`. If the document
+    uses features it doesn't support, MuPDF is used if it is installed.
+
     External dependencies:
-    MuPDF (http://www.mupdf.com).
+    MuPDF (http://www.mupdf.com), optional.
+    """
+
+    try:
+        outpdf, complete = inflate_pdf(inpdf)
+    except ValueError:
+        outpdf, complete = None, False
+
+    if outpdf is not None and (complete or not find_exe('mutool')):
+        return outpdf
+    return _mutool_clean(inpdf)
+
+
+def _mutool_clean(inpdf):
+    """
+    Decompress a PDF document with ``mutool clean -d``.
     """
 
     inh, inname = mkstemp(suffix='.pdf')
@@ -51,6 +79,238 @@ def decompress_pdf(inpdf):
     return outpdf
 
 
+PDF_VERSION_RE = re.compile(br'%PDF-\d+\.\d+')
+PDF_OBJ_RE = re.compile(br'(\d+)\s+(\d+)\s+obj\b')
+# Keywords ending the body of an object, and what must be skipped to find
+# them: strings and comments.
+PDF_BODY_TOKEN_RE = re.compile(br'\(|%|>>\s*stream(?:\r\n|\n|\r|\b)|\bendobj\b')
+PDF_STRING_TOKEN_RE = re.compile(br'\\.|\(|\)', re.DOTALL)
+PDF_EOL_RE = re.compile(br'\r\n|\n|\r')
+PDF_ENDSTREAM_RE = re.compile(br'(\r\n|\n|\r)?endstream\b')
+PDF_ENDOBJ_RE = re.compile(br'\s*endobj\b')
+PDF_LENGTH_RE = re.compile(br'/Length\s+(\d+\s+\d+\s+R|\d+)(?![\w.])')
+PDF_FILTER_RE = re.compile(br'/Filter\s*(/[^\s/\[\]<>()]+|\[[^\]]*\])')
+PDF_DECODEPARMS_RE = re.compile(br'/DecodeParms\s*(<<[^<>]*>>|\[[^\]]*\]|null)')
+PDF_TRAILER_KEYS_RE = re.compile(br'/(Root|Info)\s+(\d+\s+\d+\s+R)|/(ID)\s*(\[[^\]]*\])')
+
+
+def _skip_string(data, pos):
+    """
+    Get the position after the literal string whose content starts at *pos*,
+    or None if it is not terminated.
+    """
+    depth = 1
+    while depth:
+        m = PDF_STRING_TOKEN_RE.search(data, pos)
+        if m is None:
+            return None
+        if m.group(0) == b'(':
+            depth += 1
+        elif m.group(0) == b')':
+            depth -= 1
+        pos = m.end()
+    return pos
+
+
+def _find_body_end(data, pos):
+    """
+    Find the ``stream`` or ``endobj`` keyword ending the body of an object
+    starting at *pos*, outside of strings and comments.
+
+    :returns: the match of the keyword, with the closing ``>>`` of the
+              dictionary of a stream, or None if it is not found
+    """
+    while True:
+        m = PDF_BODY_TOKEN_RE.search(data, pos)
+        if m is None:
+            return None
+        if m.group(0) == b'(':
+            pos = _skip_string(data, m.end())
+            if pos is None:
+                return None
+        elif m.group(0) == b'%':
+            eol = PDF_EOL_RE.search(data, m.end())
+            if eol is None:
+                return None
+            pos = eol.end()
+        else:
+            return m
+
+
+def _inflate_stream(stream_dict, data):
+    """
+    Inflate stream data if it is only compressed with FlateDecode.
+
+    :returns: new stream dict and data, or None if the stream can't be
+              decompressed
+    """
+    m = PDF_FILTER_RE.search(stream_dict)
+    if not m:
+        return stream_dict, data
+
+    filters = re.findall(br'/([^\s/\[\]<>()]+)', m.group(1))
+    if filters not in ([b'FlateDecode'], [b'Fl']):
+        return None
+    parms = PDF_DECODEPARMS_RE.search(stream_dict)
+    if parms and b'/Predictor' in parms.group(1):
+        return None
+
+    try:
+        # Like MuPDF, keep what can be inflated from truncated streams.
+        data = zlib.decompressobj().decompress(data)
+    except zlib.error:
+        return None
+
+    stream_dict = PDF_FILTER_RE.sub(b'', stream_dict, 1)
+    if parms:
+        stream_dict = PDF_DECODEPARMS_RE.sub(b'', stream_dict, 1)
+    return stream_dict, data
+
+
+def _set_stream_length(stream_dict, length):
+    if PDF_LENGTH_RE.search(stream_dict):
+        return PDF_LENGTH_RE.sub(b'/Length %d' % length, stream_dict, 1)
+    return stream_dict.replace(b'<<', b'<</Length %d' % length, 1)
+
+
+def _iter_objstm(stream_dict, data):
+    """
+    Yield (number, body) of objects stored in an object stream.
+    """
+    first = int(re.search(br'/First\s+(\d+)', stream_dict).group(1))
+    header = data[:first].split()
+    offsets = [(int(header[i]), first + int(header[i + 1])) for i in range(0, len(header) - 1, 2)]
+    for n, (num, start) in enumerate(offsets):
+        end = offsets[n + 1][1] if n + 1 < len(offsets) else len(data)
+        yield num, data[start:end].strip()
+
+
+def inflate_pdf(data):
+    """
+    Decompress streams of a PDF document, without external tools.
+
+    Objects are read in order, FlateDecode streams are inflated and objects
+    from object streams are extracted, then the document is written again
+    with a new cross-reference table.
+
+    :returns: the new document, and False if some streams could not be
+              decompressed (other filters, predictors) or if objects don't
+              end as expected
+    :rtype: tuple[:class:`bytes`, :class:`bool`]
+    :raises: :class:`ValueError` if the document can't be read
+    """
+    if not PDF_VERSION_RE.match(data):
+        raise ValueError('not a PDF document')
+
+    objects = {}
+    trailer = {}
+    complete = True
+    pos = 0
+    while True:
+        m = PDF_OBJ_RE.search(data, pos)
+        if not m:
+            break
+        num, gen = int(m.group(1)), int(m.group(2))
+        start = m.end()
+
+        end = _find_body_end(data, start)
+        if end is None:
+            raise ValueError('object %d is not terminated' % num)
+        if end.group(0) == b'endobj':
+            body = data[start:end.start()].strip()
+            if PDF_OBJ_RE.search(body):
+                # Not terminated, or a keyword has been missed: objects
+                # would be lost.
+                complete = False
+            objects[num] = (gen, body, None)
+            pos = end.end()
+            continue
+
+        stream_dict = data[start:end.start() + 2].strip()
+        stream_start = end.end()
+        length = PDF_LENGTH_RE.search(stream_dict)
+        stream_end = None
+        if length and b'R' not in length.group(1):
+            stream_end = stream_start + int(length.group(1))
+            if not PDF_ENDSTREAM_RE.match(data, stream_end):
+                stream_end = None
+        if stream_end is None:
+            endstream = PDF_ENDSTREAM_RE.search(data, stream_start)
+            if endstream is None:
+                raise ValueError('stream of object %d is not terminated' % num)
+            stream_end = endstream.start()
+        stream_data = data[stream_start:stream_end]
+        pos = PDF_ENDSTREAM_RE.match(data, stream_end).end()
+        if not PDF_ENDOBJ_RE.match(data, pos):
+            complete = False
+
+        if b'/Encrypt' in stream_dict:
+            raise ValueError('encrypted documents are not supported')
+
+        if re.search(br'/Type\s*/XRef\b', stream_dict):
+            # Replaced by the new cross-reference table.
+            trailer.update(_trailer_keys(stream_dict))
+            continue
+
+        inflated = _inflate_stream(stream_dict, stream_data)
+        if inflated is None:
+            complete = False
+            objects[num] = (gen, stream_dict, stream_data)
+            continue
+        stream_dict, stream_data = inflated
+
+        if re.search(br'/Type\s*/ObjStm\b', stream_dict):
+            for objnum, body in _iter_objstm(stream_dict, stream_data):
+                objects[objnum] = (0, body, None)
+            continue
+
+        objects[num] = (gen, _set_stream_length(stream_dict, len(stream_data)), stream_data)
+
+    for m in re.finditer(br'trailer\s*(<<.*?>>)\s*startxref', data, re.DOTALL):
+        if b'/Encrypt' in m.group(1):
+            raise ValueError('encrypted documents are not supported')
+        trailer.update(_trailer_keys(m.group(1)))
+
+    if not objects or 'Root' not in trailer:
+        raise ValueError('no objects or root found')
+
+    version = PDF_VERSION_RE.match(data).group(0)
+    out = [version + b'\n%\xe2\xe3\xcf\xd3\n']
+    size = len(out[0])
+    offsets = {}
+    for num in sorted(objects):
+        gen, body, stream_data = objects[num]
+        if stream_data is None:
+            chunk = b'%d %d obj\n%s\nendobj\n' % (num, gen, body)
+        else:
+            chunk = b'%d %d obj\n%s\nstream\n%s\nendstream\nendobj\n' % (num, gen, body, stream_data)
+        offsets[num] = (size, gen)
+        out.append(chunk)
+        size += len(chunk)
+
+    count = max(offsets) + 1
+    out.append(b'xref\n0 %d\n' % count)
+    for num in range(count):
+        if num in offsets:
+            out.append(b'%010d %05d n \n' % offsets[num])
+        else:
+            out.append(b'0000000000 65535 f \n')
+
+    keys = b''.join(b'/%s %s' % (key.encode('ascii'), trailer[key]) for key in ('Root', 'Info', 'ID') if key in trailer)
+    out.append(b'trailer\n<</Size %d%s>>\nstartxref\n%d\n%%%%EOF\n' % (count, keys, size))
+    return b''.join(out), complete
+
+
+def _trailer_keys(trailer_dict):
+    keys = {}
+    for root_info, ref, id_key, id_value in PDF_TRAILER_KEYS_RE.findall(trailer_dict):
+        if root_info:
+            keys[root_info.decode('ascii')] = ref
+        else:
+            keys[id_key.decode('ascii')] = id_value
+    return keys
+
+
 Rect = namedtuple('Rect', ('x0', 'y0', 'x1', 'y1'))
 TextRect = namedtuple('TextRect', ('x0', 'y0', 'x1', 'y1', 'text'))
 
@@ -131,6 +391,9 @@ def angle(r):
     return ANGLE_OTHER
 
 
+_MISSING = object()
+
+
 class ApproxVecDict(dict):
     # since coords are never strictly equal, search coords around
     # store vectors and points
@@ -139,10 +402,9 @@ class ApproxVecDict(dict):
         x, y = coords
         for i in (0, -1, 1):
             for j in (0, -1, 1):
-                try:
-                    return super(ApproxVecDict, self).__getitem__((x+i, y+j))
-                except KeyError:
-                    pass
+                value = dict.get(self, (x+i, y+j), _MISSING)
+                if value is not _MISSING:
+                    return value
         raise KeyError()
 
     def get(self, k, v=None):
@@ -154,23 +416,38 @@ class ApproxVecDict(dict):
 
 class ApproxRectDict(dict):
     # like ApproxVecDict, but store rects
+    # rects are also indexed by their top-left point, so that only points
+    # having rects are probed for the other corner
+
+    def __init__(self, *args, **kwargs):
+        super(ApproxRectDict, self).__init__(*args, **kwargs)
+        self.origins = {}
+        for key in self:
+            self.origins.setdefault(key[:2], set()).add(key)
+
+    def __setitem__(self, coords, value):
+        super(ApproxRectDict, self).__setitem__(coords, value)
+        self.origins.setdefault(tuple(coords[:2]), set()).add(tuple(coords))
+
     def __getitem__(self, coords):
         x0, y0, x1, y1 = coords
 
         for i in (0, -1, 1):
             for j in (0, -1, 1):
                 if x0 == x1:
+                    keys = self.origins.get((x0+i, y0+j))
+                    if not keys:
+                        continue
                     for j2 in (0, -1, 1):
-                        try:
+                        if (x0+i, y0+j, x0+i, y1+j2) in keys:
                             return super(ApproxRectDict, self).__getitem__((x0+i, y0+j, x0+i, y1+j2))
-                        except KeyError:
-                            pass
                 elif y0 == y1:
+                    keys = self.origins.get((x0+i, y0+j))
+                    if not keys:
+                        continue
                     for i2 in (0, -1, 1):
-                        try:
+                        if (x0+i, y0+j, x1+i2, y0+j) in keys:
                             return super(ApproxRectDict, self).__getitem__((x0+i, y0+j, x1+i2, y0+j))
-                        except KeyError:
-                            pass
                 else:
                     return super(ApproxRectDict, self).__getitem__((x0, y0, x1, y1))
 
@@ -259,31 +536,66 @@ def find_in_table(rows, rect):
                 return i, j
 
 
+class TableIndex(object):
+    """
+    Spatial index of the rows built by :func:`build_rows`, to find the box
+    containing a text.
+
+    Rows are registered in cells of a grid along the y axis, and boxes of a
+    row are sorted by x0. :meth:`find` gives the same result as
+    :func:`find_in_table`, without scanning all rows.
+
+    :param rows: rows of boxes, sorted by y0, each one sorted by x0
+    :type rows: list[list[:class:`Rect`]]
+    """
+
+    CELL_SIZE = 16
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.grid = {}
+        self.x0s = []
+        for j, row in enumerate(rows):
+            self.x0s.append([box.x0 for box in row])
+            # with approximate comparisons, a row contains rects whose y0
+            # is in ]row.y0 - 2, row.y1 + 2[
+            first = int((row[0].y0 - 2) // self.CELL_SIZE)
+            last = int((row[0].y1 + 2) // self.CELL_SIZE)
+            for cell in range(first, last + 1):
+                self.grid.setdefault(cell, []).append(j)
+
+    def find(self, rect):
+        """
+        Get the position (column, row) of the box containing a rect, or None.
+        """
+        for j in self.grid.get(int(rect.y0 // self.CELL_SIZE), ()):
+            row = self.rows[j]
+            if not (ApproxFloat(row[0].y0) <= rect.y0 and ApproxFloat(row[0].y1) >= rect.y1):
+                continue
+
+            # only boxes starting before the rect can contain it
+            end = bisect_right(self.x0s[j], rect.x0 + 2)
+            for i in range(end):
+                box = row[i]
+                if ApproxFloat(box.x0) <= rect.x0 and ApproxFloat(box.x1) >= rect.x1:
+                    return i, j
+
+
 def arrange_texts_in_rows(rows, trects):
     table = [[[] for _ in row] for row in rows]
+    index = TableIndex(rows)
 
     for trect in trects:
-        pos = find_in_table(rows, trect)
+        pos = index.find(trect)
         if not pos:
             continue
         table[pos[1]][pos[0]].append(trect.text)
     return table
 
 
-def get_pdf_rows(data, miner_layout=True):
+def _iter_pdf_pages(data):
     """
-    Takes PDF file content as string and yield table row data for each page.
-
-    For each page in the PDF, the function yields a list of rows.
-    Each row is a list of cells. Each cell is a list of strings present in the cell.
-    Note that the rows may belong to different tables.
-
-    There are no logic tables in PDF format, so this parses PDF drawing instructions
-    and tries to find rectangles and arrange them in rows, then arrange text in
-    the rectangles.
-
-    External dependencies:
-    PDFMiner (http://www.unixuser.org/~euske/python/pdfminer/index.html).
+    Yield PDFMiner pages of a PDF document.
     """
 
     try:
@@ -298,9 +610,6 @@ def get_pdf_rows(data, miner_layout=True):
     except ImportError:
         from pdfminer.pdfparser import PDFDocument
         newapi = False
-    from pdfminer.converter import PDFPageAggregator
-    from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-    from pdfminer.layout import LAParams, LTRect, LTTextBox, LTTextLine, LTLine, LTChar
 
     parser = PDFParser(BytesIO(data))
     try:
@@ -313,6 +622,24 @@ def get_pdf_rows(data, miner_layout=True):
     except PDFSyntaxError:
         return
 
+    if newapi:
+        pages = PDFPage.get_pages(BytesIO(data), check_extractable=True)
+    else:
+        doc.initialize()
+        pages = doc.get_pages()
+
+    for page in pages:
+        yield page
+
+
+def _iter_pdf_rows(data, miner_layout=True, pagenos=None):
+    try:
+        from pdfminer.converter import PDFPageAggregator
+    except ImportError:
+        raise ImportError('Please install python-pdfminer')
+    from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+    from pdfminer.layout import LAParams, LTRect, LTTextBox, LTTextLine, LTLine, LTChar
+
     rsrcmgr = PDFResourceManager()
     if miner_layout:
         device = PDFPageAggregator(rsrcmgr, laparams=LAParams())
@@ -320,17 +647,16 @@ def get_pdf_rows(data, miner_layout=True):
         device = PDFPageAggregator(rsrcmgr)
 
     interpreter = PDFPageInterpreter(rsrcmgr, device)
-    if newapi:
-        pages = PDFPage.get_pages(BytesIO(data), check_extractable=True)
-    else:
-        doc.initialize()
-        pages = doc.get_pages()
 
-    for npage, page in enumerate(pages):
+    for npage, page in enumerate(_iter_pdf_pages(data)):
+        if pagenos is not None and npage not in pagenos:
+            continue
+
         interpreter.process_page(page)
         page_layout = device.get_result()
 
-        texts = sum([list(lttext_to_multilines(obj, page_layout)) for obj in page_layout._objs if isinstance(obj, (LTTextBox, LTTextLine, LTChar))], [])
+        texts = [trect for obj in page_layout._objs if isinstance(obj, (LTTextBox, LTTextLine, LTChar))
+                 for trect in lttext_to_multilines(obj, page_layout)]
         if not miner_layout:
             texts.sort(key=lambda t: (t.y0, t.x0))
 
@@ -341,3 +667,53 @@ def get_pdf_rows(data, miner_layout=True):
 
         yield textrows
     device.close()
+
+
+def _get_pdf_pages_rows(data, miner_layout, pagenos):
+    # run in a worker process by get_pdf_rows()
+    return list(_iter_pdf_rows(data, miner_layout, set(pagenos)))
+
+
+def get_pdf_rows(data, miner_layout=True, max_workers=1, pages_per_task=8):
+    """
+    Takes PDF file content as string and yield table row data for each page.
+
+    For each page in the PDF, the function yields a list of rows.
+    Each row is a list of cells. Each cell is a list of strings present in the cell.
+    Note that the rows may belong to different tables.
+
+    There are no logic tables in PDF format, so this parses PDF drawing instructions
+    and tries to find rectangles and arrange them in rows, then arrange text in
+    the rectangles.
+
+    Large documents can be processed by a pool of *max_workers* processes,
+    each one handling *pages_per_task* pages at a time. Pages are still
+    yielded in order.
+
+    External dependencies:
+    PDFMiner (http://www.unixuser.org/~euske/python/pdfminer/index.html).
+    """
+
+    if max_workers <= 1 or ProcessPoolExecutor is None:
+        for textrows in _iter_pdf_rows(data, miner_layout):
+            yield textrows
+        return
+
+    npages = sum(1 for _ in _iter_pdf_pages(data))
+    if npages <= pages_per_task:
+        for textrows in _iter_pdf_rows(data, miner_layout):
+            yield textrows
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_get_pdf_pages_rows, data, miner_layout,
+                                   range(start, min(start + pages_per_task, npages)))
+                   for start in range(0, npages, pages_per_task)]
+        try:
+            for future in futures:
+                for textrows in future.result():
+                    yield textrows
+        finally:
+            # if the generator is not consumed until the end
+            for future in futures:
+                future.cancel()
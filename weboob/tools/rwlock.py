@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+from threading import Condition, Lock, current_thread
+
+
+__all__ = ['RWLock']
+
+
+class RWLock(object):
+    """
+    Reentrant readers/writer lock.
+
+    The exclusive lock is acquired with :meth:`acquire` and :meth:`release`
+    (or as a context manager), like a :class:`threading.RLock`. The shared
+    lock is acquired with :meth:`acquire_shared` and :meth:`release_shared`
+    (or with the :meth:`shared` context manager).
+
+    Several threads can hold the shared lock at the same time, but nobody
+    can hold it while a thread holds the exclusive lock. Threads waiting for
+    the exclusive lock have priority over new readers.
+
+    A thread holding the exclusive lock can take the shared one, but a thread
+    holding only the shared lock can't take the exclusive one, as it could
+    deadlock with another reader doing the same.
+    """
+
+    def __init__(self):
+        self.cond = Condition(Lock())
+        self.writer = None
+        self.writer_count = 0
+        self.waiting_writers = 0
+        self.readers = {}
+
+    def acquire(self):
+        me = current_thread()
+        with self.cond:
+            if self.writer is me:
+                self.writer_count += 1
+                return True
+
+            if me in self.readers:
+                raise RuntimeError('Unable to upgrade a shared lock to an exclusive lock')
+
+            self.waiting_writers += 1
+            try:
+                while self.writer is not None or self.readers:
+                    self.cond.wait()
+            finally:
+                self.waiting_writers -= 1
+
+            self.writer = me
+            self.writer_count = 1
+            return True
+
+    def release(self):
+        with self.cond:
+            if self.writer is not current_thread():
+                raise RuntimeError('Cannot release an exclusive lock which is not owned')
+
+            self.writer_count -= 1
+            if self.writer_count == 0:
+                self.writer = None
+                self.cond.notify_all()
+
+    def acquire_shared(self):
+        me = current_thread()
+        with self.cond:
+            if self.writer is not me and me not in self.readers:
+                while self.writer is not None or self.waiting_writers:
+                    self.cond.wait()
+            self.readers[me] = self.readers.get(me, 0) + 1
+            return True
+
+    def release_shared(self):
+        me = current_thread()
+        with self.cond:
+            if me not in self.readers:
+                raise RuntimeError('Cannot release a shared lock which is not owned')
+
+            self.readers[me] -= 1
+            if self.readers[me] == 0:
+                del self.readers[me]
+                if not self.readers:
+                    self.cond.notify_all()
+
+    def is_shared_owned(self):
+        """
+        Return True if the current thread holds the shared lock.
+        """
+        with self.cond:
+            return current_thread() in self.readers
+
+    @contextmanager
+    def shared(self):
+        self.acquire_shared()
+        try:
+            yield self
+        finally:
+            self.release_shared()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, t, v, tb):
+        self.release()
@@ -18,9 +18,25 @@
 # along with weboob. If not, see <http://www.gnu.org/licenses/>.
 
 
+from contextlib import contextmanager
 from copy import deepcopy
+import os
+import shutil
+import tempfile
+from threading import RLock
+try:
+    from urllib.parse import quote, unquote
+except ImportError:
+    from urllib import quote, unquote
 
-from .config.yamlconfig import YamlConfig
+import yaml
+
+from .compat import unicode
+
+from .config.yamlconfig import YamlConfig, WeboobDumper, Loader
+
+
+__all__ = ['IStorage', 'StandardStorage', 'ShardedStorage']
 
 
 class IStorage(object):
@@ -54,11 +70,28 @@ class IStorage(object):
         """
         raise NotImplementedError()
 
+    @contextmanager
+    def batch(self):
+        """
+        Context manager in which changes saved with :meth:`save` may only be
+        written on the disk at the end, at once.
+        """
+        yield
+
 
 class StandardStorage(IStorage):
+    """
+    Storage of all data in a single YAML file.
+
+    Each call to :meth:`save` writes the whole file again, except in
+    :meth:`batch`.
+    """
+
     def __init__(self, path):
         self.config = YamlConfig(path)
         self.config.load()
+        self.batches = 0
+        self.dirty = False
 
     def load(self, what, name, default={}):
         d = {}
@@ -71,7 +104,10 @@ class StandardStorage(IStorage):
         self.config.values[what][name].update(d)
 
     def save(self, what, name):
-        self.config.save()
+        if self.batches:
+            self.dirty = True
+        else:
+            self.config.save()
 
     def set(self, what, name, *args):
         self.config.set(what, name, *args)
@@ -81,3 +117,193 @@ class StandardStorage(IStorage):
 
     def get(self, what, name, *args, **kwargs):
         return self.config.get(what, name, *args, **kwargs)
+
+    @contextmanager
+    def batch(self):
+        self.batches += 1
+        try:
+            yield
+        finally:
+            self.batches -= 1
+            if not self.batches and self.dirty:
+                self.dirty = False
+                self.config.save()
+
+
+class ShardedStorage(IStorage):
+    """
+    Storage of data in a YAML file per entry (for example, per backend), in
+    the directory ``path + '.d'``.
+
+    Only entries which are used are read, and :meth:`save` only writes the
+    entry if it has changed since it was read or written. In
+    :meth:`batch`, entries are written at the end.
+
+    If the directory doesn't exist but the file *path* of a
+    :class:`StandardStorage` does, its entries are copied in the directory
+    first. The file isn't changed afterwards.
+
+    :param path: path of the storage, without ``.d``
+    :type path: :class:`str`
+    """
+
+    SUFFIX = '.d'
+    EXTENSION = '.yaml'
+
+    def __init__(self, path):
+        self.path = path
+        self.dirname = path + self.SUFFIX
+        self.lock = RLock()
+        # (what, name) -> values of the entry
+        self.values = {}
+        # (what, name) -> YAML last read or written, None if there is no file
+        self.written = {}
+        self.pending = set()
+        self.batches = 0
+
+        if not os.path.isdir(self.dirname):
+            self._create()
+
+    def _create(self):
+        """
+        Create the directory, with entries of the legacy storage if it exists.
+        """
+        legacy = {}
+        if os.path.isfile(self.path):
+            with open(self.path) as f:
+                legacy = yaml.load(f, Loader=Loader) or {}
+
+        parent = os.path.dirname(os.path.abspath(self.dirname))
+        tmpdir = tempfile.mkdtemp(dir=parent, prefix='.%s.' % os.path.basename(self.dirname))
+        try:
+            for what, names in legacy.items():
+                if not isinstance(names, dict):
+                    continue
+                os.mkdir(os.path.join(tmpdir, self._quote(what)))
+                for name, values in names.items():
+                    with open(os.path.join(tmpdir, self._quote(what), self._quote(name) + self.EXTENSION), 'w') as f:
+                        f.write(self._dump(values))
+            os.rename(tmpdir, self.dirname)
+        except OSError:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            # Created by another process in the meantime?
+            if not os.path.isdir(self.dirname):
+                raise
+
+    @staticmethod
+    def _quote(name):
+        if not isinstance(name, (str, bytes)):
+            name = unicode(name).encode('utf-8')
+        return quote(name, safe='')
+
+    @staticmethod
+    def _dump(values):
+        return yaml.dump(values, Dumper=WeboobDumper, default_flow_style=False)
+
+    def _get_path(self, key):
+        what, name = key
+        return os.path.join(self.dirname, self._quote(what), self._quote(name) + self.EXTENSION)
+
+    def _entry(self, key):
+        """
+        Get values of an entry, read from the disk if needed.
+        """
+        try:
+            return self.values[key]
+        except KeyError:
+            pass
+
+        try:
+            with open(self._get_path(key)) as f:
+                data = f.read()
+        except IOError:
+            values = self.written[key] = None
+        else:
+            self.written[key] = data
+            values = yaml.load(data, Loader=Loader)
+
+        if values is None:
+            values = {}
+        self.values[key] = values
+        return values
+
+    def _write(self, key):
+        path = self._get_path(key)
+        values = self.values.get(key)
+        if not values:
+            # Empty or deleted entry.
+            if self.written.get(key) is not None and os.path.exists(path):
+                os.remove(path)
+            self.written[key] = None
+            return
+
+        data = self._dump(values)
+        if data == self.written.get(key):
+            return
+
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        # write in a temporary file to avoid corruption problems
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+            f.write(data.encode('utf-8') if not isinstance(data, bytes) else data)
+        if os.path.isfile(path):
+            os.remove(path)
+        os.rename(f.name, path)
+        self.written[key] = data
+
+    def load(self, what, name, default={}):
+        with self.lock:
+            d = self._entry((what, name))
+            values = deepcopy(default)
+            values.update(d)
+            self.values[(what, name)] = values
+
+    def save(self, what, name):
+        with self.lock:
+            if self.batches:
+                self.pending.add((what, name))
+            else:
+                self._write((what, name))
+
+    def set(self, what, name, *args):
+        with self.lock:
+            if len(args) == 1:
+                self.values[(what, name)] = args[0]
+                return
+            config = YamlConfig(None)
+            config.values = self._entry((what, name))
+            config.set(*args)
+
+    def delete(self, what, name, *args):
+        with self.lock:
+            if not args:
+                # The file is removed by save().
+                self._entry((what, name))
+                self.values[(what, name)] = {}
+                return
+            config = YamlConfig(None)
+            config.values = self._entry((what, name))
+            config.delete(*args)
+
+    def get(self, what, name, *args, **kwargs):
+        with self.lock:
+            values = self._entry((what, name))
+            if not args:
+                return values
+            config = YamlConfig(None)
+            config.values = values
+            return config.get(*args, **kwargs)
+
+    @contextmanager
+    def batch(self):
+        with self.lock:
+            self.batches += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.batches -= 1
+                if not self.batches:
+                    pending, self.pending = self.pending, set()
+                    for key in sorted(pending):
+                        self._write(key)
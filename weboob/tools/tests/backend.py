@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from threading import Event, Lock, Thread
+from unittest import TestCase
+
+from weboob.core.bcall import BackendsCall, CallErrors
+from weboob.core.ouiboube import WebNip
+from weboob.tools.backend import Module
+
+
+class MyBrowser(object):
+    built = 0
+    lock = Lock()
+    # When set, building a browser waits for it.
+    unblock = None
+
+    def __init__(self, *args, **kwargs):
+        if self.unblock is not None:
+            self.unblock.wait(10)
+        with self.lock:
+            MyBrowser.built += 1
+            self.number = MyBrowser.built
+        self.session = type('Session', (), {})()
+        self.session.cookies = {}
+        self.deinited = False
+
+    def deinit(self):
+        self.deinited = True
+
+
+class MyModule(Module):
+    NAME = 'mymodule'
+    BROWSER = MyBrowser
+    BROWSER_POOL_SIZE = 2
+    CONCURRENT_CALLS = ('iter_concurrent',)
+
+    def __init__(self, *args, **kwargs):
+        super(MyModule, self).__init__(*args, **kwargs)
+        self.active = 0
+        self.max_active = 0
+        self.counter_lock = Lock()
+        self.release = Event()
+
+    def _run(self):
+        with self.counter_lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        self.release.wait(10)
+        with self.counter_lock:
+            self.active -= 1
+        return self.browser
+
+    def iter_concurrent(self):
+        yield self._run()
+
+    def iter_exclusive(self):
+        yield self._run()
+
+
+class BrokenModule(MyModule):
+    def is_concurrent_call(self, function):
+        raise ValueError('broken')
+
+
+class BrowserPoolTest(TestCase):
+    def setUp(self):
+        self.weboob = WebNip(modules_path=False)
+        self.backend = MyModule(self.weboob, 'backend')
+
+    def tearDown(self):
+        self.backend.release.set()
+        self.weboob.deinit()
+
+    def test_checkout(self):
+        pool = self.backend.browser_pool
+        browser1 = pool.acquire()
+        browser2 = pool.acquire()
+        self.assertIsNot(browser1, browser2)
+        # Pool browsers share cookies of the default browser.
+        self.assertIs(browser1.session.cookies, self.backend.browser.session.cookies)
+        self.assertIsNot(browser1, self.backend.browser)
+
+        # The pool is full, so the next one waits for a browser to be returned.
+        got = []
+        thread = Thread(target=lambda: got.append(pool.acquire()))
+        thread.start()
+        thread.join(0.05)
+        self.assertEqual(got, [])
+        pool.release(browser2)
+        thread.join(10)
+        self.assertEqual(got, [browser2])
+
+        pool.release(browser1)
+        self.assertIs(pool.acquire(), browser1)
+        self.assertEqual(len(pool.browsers), 2)
+
+    def test_slow_build(self):
+        pool = self.backend.browser_pool
+        MyBrowser.unblock = Event()
+        try:
+            # The default browser is built by the first pool browser.
+            thread = Thread(target=pool.acquire)
+            thread.start()
+            thread.join(0.05)
+            self.assertTrue(thread.is_alive())
+
+            # Other threads can return their browsers meanwhile.
+            other = MyBrowser.__new__(MyBrowser)
+            returner = Thread(target=pool.release, args=(other,))
+            returner.start()
+            returner.join(5)
+            self.assertFalse(returner.is_alive())
+        finally:
+            MyBrowser.unblock.set()
+            MyBrowser.unblock = None
+        thread.join(10)
+        self.assertIn(other, pool.free)
+
+    def test_concurrent_call(self):
+        browsers = []
+
+        def run():
+            with self.backend.concurrent_call():
+                browsers.append(self.backend.browser)
+                self.backend.release.wait(10)
+
+        threads = [Thread(target=run) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for _ in range(1000):
+            if len(browsers) == 2:
+                break
+            Event().wait(0.001)
+        self.assertEqual(len(browsers), 2)
+        self.assertIsNot(browsers[0], browsers[1])
+        self.backend.release.set()
+        for thread in threads:
+            thread.join(10)
+
+        # Browsers are back in the pool, and the default one is used again.
+        self.assertEqual(sorted(self.backend.browser_pool.free, key=id), sorted(browsers, key=id))
+        self.assertNotIn(self.backend.browser, browsers)
+
+    def test_calls(self):
+        call = BackendsCall([self.backend] * 2, 'iter_concurrent')
+        for _ in range(1000):
+            if self.backend.max_active == 2:
+                break
+            Event().wait(0.001)
+        self.backend.release.set()
+        results = list(call)
+        self.assertEqual(self.backend.max_active, 2)
+        self.assertIsNot(results[0], results[1])
+
+        self.backend.release.clear()
+        self.backend.max_active = 0
+        call = BackendsCall([self.backend] * 2, 'iter_exclusive')
+        Event().wait(0.05)
+        self.backend.release.set()
+        results = list(call)
+        self.assertEqual(self.backend.max_active, 1)
+        self.assertIs(results[0], results[1])
+
+    def test_deinit(self):
+        pool = self.backend.browser_pool
+        browser = pool.acquire()
+        pool.release(browser)
+        self.backend.deinit()
+        self.assertTrue(browser.deinited)
+        self.assertEqual(pool.browsers, [])
+
+    def test_lock_error(self):
+        backend = BrokenModule(self.weboob, 'broken')
+        call = BackendsCall([backend, self.backend], 'iter_concurrent')
+        self.backend.release.set()
+        # The failure is reported instead of leaving the call unfinished.
+        self.assertTrue(call.finished_event.wait(10))
+        with self.assertRaises(CallErrors) as cm:
+            list(call)
+        (failed, error, backtrace), = cm.exception.errors
+        self.assertIs(failed, backend)
+        self.assertIsInstance(error, ValueError)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import re
+import sys
+from unittest import TestCase
+
+from weboob.tools.pdf import inflate_pdf
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, os.pardir, 'tools', 'benchmarks'))
+from pdf_decompress import build_statement, stream  # noqa
+
+
+def update(data, objects, trailer=b''):
+    """
+    Append an incremental update with *objects* (number → body) to a document.
+    """
+    out = [data]
+    for num, body in sorted(objects.items()):
+        out.append(b'%d 0 obj\n%s\nendobj\n' % (num, body))
+    # Offsets don't matter to inflate_pdf().
+    out.append(b'xref\n0 1\n0000000000 65535 f \ntrailer\n<< /Size 100 /Root 1 0 R%s >>\nstartxref\n0\n%%%%EOF\n' % trailer)
+    return b''.join(out)
+
+
+class InflatePDFTest(TestCase):
+    def check(self, data, complete=True):
+        out, is_complete = inflate_pdf(data)
+        self.assertEqual(is_complete, complete)
+
+        # Every object is at the offset given by the cross-reference table.
+        m = re.search(br'xref\n0 (\d+)\n', out)
+        entries = re.findall(br'(\d{10}) (\d{5}) ([nf]) \n', out[m.end():])
+        self.assertEqual(len(entries), int(m.group(1)))
+        objects = {}
+        for num, (offset, gen, kind) in enumerate(entries):
+            if kind == b'n':
+                obj = re.match(br'(\d+) (\d+) obj\n(.*?)\nendobj\n', out[int(offset):], re.DOTALL)
+                self.assertEqual(int(obj.group(1)), num)
+                objects[num] = obj.group(3)
+        self.assertIn(b'/Root 1 0 R', out[m.end():])
+        start = int(re.search(br'startxref\n(\d+)\n%%EOF\n$', out).group(1))
+        self.assertEqual(out[start:m.end()], m.group(0))
+        return objects
+
+    def test_plain(self):
+        objects = self.check(build_statement(2, 3, 2))
+        self.assertEqual(sorted(objects), list(range(1, 8)))
+        self.assertNotIn(b'/FlateDecode', b''.join(objects.values()))
+        self.assertIn(b'(page 1) Tj', objects[6])
+        m = re.match(br'<< /Length (\d+)\s*>>\nstream\n(.*)\nendstream$', objects[6], re.DOTALL)
+        self.assertEqual(int(m.group(1)), len(m.group(2)))
+
+    def test_objstm(self):
+        objects = self.check(build_statement(2, 3, 2, objstm=True))
+        # The object and cross-reference streams are replaced.
+        self.assertEqual(sorted(objects), list(range(1, 8)))
+        self.assertEqual(objects[1], b'<< /Type /Catalog /Pages 2 0 R >>')
+        self.assertIn(b'/Kids [5 0 R 7 0 R]', objects[2])
+        self.assertNotIn(b'/ObjStm', b''.join(objects.values()))
+        self.assertNotIn(b'/XRef', b''.join(objects.values()))
+
+    def test_not_inflated(self):
+        data = update(build_statement(1, 3, 2), {
+            5: stream(b'\x02' * 10, b' /DecodeParms << /Predictor 12 /Columns 4 >>'),
+            6: b'<< /Length 4 /Filter /DCTDecode >>\nstream\n\xff\xd8\xff\xd9\nendstream',
+        })
+        objects = self.check(data, complete=False)
+        # Kept as is.
+        self.assertIn(b'/Predictor 12', objects[5])
+        self.assertIn(b'/FlateDecode', objects[5])
+        self.assertIn(b'/DCTDecode', objects[6])
+        self.assertIn(b'\xff\xd8\xff\xd9', objects[6])
+        self.assertNotIn(b'/FlateDecode', objects[4])
+
+    def test_encrypted(self):
+        data = update(build_statement(1, 3, 2), {}, b' /Encrypt 10 0 R')
+        self.assertRaises(ValueError, inflate_pdf, data)
+        data = update(build_statement(1, 3, 2, objstm=True), {
+            10: stream(b'\x01\x00\x00\x00\x00\x00', b' /Type /XRef /W [1 4 1] /Root 1 0 R /Encrypt 9 0 R'),
+        })
+        self.assertRaises(ValueError, inflate_pdf, data)
+
+    def test_update(self):
+        data = update(build_statement(1, 3, 2), {
+            3: b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>',
+            6: b'<< /Title (statement) >>',
+        }, b' /Info 6 0 R')
+        objects = self.check(data)
+        self.assertEqual(sorted(objects), list(range(1, 7)))
+        self.assertEqual(objects[3], b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier >>')
+        self.assertIn(b'/Info 6 0 R', data)
+
+    def test_keywords_in_strings(self):
+        data = update(build_statement(1, 3, 2), {
+            1: b'<< /Type /Catalog /Pages 2 0 R /Title (Account stream summary \\) endobj) >>',
+            6: b'<< /Title (Statement \\(stream\\) endobj) % stream endobj\n/Author (a (nested) stream) >>',
+        }, b' /Info 6 0 R')
+        objects = self.check(data)
+        self.assertEqual(sorted(objects), list(range(1, 7)))
+        self.assertIn(b'(Account stream summary \\) endobj)', objects[1])
+        self.assertIn(b'/Author (a (nested) stream)', objects[6])
+        self.assertIn(b'(page 0) Tj', objects[4])
+        self.assertNotIn(b'/FlateDecode', b''.join(objects.values()))
+
+    def test_broken(self):
+        # Objects which don't end as expected are reported.
+        data = build_statement(1, 3, 2)
+        out, complete = inflate_pdf(data.replace(b'endobj\n2 0 obj', b'\n2 0 obj', 1))
+        self.assertFalse(complete)
+        out, complete = inflate_pdf(data.replace(b'endstream\nendobj', b'endstream\n', 1))
+        self.assertFalse(complete)
+        self.assertRaises(ValueError, inflate_pdf, b'%PDF-1.4\n1 0 obj\n<< /Title (unterminated >>\nendobj\n')
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, inflate_pdf, b'<html></html>')
+        self.assertRaises(ValueError, inflate_pdf, b'%PDF-1.4\n1 0 obj\n<< >>\n')
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from threading import Event, Lock, Thread
+from unittest import TestCase
+
+from weboob.tools.rwlock import RWLock
+
+
+class Holder(Thread):
+    """
+    Thread taking the lock until it is asked to release it.
+    """
+
+    def __init__(self, lock, shared, log, name):
+        super(Holder, self).__init__(name=name)
+        self.daemon = True
+        self.lock = lock
+        self.shared = shared
+        self.log = log
+        self.acquired = Event()
+        self.release = Event()
+
+    def run(self):
+        if self.shared:
+            self.lock.acquire_shared()
+        else:
+            self.lock.acquire()
+        self.log.append(self.name)
+        self.acquired.set()
+        self.release.wait(10)
+        if self.shared:
+            self.lock.release_shared()
+        else:
+            self.lock.release()
+
+
+class RWLockTest(TestCase):
+    def setUp(self):
+        self.lock = RWLock()
+        self.log = []
+        self.threads = []
+
+    def tearDown(self):
+        for thread in self.threads:
+            thread.release.set()
+            thread.join(10)
+
+    def start(self, name, shared):
+        thread = Holder(self.lock, shared, self.log, name)
+        self.threads.append(thread)
+        thread.start()
+        return thread
+
+    def test_shared(self):
+        reader1 = self.start('reader1', True)
+        reader2 = self.start('reader2', True)
+        self.assertTrue(reader1.acquired.wait(10))
+        self.assertTrue(reader2.acquired.wait(10))
+
+    def test_exclusive(self):
+        reader = self.start('reader', True)
+        self.assertTrue(reader.acquired.wait(10))
+
+        writer = self.start('writer', False)
+        self.assertFalse(writer.acquired.wait(0.05))
+
+        # Waiting writers have priority over new readers.
+        reader2 = self.start('reader2', True)
+        self.assertFalse(reader2.acquired.wait(0.05))
+
+        reader.release.set()
+        self.assertTrue(writer.acquired.wait(10))
+        self.assertFalse(reader2.acquired.wait(0.05))
+
+        writer.release.set()
+        self.assertTrue(reader2.acquired.wait(10))
+        self.assertEqual(self.log, ['reader', 'writer', 'reader2'])
+
+    def test_writers(self):
+        writer1 = self.start('writer1', False)
+        self.assertTrue(writer1.acquired.wait(10))
+        writer2 = self.start('writer2', False)
+        self.assertFalse(writer2.acquired.wait(0.05))
+        writer1.release.set()
+        self.assertTrue(writer2.acquired.wait(10))
+
+    def test_reentrant(self):
+        with self.lock:
+            with self.lock:
+                # The writer can take the shared lock.
+                with self.lock.shared():
+                    pass
+            writer = self.start('writer', False)
+            self.assertFalse(writer.acquired.wait(0.05))
+        self.assertTrue(writer.acquired.wait(10))
+        writer.release.set()
+        writer.join(10)
+
+        with self.lock.shared():
+            with self.lock.shared():
+                writer = self.start('writer2', False)
+                self.assertFalse(writer.acquired.wait(0.05))
+            self.assertFalse(writer.acquired.wait(0.05))
+        self.assertTrue(writer.acquired.wait(10))
+
+    def test_errors(self):
+        self.assertFalse(self.lock.is_shared_owned())
+        with self.lock.shared():
+            self.assertTrue(self.lock.is_shared_owned())
+            self.assertRaises(RuntimeError, self.lock.acquire)
+        self.assertFalse(self.lock.is_shared_owned())
+        self.assertRaises(RuntimeError, self.lock.release)
+        self.assertRaises(RuntimeError, self.lock.release_shared)
+
+        writer = self.start('writer', False)
+        self.assertTrue(writer.acquired.wait(10))
+        self.assertRaises(RuntimeError, self.lock.release)
+
+    def test_counter(self):
+        lock = Lock()
+        state = {'readers': 0, 'writers': 0, 'max_readers': 0, 'errors': 0}
+
+        def check():
+            if state['writers'] > 1 or (state['writers'] and state['readers']):
+                state['errors'] += 1
+
+        def reader():
+            for _ in range(200):
+                with self.lock.shared():
+                    with lock:
+                        state['readers'] += 1
+                        state['max_readers'] = max(state['max_readers'], state['readers'])
+                        check()
+                    Event().wait(0.0001)
+                    with lock:
+                        state['readers'] -= 1
+
+        def writer():
+            for _ in range(100):
+                with self.lock:
+                    with lock:
+                        state['writers'] += 1
+                        check()
+                    with lock:
+                        state['writers'] -= 1
+
+        threads = [Thread(target=reader) for _ in range(4)] + [Thread(target=writer) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(60)
+        self.assertEqual(state['errors'], 0)
+        self.assertEqual(state['readers'], 0)
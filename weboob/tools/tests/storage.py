@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import yaml
+
+from weboob.tools.config.iconfig import ConfigError
+from weboob.tools.storage import StandardStorage, ShardedStorage
+
+
+class ShardedStorageTest(TestCase):
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.path = os.path.join(self.dirname, 'storage')
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def entry_path(self, what, name):
+        return ShardedStorage(self.path)._get_path((what, name))
+
+    def read(self, what, name):
+        with open(self.entry_path(what, name)) as f:
+            return f.read()
+
+    def test_migration(self):
+        legacy = {'backends': {'foo': {'browser_state': {'cookies': 'a=b'}},
+                               u'caf\xe9': {'seen': [1, 2]}},
+                  'version': 1}
+        with open(self.path, 'w') as f:
+            yaml.safe_dump(legacy, f)
+        with open(self.path) as f:
+            content = f.read()
+
+        storage = ShardedStorage(self.path)
+        self.assertEqual(storage.get('backends', 'foo'), {'browser_state': {'cookies': 'a=b'}})
+        self.assertEqual(storage.get('backends', u'caf\xe9', 'seen'), [1, 2])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.path + '.d', 'backends'))),
+                         ['caf%C3%A9.yaml', 'foo.yaml'])
+        # Values which are not entries are ignored, and the legacy file is kept.
+        self.assertEqual(os.listdir(self.path + '.d'), ['backends'])
+        with open(self.path) as f:
+            self.assertEqual(f.read(), content)
+
+        # Not migrated again.
+        os.remove(self.entry_path('backends', 'foo'))
+        storage = ShardedStorage(self.path)
+        self.assertEqual(storage.get('backends', 'foo'), {})
+
+    def test_save(self):
+        storage = ShardedStorage(self.path)
+        storage.load('backends', 'foo', {'seen': []})
+        storage.set('backends', 'foo', 'seen', [1])
+        storage.save('backends', 'foo')
+        self.assertEqual(yaml.safe_load(self.read('backends', 'foo')), {'seen': [1]})
+
+        # Unchanged entries are not written again.
+        with open(self.entry_path('backends', 'foo'), 'a') as f:
+            f.write('# not written again\n')
+        storage.save('backends', 'foo')
+        self.assertIn('# not written again', self.read('backends', 'foo'))
+
+        storage.set('backends', 'foo', 'seen', [1, 2])
+        storage.save('backends', 'foo')
+        self.assertNotIn('# not written again', self.read('backends', 'foo'))
+
+        # Read by another instance.
+        storage = ShardedStorage(self.path)
+        storage.load('backends', 'foo', {'seen': [], 'other': 0})
+        self.assertEqual(storage.get('backends', 'foo'), {'seen': [1, 2], 'other': 0})
+
+    def test_batch(self):
+        storage = ShardedStorage(self.path)
+        with storage.batch():
+            for name in ('foo', 'bar'):
+                storage.set('backends', name, 'value', name)
+                storage.save('backends', name)
+            with storage.batch():
+                pass
+            self.assertFalse(os.path.exists(self.entry_path('backends', 'foo')))
+        self.assertEqual(yaml.safe_load(self.read('backends', 'foo')), {'value': 'foo'})
+        self.assertEqual(yaml.safe_load(self.read('backends', 'bar')), {'value': 'bar'})
+
+        # Saves are not deferred after an error in a batch.
+        try:
+            with storage.batch():
+                raise ValueError()
+        except ValueError:
+            pass
+        storage.set('backends', 'foo', 'value', 'baz')
+        storage.save('backends', 'foo')
+        self.assertEqual(yaml.safe_load(self.read('backends', 'foo')), {'value': 'baz'})
+
+    def test_delete(self):
+        storage = ShardedStorage(self.path)
+        storage.set('backends', 'foo', 'a', 'b', 1)
+        storage.set('backends', 'foo', 'c', 2)
+        storage.save('backends', 'foo')
+
+        storage.delete('backends', 'foo', 'a', 'b')
+        storage.save('backends', 'foo')
+        self.assertEqual(yaml.safe_load(self.read('backends', 'foo')), {'a': {}, 'c': 2})
+
+        storage.delete('backends', 'foo')
+        self.assertEqual(storage.get('backends', 'foo'), {})
+        self.assertTrue(os.path.exists(self.entry_path('backends', 'foo')))
+        storage.save('backends', 'foo')
+        self.assertFalse(os.path.exists(self.entry_path('backends', 'foo')))
+
+        # Deleting an entry which has never been written.
+        storage.delete('backends', 'bar')
+        storage.save('backends', 'bar')
+        self.assertFalse(os.path.exists(self.entry_path('backends', 'bar')))
+
+    def test_get(self):
+        storages = [StandardStorage(os.path.join(self.dirname, 'standard')), ShardedStorage(self.path)]
+        for storage in storages:
+            storage.load('backends', 'foo', {'a': {'b': 1}})
+
+        for args, kwargs in [(('a', 'b'), {}),
+                             (('a', 'c'), {}),
+                             (('a', 'c'), {'default': 2}),
+                             (('x', 'y'), {'default': 3}),
+                             (('x',), {}),
+                             ((), {}),
+                            ]:
+            results = [storage.get('backends', 'foo', *args, **kwargs) for storage in storages]
+            self.assertEqual(results[0], results[1], (args, kwargs))
+
+        for storage in storages:
+            self.assertRaises(ConfigError, storage.get, 'backends', 'foo', 'z', 'y')
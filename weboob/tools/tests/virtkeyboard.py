@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+# Copyright(C) 2017 Romain Bignon
+#
+# This file is part of weboob.
+#
+# weboob is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# weboob is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with weboob. If not, see <http://www.gnu.org/licenses/>.
+
+from io import BytesIO
+from random import Random
+from unittest import TestCase
+
+from PIL import Image
+
+from weboob.tools.captcha.virtkeyboard import VirtKeyboard, VirtKeyboardError
+
+
+WIDTH = 40
+HEIGHT = 30
+
+COORDS = {
+    'a': (0, 0, 9, 9),
+    'b': (10, 0, 19, 9),
+    'c': (20, 10, 29, 19),
+    # Empty.
+    'd': (10, 10, 19, 19),
+    # Across the right and bottom edges.
+    'e': (30, 20, 49, 39),
+    'f': (35, 0, 45, 9),
+    # Out of the image.
+    'g': (50, 50, 60, 60),
+}
+
+
+def make_image(mode, values, seed=0):
+    """
+    Make an image of *mode* with random pixels from *values*, except on the
+    empty key.
+    """
+    rng = Random(seed)
+    image = Image.new(mode, (WIDTH, HEIGHT))
+    if mode == 'P':
+        image.putpalette([0, 0, 0, 255, 255, 255, 10, 20, 30] + [0] * (253 * 3))
+    x1, y1, x2, y2 = COORDS['d']
+    image.putdata([values[0] if x1 <= x <= x2 and y1 <= y <= y2 else rng.choice(values)
+                   for y in range(HEIGHT) for x in range(WIDTH)])
+    data = BytesIO()
+    image.save(data, 'PNG')
+    data.seek(0)
+    return data
+
+
+class PixelKeyboard(VirtKeyboard):
+    # Same as VirtKeyboard.check_color(), but overridden, so pixels are
+    # compared one by one.
+    def check_color(self, pixel):
+        return pixel == self.color
+
+
+class VirtKeyboardTest(TestCase):
+    def check(self, mode, values, color, margin=None):
+        mask_class = type('MaskKeyboard', (VirtKeyboard,), {'margin': margin})
+        pixel_class = type('PixelKeyboard', (PixelKeyboard,), {'margin': margin})
+        for seed in range(3):
+            mask = mask_class(make_image(mode, values, seed), COORDS, color)
+            pixel = pixel_class(make_image(mode, values, seed), COORDS, color)
+            self.assertEqual(mask.image.mode, mode)
+            self.assertIsNotNone(mask.get_mask())
+            self.assertIsNone(pixel.get_mask())
+
+            self.assertEqual(mask.coords, pixel.coords)
+            self.assertEqual(mask.md5, pixel.md5)
+        return mask
+
+    def check_margins(self, mode, values, color):
+        for margin in (None, 1, (1, 3), (2, 0, 4, 1)):
+            keyboard = self.check(mode, values, color, margin)
+            self.assertEqual(sorted(keyboard.coords), ['a', 'b', 'c', 'e', 'f'])
+
+    def test_rgb(self):
+        self.check_margins('RGB', [(0, 0, 0), (255, 255, 255), (10, 20, 30), (10, 20, 31)], (10, 20, 30))
+
+    def test_l(self):
+        self.check_margins('L', [0, 127, 128, 255], 128)
+
+    def test_1(self):
+        self.check_margins('1', [0, 255], 255)
+
+    def test_p(self):
+        self.check_margins('P', [0, 1, 2], 2)
+
+    def test_wrong_color(self):
+        # Pixels of RGB images are tuples, so they are never equal to a list.
+        keyboard = self.check('RGB', [(0, 0, 0), (255, 255, 255)], [255, 255, 255])
+        self.assertEqual(keyboard.coords, {})
+
+    def test_symbol_code(self):
+        keyboard = VirtKeyboard(make_image('L', [0, 255]), COORDS, 255)
+        self.assertEqual(keyboard.get_symbol_code(keyboard.md5['a']), 'a')
+        self.assertEqual(keyboard.get_symbol_code(['unknown', keyboard.md5['b']]), 'b')
+        self.assertRaises(VirtKeyboardError, keyboard.get_symbol_code, 'unknown')
+
+        # Changes of hashes are taken into account.
+        keyboard.md5['z'] = 'new'
+        self.assertEqual(keyboard.get_symbol_code('new'), 'z')
+        del keyboard.md5['z']
+        self.assertRaises(VirtKeyboardError, keyboard.get_symbol_code, 'new')
+        keyboard.md5 = {'x': 'replaced', 'y': 'replaced'}
+        self.assertIn(keyboard.get_symbol_code('replaced'), ('x', 'y'))
+        self.assertRaises(VirtKeyboardError, keyboard.get_symbol_code, 'new')
+
+        # Hashes defined by a subclass.
+        class MyKeyboard(VirtKeyboard):
+            md5 = {'s': 'static'}
+
+        self.assertEqual(MyKeyboard().get_symbol_code('static'), 's')